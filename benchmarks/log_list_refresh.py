@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+Mede o custo de atualizar a lista de logs com muitos arquivos
+
+Cria um índice temporário com N arquivos e compara a lista virtualizada
+(LogListView.reload) com a abordagem anterior, que desmontava e montava um
+botão por arquivo a cada atualização.
+
+Uso: python benchmarks/log_list_refresh.py [N]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from textual.app import App
+from textual.containers import Container
+from textual.widgets import Button
+
+from src.log_index import LogIndex
+from src.ui import LogListView
+
+
+def build_index(log_root, count):
+    index = LogIndex(log_root)
+    start = datetime(2025, 1, 1)
+    rows = []
+    for i in range(count):
+        timestamp = start + timedelta(seconds=i)
+        rows.append((f"db{i % 4}/pg_queries_{timestamp:%Y%m%d_%H%M%S}.pgcap", f"db{i % 4}",
+                     "queries", timestamp.strftime("%Y-%m-%d %H:%M:%S"), i % 50, float(i % 300)))
+    with index._conn:
+        index._conn.executemany(
+            "INSERT INTO captures (path, target, kind, timestamp, sessions, peak_duration) "
+            "VALUES (?, ?, ?, ?, ?, ?)", rows)
+    return index
+
+
+class BenchApp(App):
+    def compose(self):
+        yield LogListView(id="virtual")
+        yield Container(id="buttons")
+
+
+async def measure(index, count, rounds=5):
+    app = BenchApp()
+    async with app.run_test(size=(120, 40)) as pilot:
+        view = app.query_one(LogListView)
+        view.index = index
+
+        t = time.perf_counter()
+        view.reload()
+        await pilot.pause()
+        first = time.perf_counter() - t
+
+        t = time.perf_counter()
+        for _ in range(rounds):
+            view.reload()
+            await pilot.pause()
+        virtual = (time.perf_counter() - t) / rounds
+
+        # Abordagem anterior: remove todos os botões e monta um por arquivo
+        container = app.query_one("#buttons")
+        paths = [row["path"] for row in index.recent(count)]
+        t = time.perf_counter()
+        await container.remove_children()
+        await container.mount_all(
+            Button(path, id=f"log-{i}") for i, path in enumerate(paths))
+        await pilot.pause()
+        buttons = time.perf_counter() - t
+
+    print(f"{count} arquivos no índice")
+    print(f"  lista virtualizada, primeira carga: {first * 1000:8.1f} ms")
+    print(f"  lista virtualizada, atualização:    {virtual * 1000:8.1f} ms")
+    print(f"  um botão por arquivo, atualização:  {buttons * 1000:8.1f} ms")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    with tempfile.TemporaryDirectory() as log_root:
+        index = build_index(log_root, count)
+        asyncio.run(measure(index, count))
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Compara o custo de início dos modos headless e com interface
+
+Para cada modo, em um processo novo: tempo de importação dos módulos de
+entrada e memória residente logo após a importação. Para o headless, mede
+também o tempo desde o início do processo até o evento "started" e a memória
+residente após alguns segundos de monitoramento.
+
+Uso: python benchmarks/startup.py [repetições]
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORTS = {
+    "headless": "import src.headless, src.engine, src.monitor, src.targets, src.postgresql",
+    "interface": "import src.ui",
+}
+
+PROBE = """
+import resource, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - started
+print(elapsed * 1000, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+"""
+
+
+def measure_imports(mode, rounds):
+    times, rss = [], []
+    for _ in range(rounds):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE.format(root=ROOT, statement=IMPORTS[mode])],
+            capture_output=True, text=True, check=True).stdout.split()
+        times.append(float(output[0]))
+        rss.append(float(output[1]))
+    return min(times), min(rss)
+
+
+def vm_rss(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def measure_headless(rounds, settle=3.0):
+    startups, rss = [], []
+    env = dict(os.environ, MONITOR_THRESHOLD="1000", PGPORT="1")
+    with tempfile.TemporaryDirectory() as workdir:
+        for _ in range(rounds):
+            started = time.perf_counter()
+            process = subprocess.Popen(
+                [sys.executable, os.path.join(ROOT, "main.py"), "--headless"],
+                cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+            process.stdout.readline()
+            startups.append((time.perf_counter() - started) * 1000)
+            time.sleep(settle)
+            rss.append(vm_rss(process.pid))
+            process.terminate()
+            process.wait()
+    return min(startups), max(rss)
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    # Aquece o cache de disco antes das medições
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+
+    for mode in IMPORTS:
+        import_ms, rss = measure_imports(mode, rounds)
+        print(f"{mode:10} importação: {import_ms:7.1f} ms   RSS após importar: {rss:6.1f} MB")
+
+    if sys.platform.startswith("linux"):
+        startup_ms, rss = measure_headless(rounds)
+        print(f"headless   até o evento 'started': {startup_ms:7.1f} ms   "
+              f"RSS monitorando: {rss:6.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
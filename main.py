@@ -14,7 +14,6 @@ Data: Abril 2025
 import sys
 import os
 import argparse
-from src.ui import MonitorApp
 from dotenv import load_dotenv
 
 
@@ -23,6 +22,11 @@ def main():
     # Carrega as variáveis de ambiente do arquivo .env
     load_dotenv()
 
+    # Análise offline dos logs: não conecta ao PostgreSQL nem abre a interface
+    if sys.argv[1:2] == ['analyze']:
+        from src.analyze import main as run_analyze
+        sys.exit(run_analyze(sys.argv[2:]))
+
     parser = argparse.ArgumentParser(
         description='Monitor de Load Average e Queries PostgreSQL'
     )
@@ -59,6 +63,27 @@ def main():
         help=f'Banco de dados do PostgreSQL (padrão: {os.environ.get("PGDATABASE", "postgres")})'
     )
 
+    parser.add_argument(
+        '-c', '--config',
+        default=os.environ.get('MONITOR_TARGETS_FILE'),
+        help='Arquivo INI com a lista de servidores para o modo multi-servidor '
+             '(substitui --host/--port/--user/--database)'
+    )
+
+    parser.add_argument(
+        '--headless',
+        action='store_true',
+        help='Executa sem interface (ex.: sob systemd), registrando os eventos '
+             'como linhas JSON na saída padrão'
+    )
+
+    parser.add_argument(
+        '-v', '--verbose',
+        action='store_true',
+        help='No modo headless, registra também os eventos periódicos '
+             '(sistema, histórico e custo das coletas)'
+    )
+
     args = parser.parse_args()
 
     # Atualiza as variáveis de ambiente para conexão com o PostgreSQL
@@ -67,6 +92,27 @@ def main():
     os.environ['PGUSER'] = args.user
     os.environ['PGDATABASE'] = args.database
 
+    # No modo multi-servidor valida o arquivo antes de abrir a interface
+    if args.config:
+        from src.targets import load_targets
+        try:
+            targets = load_targets(args.config)
+        except ValueError as e:
+            print(f"Erro na configuração de servidores: {e}")
+            sys.exit(1)
+        os.environ['MONITOR_TARGETS_FILE'] = os.path.abspath(args.config)
+        print(f"Monitorando {len(targets)} servidores de {args.config}",
+              file=sys.stderr if args.headless else sys.stdout)
+
+    # Regras de disparo inválidas impedem o início, como o arquivo de servidores
+    if os.environ.get('MONITOR_TRIGGERS'):
+        from src.triggers import parse_rules
+        try:
+            parse_rules(os.environ['MONITOR_TRIGGERS'])
+        except ValueError as e:
+            print(f"Erro em MONITOR_TRIGGERS: {e}")
+            sys.exit(1)
+
     # Define o valor de MONITOR_THRESHOLD para que outros módulos possam acessá-lo
     os.environ['MONITOR_THRESHOLD'] = str(args.threshold)
 
@@ -79,7 +125,14 @@ def main():
     # Cria o diretório de logs se não existir
     os.makedirs(os.path.join(os.getcwd(), "logs"), exist_ok=True)
 
+    # Sem interface, o Textual nem chega a ser importado
+    if args.headless:
+        from src.headless import main as run_headless
+        run_headless(args.threshold, verbose=args.verbose)
+        return
+
     # Inicia a aplicação
+    from src.ui import MonitorApp
     app = MonitorApp()
     app.run()
 
@@ -0,0 +1,451 @@
+#!/usr/bin/env python
+"""
+Análise offline de um diretório de capturas
+
+    python main.py analyze logs/ [--since 2025-01-01] [--until ...] [-j 8] [--json] [-o arquivo]
+
+Cada arquivo de captura (incidentes, capturas avulsas, históricos e
+arquivos diários) é lido em streaming por um processo de um pool e resumido
+em um agregado parcial: fingerprints (amostras, execuções, duração total e
+máxima, eventos de espera), usuários, bancos, eventos de espera, sessões por
+hora e distribuição da duração das execuções. Os agregados são combinados
+na ordem dos arquivos de cada servidor.
+
+Uma execução (pid, backend_start, query_start) que some de uma captura já
+terminou; a leitura de cada arquivo só mantém em memória as execuções ainda
+vivas, e o agregado de um arquivo leva as vivas na primeira e na última
+captura para que uma execução que atravessa dois arquivos seguidos seja
+contada uma vez. O CaptureReader também só guarda as sessões da captura
+atual, além da tabela de strings do arquivo. Assim a memória de cada
+processo não cresce com o número de capturas analisadas, só com o número de
+sessões simultâneas, de textos distintos em um arquivo e de fingerprints
+distintos.
+"""
+import argparse
+import json
+import os
+import sys
+from bisect import bisect_left
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+
+from src.capture_format import CaptureReader, is_capture_file
+from src.fingerprint import FingerprintStats, duration_seconds, fingerprint
+from src.log_index import file_kind, file_timestamp
+
+# Limites (segundos) das faixas de duração das execuções
+DURATION_BUCKETS = (1, 5, 10, 30, 60, 300, 900, 3600)
+# Itens de cada lista do relatório em texto
+REPORT_ITEMS = 10
+
+
+def duration_bucket(seconds):
+    """Rótulo da faixa de duração de uma execução"""
+    index = bisect_left(DURATION_BUCKETS, seconds)
+    if index == len(DURATION_BUCKETS):
+        return f">{DURATION_BUCKETS[-1]}s"
+    return f"<={DURATION_BUCKETS[index]}s"
+
+
+class Analysis:
+    def __init__(self):
+        """
+        Agregado de um ou mais arquivos de captura
+
+        Os agregados de arquivos diferentes são combinados com merge(); as
+        execuções vivas no início (head) e no fim (tail) de um arquivo
+        servem para descontar as que continuam no arquivo seguinte.
+        """
+        self.files = 0
+        self.captures = 0
+        self.sessions = 0
+        self.first = None
+        self.last = None
+        self.peak_load = 0.0
+        self.incidents = 0
+        self.errors = []
+        # fingerprint -> FingerprintStats
+        self.fingerprints = {}
+        # Usuário e banco -> [amostras, execuções, duração total]
+        self.users = {}
+        self.databases = {}
+        self.waits = Counter()
+        # Sessões amostradas e capturas por hora ("YYYY-MM-DD HH:00")
+        self.hours = Counter()
+        self.capture_hours = Counter()
+        # Execuções por faixa de duração (DURATION_BUCKETS)
+        self.durations = Counter()
+        # Chave da execução -> [fingerprint, usuário, banco, duração] (durante a
+        # leitura, seguidos do FingerprintStats e das entradas do usuário e do banco)
+        self.head = {}
+        self.tail = {}
+
+    def add_snapshot(self, timestamp, load_average, sessions, live):
+        """
+        Acrescenta uma captura reconstruída
+
+        Args:
+            timestamp: Momento da captura
+            load_average: Load average registrado
+            sessions: Sessões de CaptureReader.snapshots()
+            live: Execuções vivas na captura anterior do mesmo arquivo
+
+        Returns:
+            As execuções vivas nesta captura
+        """
+        self.captures += 1
+        moment = timestamp.isoformat()
+        self.first = min(self.first or moment, moment)
+        self.last = max(self.last or moment, moment)
+        if load_average:
+            self.peak_load = max(self.peak_load, load_average[0])
+        hour = timestamp.strftime("%Y-%m-%d %H:00")
+        self.capture_hours[hour] += 1
+
+        current = {}
+        self.sessions += len(sessions)
+        self.hours[hour] += len(sessions)
+        for session in sessions:
+            duration = duration_seconds(session.get("duration"))
+            key = (session.get("pid"), session.get("backend_start"), session.get("query_start"))
+            execution = live.get(key)
+            if execution is None:
+                # Execução nova: o fingerprint e as entradas do usuário e do banco
+                # ficam com ela para as capturas seguintes
+                digest, normalized = fingerprint(session.get("query") or "")
+                stats = self.fingerprints.get(digest)
+                if stats is None:
+                    stats = self.fingerprints[digest] = FingerprintStats(digest, normalized)
+                usename, datname = session.get("usename"), session.get("datname")
+                user = self.users.setdefault(usename, [0, 0, 0.0])
+                database = self.databases.setdefault(datname, [0, 0, 0.0])
+                execution = [digest, usename, datname, duration, stats, user, database]
+                stats.executions += 1
+                stats.total_duration += duration
+                user[1] += 1
+                user[2] += duration
+                database[1] += 1
+                database[2] += duration
+            else:
+                stats, user, database = execution[4:]
+                if duration > execution[3]:
+                    # Só o que a execução durou além da captura anterior
+                    extra = duration - execution[3]
+                    stats.total_duration += extra
+                    user[2] += extra
+                    database[2] += extra
+                    execution[3] = duration
+            current[key] = execution
+
+            stats.samples += 1
+            if duration > stats.max_duration:
+                stats.max_duration = duration
+            user[0] += 1
+            database[0] += 1
+            wait_type = session.get("wait_event_type")
+            wait = f"{wait_type}:{session.get('wait_event')}" if wait_type else "CPU"
+            stats.waits[wait] += 1
+            self.waits[wait] += 1
+
+        # As execuções que sumiram terminaram
+        for key, execution in live.items():
+            if key not in current:
+                self.durations[duration_bucket(execution[3])] += 1
+        return current
+
+    def discount(self, execution, duration):
+        """Desconta uma execução já contada em outro arquivo, com a duração lá contada"""
+        digest, usename, datname = execution[:3]
+        stats = self.fingerprints.get(digest)
+        if stats is not None:
+            stats.executions -= 1
+            stats.total_duration -= duration
+        for breakdown, key in ((self.users, usename), (self.databases, datname)):
+            entry = breakdown.get(key)
+            if entry is not None:
+                entry[1] -= 1
+                entry[2] -= duration
+        self.durations[duration_bucket(duration)] -= 1
+
+    def merge(self, other, continues=None):
+        """
+        Combina o agregado de outro arquivo
+
+        Args:
+            other: Analysis do arquivo
+            continues: tail do arquivo anterior do mesmo servidor; as execuções
+                       que continuam em other são contadas uma só vez
+        """
+        self.files += other.files
+        self.captures += other.captures
+        self.sessions += other.sessions
+        for moment in (other.first, other.last):
+            if moment is not None:
+                self.first = min(self.first or moment, moment)
+                self.last = max(self.last or moment, moment)
+        self.peak_load = max(self.peak_load, other.peak_load)
+        self.incidents += other.incidents
+        self.errors.extend(other.errors)
+
+        for digest, stats in other.fingerprints.items():
+            mine = self.fingerprints.get(digest)
+            if mine is None:
+                self.fingerprints[digest] = stats
+            else:
+                mine.merge(stats)
+        for breakdown, partial_breakdown in ((self.users, other.users),
+                                             (self.databases, other.databases)):
+            for key, (samples, executions, total) in partial_breakdown.items():
+                entry = breakdown.setdefault(key, [0, 0, 0.0])
+                entry[0] += samples
+                entry[1] += executions
+                entry[2] += total
+        self.waits.update(other.waits)
+        self.hours.update(other.hours)
+        self.capture_hours.update(other.capture_hours)
+        self.durations.update(other.durations)
+
+        if continues:
+            for key, execution in other.head.items():
+                previous = continues.get(key)
+                if previous is not None:
+                    self.discount(execution, min(previous[3], execution[3]))
+
+    def as_dict(self, n=None):
+        """Relatório completo (ou com os n primeiros de cada lista) em um dicionário"""
+        def breakdown(entries):
+            rows = [{"name": name, "samples": samples, "executions": executions,
+                     "total_duration": total}
+                    for name, (samples, executions, total) in entries.items()]
+            rows.sort(key=lambda row: row["total_duration"], reverse=True)
+            return rows[:n]
+
+        fingerprints = sorted(self.fingerprints.values(),
+                              key=lambda stats: stats.total_duration, reverse=True)
+        return {
+            "files": self.files,
+            "errors": self.errors,
+            "captures": self.captures,
+            "sessions": self.sessions,
+            "incidents": self.incidents,
+            "first": self.first,
+            "last": self.last,
+            "peak_load": self.peak_load,
+            "fingerprints": [stats.as_dict() for stats in fingerprints[:n]],
+            "users": breakdown(self.users),
+            "databases": breakdown(self.databases),
+            "waits": dict(self.waits.most_common(n)),
+            "durations": {duration_bucket(limit): self.durations[duration_bucket(limit)]
+                          for limit in DURATION_BUCKETS + (float("inf"),)},
+            "hours": dict(sorted(self.hours.items())),
+            "capture_hours": dict(sorted(self.capture_hours.items())),
+        }
+
+
+def analyze_file(path, since=None, until=None):
+    """
+    Resume um arquivo de captura (executado nos processos do pool)
+
+    Args:
+        path: Arquivo de captura
+        since: Ignora capturas anteriores a este momento (datetime)
+        until: Ignora capturas a partir deste momento (datetime)
+
+    Returns:
+        Analysis do arquivo
+    """
+    analysis = Analysis()
+    analysis.files = 1
+    reader = CaptureReader(path)
+    live = {}
+    try:
+        for timestamp, load_average, sessions, _ in reader.snapshots():
+            if (since is not None and timestamp < since) or \
+                    (until is not None and timestamp >= until):
+                continue
+            first = analysis.captures == 0
+            live = analysis.add_snapshot(timestamp, load_average, sessions, live)
+            if first:
+                # Mesmas listas de live: a duração segue atualizada até o fim
+                analysis.head = dict(live)
+    except Exception as e:
+        analysis.errors.append(f"{path}: {e}")
+
+    # As execuções vivas no fim contam com a maior duração observada aqui
+    for execution in live.values():
+        analysis.durations[duration_bucket(execution[3])] += 1
+    # Só os campos usados na combinação voltam do processo
+    analysis.head = {key: execution[:4] for key, execution in analysis.head.items()}
+    analysis.tail = {key: execution[:4] for key, execution in live.items()}
+    if reader.header.get("incident"):
+        analysis.incidents = 1
+    return analysis
+
+
+def capture_files(directory, since=None, until=None):
+    """
+    Arquivos de captura de um diretório, por servidor e em ordem cronológica
+
+    Arquivos que certamente estão fora do período são descartados pelo nome.
+    """
+    found = []
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            if not is_capture_file(filename):
+                continue
+            path = os.path.join(dirpath, filename)
+            try:
+                timestamp = file_timestamp(path)
+            except OSError:
+                continue
+            kind = file_kind(filename)
+            if until is not None and timestamp >= until:
+                continue
+            if since is not None and (
+                    (kind == "archive" and timestamp + timedelta(days=1) <= since)
+                    or (kind == "queries" and timestamp + timedelta(seconds=1) <= since)):
+                continue
+            found.append((dirpath, timestamp, path))
+    found.sort()
+    return found
+
+
+def analyze(directory, since=None, until=None, jobs=None):
+    """
+    Analisa todos os arquivos de captura de um diretório
+
+    Args:
+        directory: Diretório de logs (ou de um servidor)
+        since: Início do período (datetime), inclusive
+        until: Fim do período (datetime), exclusive
+        jobs: Processos do pool. Se None, um por CPU
+
+    Returns:
+        Analysis combinada
+    """
+    files = capture_files(directory, since, until)
+    jobs = jobs or os.cpu_count() or 1
+    worker = partial(analyze_file, since=since, until=until)
+    paths = [path for _, _, path in files]
+
+    total = Analysis()
+    tails = {}
+
+    def combine(results):
+        # Os resultados chegam na ordem dos arquivos
+        for (dirpath, _, _), result in zip(files, results):
+            total.merge(result, tails.get(dirpath))
+            tails[dirpath] = result.tail
+
+    if jobs == 1 or len(paths) < 2:
+        combine(map(worker, paths))
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            combine(pool.map(worker, paths, chunksize=max(1, len(paths) // (jobs * 8))))
+    return total
+
+
+def format_report(analysis, directory, n=REPORT_ITEMS):
+    """Relatório em texto de uma análise"""
+    report = analysis.as_dict(n)
+    lines = [f"=== Análise de {directory} ===\n"]
+    if not report["captures"]:
+        lines.append(f"Arquivos: {report['files']}, nenhuma captura no período\n")
+    else:
+        first = datetime.fromisoformat(report["first"]).strftime("%Y-%m-%d %H:%M:%S")
+        last = datetime.fromisoformat(report["last"]).strftime("%Y-%m-%d %H:%M:%S")
+        lines.append(f"Arquivos: {report['files']} ({report['incidents']} incidentes), "
+                     f"capturas: {report['captures']}, sessões: {report['sessions']}\n")
+        lines.append(f"Período: {first} a {last}\n")
+        lines.append(f"Pico de load: {report['peak_load']:.2f}\n")
+
+    if report["fingerprints"]:
+        lines.append("\nConsultas que mais consumiram tempo:\n")
+        for stats in report["fingerprints"]:
+            wait = max(stats["waits"], key=stats["waits"].get) if stats["waits"] else "-"
+            lines.append(f"  {stats['total_duration']:.0f}s em {stats['executions']} execuções "
+                         f"(máx. {stats['max_duration']:.0f}s, {stats['samples']} amostras, "
+                         f"espera {wait}): {stats['query'][:200]}\n")
+
+    for title, rows in (("Por usuário", report["users"]), ("Por banco", report["databases"])):
+        if rows:
+            lines.append(f"\n{title}:\n")
+            for row in rows:
+                lines.append(f"  {str(row['name']):<24} {row['total_duration']:>10.0f}s "
+                             f"{row['executions']:>8} execuções {row['samples']:>8} amostras\n")
+
+    if report["waits"]:
+        lines.append("\nEventos de espera (amostras):\n")
+        for wait, count in report["waits"].items():
+            lines.append(f"  {wait:<40} {count:>8}\n")
+
+    if any(report["durations"].values()):
+        lines.append("\nDuração das execuções:\n")
+        for bucket, count in report["durations"].items():
+            lines.append(f"  {bucket:>8} {count:>8}\n")
+
+    hours = report["hours"]
+    if hours:
+        # Períodos longos são mostrados por dia
+        if len(hours) > 48:
+            periods = Counter()
+            for hour, count in hours.items():
+                periods[hour[:10]] += count
+            title = "Sessões amostradas por dia"
+        else:
+            periods = hours
+            title = "Sessões amostradas por hora"
+        peak = max(periods.values())
+        lines.append(f"\n{title}:\n")
+        for period, count in sorted(periods.items()):
+            lines.append(f"  {period:<16} {count:>8} {'#' * max(1, round(40 * count / peak))}\n")
+
+    if report["errors"]:
+        lines.append(f"\nArquivos com erro de leitura ({len(report['errors'])}):\n")
+        for error in report["errors"][:n]:
+            lines.append(f"  {error}\n")
+    return "".join(lines)
+
+
+def main(argv=None):
+    """Ponto de entrada de main.py analyze"""
+    parser = argparse.ArgumentParser(
+        prog="main.py analyze",
+        description="Analisa os arquivos de captura de um diretório de logs")
+    parser.add_argument("directory", nargs="?", default="logs",
+                        help="Diretório de logs (padrão: logs)")
+    parser.add_argument("--since", type=datetime.fromisoformat,
+                        help="Início do período (ex.: 2025-01-01 ou 2025-01-01T08:00)")
+    parser.add_argument("--until", type=datetime.fromisoformat,
+                        help="Fim do período, exclusive")
+    parser.add_argument("-j", "--jobs", type=int,
+                        help="Processos de análise (padrão: um por CPU)")
+    parser.add_argument("-n", "--top", type=int, default=REPORT_ITEMS,
+                        help=f"Itens de cada lista do relatório (padrão: {REPORT_ITEMS})")
+    parser.add_argument("--json", action="store_true",
+                        help="Exporta o relatório em JSON")
+    parser.add_argument("-o", "--output", help="Arquivo de saída (padrão: saída padrão)")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directory):
+        print(f"Diretório não encontrado: {args.directory}")
+        return 1
+
+    analysis = analyze(args.directory, args.since, args.until, args.jobs)
+    if args.json:
+        text = json.dumps(analysis.as_dict(args.top), ensure_ascii=False, indent=2) + "\n"
+    else:
+        text = format_report(analysis, args.directory, args.top)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            out.write(text)
+    else:
+        sys.stdout.write(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
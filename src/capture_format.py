@@ -0,0 +1,720 @@
+#!/usr/bin/env python
+"""
+Formato estruturado dos arquivos de captura (.pgcap)
+
+Cada arquivo é uma sequência de registros JSON, um por linha:
+
+    {"t": "header", "v": 1, "fields": [...], "host": ..., "port": ..., "database": ...}
+    {"t": "str", "id": 1, "v": "SELECT ..."}
+    {"t": "capture", "ts": ..., "server_ts": ..., "load": [...]}
+    {"t": "full", "id": 7, "f": [<valores na ordem de "fields">]}
+    {"t": "run", "ids": [...], "res": [[...], ...]}
+    {"t": "end", "ids": [...]}
+    {"t": "locks", "roots": [{"pid": ..., "blocked": ..., "depth": ..., ...}]}
+    {"t": "summary", "incident": ..., "start": ..., "end": ..., "top": [...], ...}
+
+Os textos repetidos (SQL, usuário, banco, estado, eventos de espera) vão para
+uma tabela de strings do próprio arquivo: cada valor é gravado uma única vez
+em um registro "str" e os registros "full" guardam apenas o seu id.
+
+No modo delta, sessões que continuam iguais desde a captura anterior viram
+um marcador "run" e as que terminaram um marcador "end"; as sessões são
+identificadas por (pid, backend_start, query_start) (ver src.delta). Com a
+atribuição de recursos por backend (src.procstat), o marcador "run" leva
+também o consumo atual de cada sessão em "res", na ordem de RESOURCE_COLUMNS.
+
+Quando há sessões esperando por lock, a captura termina com um registro
+"locks" com os bloqueadores raiz do grafo de espera (ver src.locks).
+
+Os arquivos de incidente (src.incidents) levam os dados do incidente no
+header e terminam com um registro "summary", gravado quando o episódio
+se encerra; um arquivo sem ele é de um incidente em andamento ou
+interrompido.
+
+As capturas são gravadas em streaming, em blocos de até BLOCK_BYTES. Com
+compressão, cada bloco é independente (um membro gzip ou um frame zstd), de
+modo que o arquivo pode ser lido em streaming e continua legível mesmo que o
+processo pare no meio de um episódio.
+
+Com um escritor em segundo plano (src.writer), os blocos prontos são
+entregues à sua fila em vez de gravados na thread da captura.
+
+Os arquivos diários da compactação (src.retention) são a concatenação de
+vários arquivos de captura: cada um começa no seu header, que reinicia a
+tabela de strings e as sessões vivas.
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from itertools import chain
+
+from src.delta import DeltaState, _value
+from src.locks import BlockingCollector
+from src.procstat import RESOURCE_COLUMNS
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependência opcional
+    zstandard = None
+
+FORMAT_VERSION = 1
+
+# Campos gravados em cada registro completo, na ordem do header
+SESSION_FIELDS = (
+    "pid", "usename", "datname", "client_addr", "state", "backend_start",
+    "query_start", "wait_event_type", "wait_event", "query", "blocked_by",
+) + RESOURCE_COLUMNS
+# Campos cujos valores vão para a tabela de strings
+INTERNED_FIELDS = frozenset((
+    "usename", "datname", "client_addr", "state", "wait_event_type", "wait_event", "query",
+))
+
+# Tamanho máximo do trecho acumulado em memória antes de ir para o disco
+BLOCK_BYTES = 1024 * 1024
+
+# Início da linha do registro "summary" e quanto do fim do arquivo é lido
+# para encontrá-lo sem percorrer o arquivo inteiro
+SUMMARY_PREFIX = b'{"t":"summary"'
+SUMMARY_TAIL_BYTES = 256 * 1024
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+EXTENSIONS = {
+    "none": ".pgcap",
+    "gzip": ".pgcap.gz",
+    "zstd": ".pgcap.zst",
+}
+
+
+def resolve_compression(compression=None):
+    """
+    Determina a compressão a usar
+
+    Args:
+        compression: "none", "gzip" ou "zstd".
+                     Se None, lê do ambiente MONITOR_CAPTURE_COMPRESSION
+
+    Returns:
+        O nome da compressão; "gzip" se zstd for pedido sem o pacote zstandard
+    """
+    if compression is None:
+        compression = os.environ.get('MONITOR_CAPTURE_COMPRESSION', 'none')
+    compression = compression.lower()
+
+    if compression not in EXTENSIONS:
+        raise ValueError(f"Compressão desconhecida: {compression}")
+
+    if compression == "zstd" and zstandard is None:
+        print("Pacote zstandard não instalado; usando compressão gzip")
+        return "gzip"
+
+    return compression
+
+
+def capture_extension(compression=None):
+    """Extensão dos arquivos de captura para a compressão configurada"""
+    return EXTENSIONS[resolve_compression(compression)]
+
+
+def is_capture_file(filename):
+    """Indica se o nome corresponde a um arquivo de captura estruturado"""
+    return filename.endswith(tuple(EXTENSIONS.values()))
+
+
+def _local_time(value):
+    """Converte um horário ISO para datetime local sem fuso"""
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment
+
+
+class CaptureWriter:
+    def __init__(self, path, header=None, delta=False, compression=None, sink=None):
+        """
+        Grava capturas no formato estruturado
+
+        Args:
+            path: Caminho do arquivo de saída (aberto em modo append)
+            header: Dicionário com informações do servidor para o registro header
+            delta: Se True, grava só as sessões novas ou alteradas a cada captura
+            compression: "none", "gzip" ou "zstd".
+                         Se None, lê do ambiente MONITOR_CAPTURE_COMPRESSION
+            sink: BackgroundWriter que grava os blocos em outra thread.
+                  Se None, os blocos são gravados na thread que captura
+        """
+        self.path = path
+        self.header = header or {}
+        self.delta = delta
+        self.compression = resolve_compression(compression)
+        self.sink = sink
+
+        # Aberto na primeira captura; com o sink, pela thread de gravação
+        self._opened = False
+        self._file = None
+        self._compressor = None
+        if self.compression == "zstd":
+            self._compressor = zstandard.ZstdCompressor()
+
+        # Tabela de strings do arquivo: valor (ou hash, se longo) -> id
+        self._strings = {}
+        # Sessões vivas entre capturas (src.delta)
+        self._delta = DeltaState()
+        self._block = []
+        self._block_bytes = 0
+
+        self.captures = 0
+        # Capturas descartadas com a fila de gravação cheia
+        self.dropped = 0
+        self.full_records = 0
+        # Bloqueadores raiz da última captura gravada
+        self.last_blockers = []
+        # Bytes antes e depois da compressão
+        self.raw_bytes = 0
+        self.bytes_written = 0
+        # Bytes que as mesmas capturas ocupariam gravando tudo por completo
+        self.full_equivalent_bytes = 0
+
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+        self._block.append(line)
+        size = len(line.encode("utf-8"))
+        self.raw_bytes += size
+        if record["t"] not in ("run", "end"):
+            self.full_equivalent_bytes += size
+        self._block_bytes += size
+        if self._block_bytes >= BLOCK_BYTES and self._opened:
+            self._flush_block()
+        return size
+
+    def _intern(self, value):
+        """Retorna o id de uma string, registrando-a na tabela se for nova"""
+        if value is None:
+            return None
+        # Textos longos (SQL) são identificados pelo hash, para que a tabela não
+        # guarde em memória uma cópia de cada texto já gravado
+        key = value if len(value) <= 64 else \
+            hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        string_id = self._strings.get(key)
+        if string_id is None:
+            string_id = len(self._strings) + 1
+            self._strings[key] = string_id
+            self._write({"t": "str", "id": string_id, "v": value})
+        return string_id
+
+    def _values(self, session):
+        """Valores de um registro completo, na ordem de SESSION_FIELDS"""
+        return [
+            self._intern(_value(session.get(field))) if field in INTERNED_FIELDS
+            else _value(session.get(field))
+            for field in SESSION_FIELDS
+        ]
+
+    def _flush_block(self, sync=False):
+        """
+        Grava o bloco da captura atual, comprimido se configurado
+
+        Args:
+            sync: Se o bloco encerra uma captura (fsync conforme a política do sink)
+        """
+        if not self._block:
+            return
+        data = "".join(self._block).encode("utf-8")
+        self._block = []
+        self._block_bytes = 0
+
+        if self.compression == "gzip":
+            data = gzip.compress(data, mtime=0)
+        elif self.compression == "zstd":
+            data = self._compressor.compress(data)
+
+        if self.sink is not None:
+            self.sink.write(self.path, data, sync)
+        else:
+            self._file.write(data)
+            self._file.flush()
+        self.bytes_written += len(data)
+
+    def open(self):
+        """
+        Abre o arquivo, gravando o header se ele ainda estiver vazio
+
+        Com o sink, o arquivo só é aberto pela thread de gravação e o header é
+        sempre gravado: em um arquivo que já existia, ele reinicia a tabela de
+        strings e as sessões vivas, como nos arquivos diários.
+        """
+        if not self._opened:
+            self._opened = True
+            if self.sink is None:
+                self._file = open(self.path, "ab")
+            if self._file is None or self._file.tell() == 0:
+                self._strings = {}
+                self._delta.reset()
+                header = {"t": "header", "v": FORMAT_VERSION, "fields": list(SESSION_FIELDS)}
+                header.update(self.header)
+                self._write(header)
+                self._flush_block()
+        return self.path
+
+    def write_capture(self, queries, timestamp=None, load_average=None, delta=None):
+        """
+        Grava uma captura
+
+        As sessões são consumidas uma a uma e gravadas em blocos limitados,
+        de modo que a captura não precisa caber inteira em memória.
+
+        Args:
+            queries: Iterável de sessões de get_active_queries()
+            timestamp: Momento da captura (datetime). Se None, usa o atual
+            load_average: Tupla de load average a registrar. Se None, lê do sistema
+            delta: Se informado, substitui o modo do gravador nesta captura
+                   (amostras do histórico são sempre gravadas em delta)
+
+        Returns:
+            O caminho do arquivo, ou None se a captura foi descartada porque a
+            fila de gravação está cheia (as sessões são consumidas mesmo assim)
+        """
+        if self.sink is not None and not self.sink.accepting():
+            # Descartada por inteiro, sem alterar o estado delta do arquivo
+            for _ in queries:
+                pass
+            self.dropped += 1
+            self.sink.record_drop()
+            return None
+
+        timestamp = timestamp or datetime.now()
+        load_average = load_average or os.getloadavg()
+        if delta is None:
+            delta = self.delta
+
+        self.open()
+
+        capture = {
+            "t": "capture",
+            "ts": timestamp.isoformat(),
+            "load": [round(value, 2) for value in load_average],
+        }
+        # Hora do servidor (query_start + duração da primeira sessão), para
+        # calcular durações sem depender do relógio da máquina do monitor
+        queries = iter(queries)
+        first = next(queries, None)
+        if first is not None:
+            queries = chain((first,), queries)
+            if isinstance(first.get("query_start"), datetime) and \
+                    isinstance(first.get("duration"), timedelta):
+                capture["server_ts"] = (first.get("query_start") + first.get("duration")).isoformat()
+        self._write(capture)
+
+        running = []
+        resources = []
+        blocking = BlockingCollector()
+        for session in queries:
+            blocking.add_session(session)
+            # Sem delta não há estado entre capturas
+            if not delta:
+                self._write({"t": "full", "id": self._delta.new_id(), "f": self._values(session)})
+                self.full_records += 1
+                continue
+
+            session_id, size = self._delta.match(session)
+            if size is not None:
+                running.append(session_id)
+                # O consumo de recursos muda a cada captura sem que a sessão mude
+                resources.append([session.get(field) for field in RESOURCE_COLUMNS])
+                self.full_equivalent_bytes += size
+                continue
+
+            size = self._write({"t": "full", "id": session_id, "f": self._values(session)})
+            self.full_records += 1
+            self._delta.record(size)
+
+        if running:
+            record = {"t": "run", "ids": running}
+            if any(any(value is not None for value in values) for values in resources):
+                record["res"] = resources
+            self._write(record)
+
+        ended = self._delta.finish()
+        if ended:
+            self._write({"t": "end", "ids": ended})
+
+        self.last_blockers = blocking.root_blockers()
+        if self.last_blockers:
+            self._write({"t": "locks", "roots": self.last_blockers})
+
+        self.captures += 1
+        self._flush_block(sync=True)
+        return self.path
+
+    def write_summary(self, summary):
+        """
+        Grava o registro "summary" que encerra um arquivo de incidente
+
+        Args:
+            summary: Dicionário de Incident.summary()
+        """
+        self.open()
+        record = {"t": "summary"}
+        record.update(summary)
+        self._write(record)
+        self._flush_block(sync=True)
+
+    def close(self):
+        """Fecha o arquivo (depois dos blocos ainda na fila de gravação)"""
+        if not self._opened:
+            return
+        self._opened = False
+        if self.sink is not None:
+            self.sink.close(self.path)
+        elif not self._file.closed:
+            self._file.close()
+        self._file = None
+
+
+def open_capture(path, binary=False):
+    """
+    Abre um arquivo de captura para leitura, descomprimindo em streaming
+
+    Args:
+        path: Caminho do arquivo
+        binary: Se True, lê as linhas como bytes em vez de texto
+    """
+    with open(path, "rb") as f:
+        magic = f.read(4)
+
+    # A compressão é detectada pelo conteúdo, não pela extensão
+    if magic[:2] == GZIP_MAGIC:
+        return gzip.open(path, "rb") if binary else gzip.open(path, "rt", encoding="utf-8")
+    if magic == ZSTD_MAGIC:
+        if zstandard is None:
+            raise ValueError("Pacote zstandard necessário para ler arquivos .zst")
+        reader = zstandard.ZstdDecompressor().stream_reader(
+            open(path, "rb"), read_across_frames=True, closefd=True)
+        return io.BufferedReader(reader) if binary else io.TextIOWrapper(reader, encoding="utf-8")
+    return open(path, "rb") if binary else open(path, encoding="utf-8")
+
+
+def read_summary(path):
+    """
+    Lê o registro "summary" de um arquivo de incidente sem reconstruir as capturas
+
+    Em arquivos sem compressão só o fim do arquivo é lido; nos comprimidos,
+    as linhas são descomprimidas em streaming e só a do resumo é decodificada.
+
+    Returns:
+        O dicionário do resumo, ou None se o arquivo não tiver um
+    """
+    with open(path, "rb") as f:
+        magic = f.read(4)
+        if magic[:2] != GZIP_MAGIC and magic != ZSTD_MAGIC:
+            size = f.seek(0, os.SEEK_END)
+            start = max(0, size - SUMMARY_TAIL_BYTES)
+            f.seek(start)
+            tail = f.read()
+            position = tail.rfind(b"\n" + SUMMARY_PREFIX)
+            if position >= 0:
+                try:
+                    return json.loads(tail[position + 1:].split(b"\n", 1)[0])
+                except ValueError:
+                    return None
+            if start == 0:
+                return None
+            # Resumo maior que o trecho lido: percorre o arquivo
+    summary = None
+    prefix = SUMMARY_PREFIX.decode()
+    with open_capture(path) as f:
+        for line in f:
+            if line.startswith(prefix):
+                try:
+                    summary = json.loads(line)
+                except ValueError:
+                    pass
+    return summary
+
+
+class CaptureReader:
+    def __init__(self, path):
+        """
+        Lê um arquivo de captura em streaming
+
+        Args:
+            path: Caminho do arquivo (.pgcap, .pgcap.gz ou .pgcap.zst)
+        """
+        self.path = path
+        self.header = {}
+        # Registro "summary" dos arquivos de incidente, quando já lido
+        self.summary = None
+
+    def records(self):
+        """
+        Percorre os registros do arquivo resolvendo a tabela de strings
+
+        Yields:
+            Registros "header" (antes de self.header passar a ele, para que o
+            arquivo anterior de um arquivo diário seja concluído com o seu),
+            "capture", "full" (com os campos em um dicionário em "session"),
+            "run", "end", "locks" e "summary"
+        """
+        strings = {}
+        fields = SESSION_FIELDS
+
+        with open_capture(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Última linha incompleta de um arquivo ainda em gravação
+                    # (ou de um arquivo interrompido, dentro de um arquivo diário)
+                    continue
+
+                kind = record["t"]
+                if kind == "str":
+                    strings[record["id"]] = record["v"]
+                    continue
+                if kind == "header":
+                    yield record
+                    self.header = record
+                    fields = tuple(record.get("fields", SESSION_FIELDS))
+                    strings = {}
+                    continue
+                if kind == "summary":
+                    self.summary = record
+                if kind == "full":
+                    record["session"] = {
+                        field: strings.get(value) if field in INTERNED_FIELDS and value is not None
+                        else value
+                        for field, value in zip(fields, record["f"])
+                    }
+                yield record
+
+    def snapshots(self, order_by=None):
+        """
+        Reconstrói cada captura completa do arquivo
+
+        Args:
+            order_by: Campo numérico para ordenar as sessões, do maior para o
+                      menor (ex.: "cpu_percent"). Se None, ordena por duração
+
+        Yields:
+            Tuplas (timestamp, load_average, sessões, bloqueadores), onde
+            sessões é uma lista de dicionários com os campos completos e a
+            duração recalculada e bloqueadores são os bloqueadores raiz do
+            registro "locks" (lista vazia se não houver)
+        """
+        sessions = {}
+        capture = None
+        present = []
+
+        for record in self.records():
+            kind = record["t"]
+            if kind == "header":
+                # Início de outro arquivo em um arquivo diário: ids recomeçam
+                if capture is not None:
+                    yield self._snapshot(capture, sessions, present, order_by)
+                sessions = {}
+                capture = None
+                present = []
+            elif kind == "capture":
+                if capture is not None:
+                    yield self._snapshot(capture, sessions, present, order_by)
+                    # Só as sessões da captura anterior podem continuar ("run"): as
+                    # demais saem da memória mesmo sem um "end" (modo completo)
+                    sessions = {session_id: sessions[session_id] for session_id in present}
+                capture = record
+                present = []
+            elif kind == "full":
+                sessions[record["id"]] = record["session"]
+                present.append(record["id"])
+            elif kind == "run":
+                present.extend(record["ids"])
+                for session_id, values in zip(record["ids"], record.get("res", ())):
+                    sessions[session_id].update(zip(RESOURCE_COLUMNS, values))
+            elif kind == "end":
+                for session_id in record["ids"]:
+                    sessions.pop(session_id, None)
+            elif kind == "locks" and capture is not None:
+                capture["locks"] = record["roots"]
+
+        if capture is not None:
+            yield self._snapshot(capture, sessions, present, order_by)
+
+    def _snapshot(self, capture, sessions, present, order_by=None):
+        timestamp = datetime.fromisoformat(capture["ts"])
+        # Durações pela hora do servidor, quando registrada
+        now = _local_time(capture.get("server_ts") or capture["ts"])
+
+        result = []
+        for session_id in present:
+            session = dict(sessions[session_id])
+            if session.get("query_start"):
+                session["duration"] = now - _local_time(session["query_start"])
+            else:
+                session["duration"] = None
+            result.append(session)
+
+        if order_by:
+            # Sessões sem o valor (ex.: backends de outra máquina) ficam no fim
+            result.sort(key=lambda s: s.get(order_by) if s.get(order_by) is not None
+                        else float("-inf"), reverse=True)
+        else:
+            # As capturas são gravadas sem ordem: as mais longas vêm primeiro
+            result.sort(key=lambda s: s["duration"] or timedelta(0), reverse=True)
+        return timestamp, tuple(capture["load"]), result, capture.get("locks", [])
+
+    def snapshot_at(self, when):
+        """
+        Retorna o snapshot completo vigente em um momento
+
+        Args:
+            when: datetime desejado
+
+        Returns:
+            A última captura com timestamp <= when, ou None se não houver
+        """
+        found = None
+        for snapshot in self.snapshots():
+            if snapshot[0] > when:
+                break
+            found = snapshot
+        return found
+
+
+def format_incident(header, summary):
+    """Formata o cabeçalho de um arquivo de incidente, com o resumo se houver"""
+    start = datetime.fromisoformat(header["start"])
+    lines = [f"=== Incidente {start.strftime('%Y-%m-%d %H:%M:%S')}"]
+    if summary is None:
+        lines.append(" (em andamento ou interrompido, sem resumo) ===\n")
+        if header.get("triggers"):
+            lines.append(f"Gatilhos: {', '.join(header['triggers'])}\n")
+        return "".join(lines) + "\n"
+
+    end = datetime.fromisoformat(summary["end"])
+    lines.append(f" a {end.strftime('%Y-%m-%d %H:%M:%S')} ({summary['duration']:.0f}s)")
+    lines.append(" - interrompido ===\n" if summary.get("interrupted") else " ===\n")
+    if summary.get("triggers"):
+        lines.append(f"Gatilhos: {', '.join(summary['triggers'])}\n")
+    lines.append(f"Pico de load: {summary['peak_load']:.2f}\n")
+    dropped = summary.get("dropped")
+    lines.append(f"Capturas: {summary['captures']}"
+                 + (f" ({dropped} descartadas com a fila de gravação cheia)" if dropped else "")
+                 + "\n")
+    if summary.get("top"):
+        lines.append("\nConsultas que mais consumiram tempo:\n")
+        for stats in summary["top"]:
+            lines.append(f"  {stats['total_duration']:.0f}s em {stats['executions']} execuções "
+                         f"(máx. {stats['max_duration']:.0f}s): {stats['query']}\n")
+    if summary.get("longest"):
+        lines.append("\nSessões mais longas:\n")
+        for session in summary["longest"]:
+            lines.append(f"  {session['duration']:.0f}s, PID {session['pid']} "
+                         f"({session.get('usename')}@{session.get('datname')}): "
+                         f"{session.get('query')}\n")
+    if summary.get("statements"):
+        lines.append("\nComandos com mais tempo de execução (pg_stat_statements):\n")
+        for statement in summary["statements"]:
+            lines.append(f"  {statement['total_exec_time'] / 1000:.1f}s em {statement['calls']} "
+                         f"chamadas: {statement.get('query') or statement['queryid']}\n")
+    return "".join(lines) + "\n"
+
+
+def format_snapshot(header, timestamp, load_average, sessions, blockers=(), title=None):
+    """Formata uma captura no layout de texto dos antigos arquivos .log"""
+    lines = [
+        f"--- {title or 'Consultas PostgreSQL Ativas'} em {timestamp.strftime('%Y-%m-%d %H:%M:%S')} ---\n\n",
+        f"Servidor: {header.get('host')}:{header.get('port')}\n",
+        f"Banco de dados: {header.get('database')}\n",
+        "Load Average atual: " + ", ".join(f"{value:.2f}" for value in load_average) + "\n\n",
+    ]
+    if blockers:
+        lines.append("Bloqueadores raiz:\n")
+        for root in blockers:
+            cycle = " (ciclo)" if root.get("cycle") else ""
+            lines.append(
+                f"  PID {root['pid']}{cycle}: bloqueia {root['blocked']} sessões, "
+                f"cadeia de {root['depth']}, {root.get('usename')} ({root.get('state')}): "
+                f"{root.get('query')}\n")
+        lines.append("\n")
+    for i, query_data in enumerate(sessions, 1):
+        query_start = query_data.get('query_start')
+        if query_start:
+            query_start = _local_time(query_start)
+        lines.append(f"[Query {i}]\n")
+        lines.append(f"PID: {query_data.get('pid')}\n")
+        lines.append(f"Usuário: {query_data.get('usename')}\n")
+        lines.append(f"Banco: {query_data.get('datname')}\n")
+        lines.append(f"Endereço: {query_data.get('client_addr')}\n")
+        lines.append(f"Estado: {query_data.get('state')}\n")
+        lines.append(f"Início: {query_start}\n")
+        lines.append(f"Duração: {query_data.get('duration')}\n")
+        lines.append(
+            f"Aguardando: {query_data.get('wait_event_type')} - {query_data.get('wait_event')}\n")
+        if query_data.get('cpu_percent') is not None or query_data.get('rss_bytes') is not None:
+            lines.append(f"Recursos: {format_resources(query_data)}\n")
+        if query_data.get('blocked_by'):
+            lines.append(f"Bloqueada por: {', '.join(map(str, query_data['blocked_by']))}\n")
+        lines.append(f"SQL: {query_data.get('query')}\n")
+        lines.append("-" * 80 + "\n\n")
+    return "".join(lines)
+
+
+def format_resources(session):
+    """Consumo de recursos do backend de uma sessão, em uma linha"""
+    def megabytes(value):
+        return "-" if value is None else f"{value / (1024 * 1024):.1f} MB"
+
+    cpu = session.get('cpu_percent')
+    return (f"CPU {'-' if cpu is None else f'{cpu:.1f}%'}, "
+            f"RSS {megabytes(session.get('rss_bytes'))}, "
+            f"leitura {megabytes(session.get('read_bytes'))}, "
+            f"escrita {megabytes(session.get('write_bytes'))}")
+
+
+def to_text(path, out, order_by=None, cancelled=None):
+    """
+    Converte um arquivo de captura para o layout de texto legível
+
+    Args:
+        path: Arquivo de captura
+        out: Arquivo de texto aberto para escrita
+        order_by: Campo de ordenação das sessões (ver CaptureReader.snapshots)
+        cancelled: Função verificada a cada captura; se retornar True, a
+                   conversão para no ponto em que está
+
+    Returns:
+        False se a conversão foi interrompida por cancelled, True caso contrário
+    """
+    reader = CaptureReader(path)
+    start = None
+    for timestamp, load_average, sessions, blockers in reader.snapshots(order_by):
+        if cancelled is not None and cancelled():
+            return False
+        if start is None and reader.header.get("incident"):
+            # O resumo, gravado no fim do arquivo, abre o texto do incidente
+            out.write(format_incident(reader.header, read_summary(path)))
+            start = datetime.fromisoformat(reader.header["start"])
+        title = "Amostra anterior ao incidente" if start is not None and timestamp < start \
+            else None
+        out.write(format_snapshot(reader.header, timestamp, load_average, sessions, blockers,
+                                  title))
+    if start is None and reader.header.get("incident"):
+        # Incidente sem nenhuma captura
+        out.write(format_incident(reader.header, reader.summary))
+    return True
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    order_by = None
+    if len(args) == 3 and args[0] == "--sort":
+        order_by, args = args[1], args[2:]
+    if len(args) != 1 or (order_by and order_by not in RESOURCE_COLUMNS):
+        print("Uso: python -m src.capture_format [--sort cpu_percent|rss_bytes|read_bytes|"
+              "write_bytes] <arquivo.pgcap>")
+        sys.exit(1)
+    to_text(args[0], sys.stdout, order_by)
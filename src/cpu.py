@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Amostrador de uso de CPU por diferença entre leituras de /proc/stat
+
+Cada leitura custa microssegundos e não bloqueia: a utilização é calculada
+sobre o intervalo desde a leitura anterior (a cada verificação de load), no
+total e por núcleo, separada em user, system, iowait e steal.
+"""
+import os
+
+PROC_STAT = "/proc/stat"
+
+# Campos de uma linha "cpu" de /proc/stat, na ordem do arquivo. guest e
+# guest_nice já estão incluídos em user e nice, e ficam fora do total
+FIELDS = ("user", "nice", "system", "idle", "iowait", "irq", "softirq", "steal")
+_USER, _NICE, _SYSTEM, _IDLE, _IOWAIT, _IRQ, _SOFTIRQ, _STEAL = range(len(FIELDS))
+
+
+def read_proc_stat(path=PROC_STAT):
+    """
+    Lê os contadores acumulados de CPU
+
+    Returns:
+        Dicionário "cpu" (total) / "cpu0", "cpu1"... -> tupla de ticks na ordem de FIELDS
+    """
+    counters = {}
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.startswith(b"cpu"):
+                # As linhas de CPU vêm primeiro no arquivo
+                break
+            parts = line.split()
+            counters[parts[0].decode()] = tuple(int(value) for value in parts[1:len(FIELDS) + 1])
+    return counters
+
+
+def breakdown(before, after):
+    """
+    Percentuais de uso entre duas leituras de uma CPU
+
+    Returns:
+        Dicionário com percent (tudo exceto idle e iowait), user (com nice),
+        system (com irq e softirq), iowait e steal
+    """
+    delta = [new - old for new, old in zip(after, before)]
+    total = sum(delta)
+    if total <= 0:
+        return {"percent": 0.0, "user": 0.0, "system": 0.0, "iowait": 0.0, "steal": 0.0}
+    scale = 100.0 / total
+    return {
+        "percent": (total - delta[_IDLE] - delta[_IOWAIT]) * scale,
+        "user": (delta[_USER] + delta[_NICE]) * scale,
+        "system": (delta[_SYSTEM] + delta[_IRQ] + delta[_SOFTIRQ]) * scale,
+        "iowait": delta[_IOWAIT] * scale,
+        "steal": delta[_STEAL] * scale,
+    }
+
+
+class CpuSampler:
+    def __init__(self, path=PROC_STAT):
+        """
+        Calcula o uso de CPU desde a amostra anterior
+
+        A primeira amostra cobre o intervalo desde o boot. Fora do Linux
+        (sem /proc/stat), usa psutil.cpu_percent sem intervalo, que também
+        compara com a chamada anterior e não bloqueia.
+
+        Args:
+            path: Arquivo de contadores (permite ler /proc de outro namespace)
+        """
+        self.path = path
+        self.available = os.path.exists(path)
+        self._previous = {}
+
+    def sample(self):
+        """
+        Uso de CPU desde a amostra anterior
+
+        Returns:
+            Dicionário de breakdown() do total, com a lista per_core de
+            breakdown() de cada núcleo
+        """
+        if not self.available:
+            return self._sample_psutil()
+
+        current = read_proc_stat(self.path)
+        previous = self._previous
+        self._previous = current
+
+        def usage(name):
+            counters = current[name]
+            return breakdown(previous.get(name, (0,) * len(counters)), counters)
+
+        result = usage("cpu")
+        result["per_core"] = [usage(name) for name in current if name != "cpu"]
+        return result
+
+    def _sample_psutil(self):
+        import psutil
+
+        times = psutil.cpu_times_percent(interval=None)
+        per_core = psutil.cpu_percent(interval=None, percpu=True)
+        return {
+            "percent": 100.0 - times.idle - getattr(times, "iowait", 0.0),
+            "user": times.user + getattr(times, "nice", 0.0),
+            "system": times.system + getattr(times, "irq", 0.0) + getattr(times, "softirq", 0.0),
+            "iowait": getattr(times, "iowait", 0.0),
+            "steal": getattr(times, "steal", 0.0),
+            "per_core": [{"percent": percent} for percent in per_core],
+        }
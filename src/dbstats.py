@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+Taxas de atividade do servidor a partir das estatísticas cumulativas
+
+pg_stat_database, o checkpointer/bgwriter e a posição do WAL só expõem
+contadores acumulados. A cada verificação o monitor lê esses contadores
+(uma consulta por servidor) e calcula as taxas por segundo pela diferença
+com a leitura anterior, mantida em memória.
+"""
+
+# Contadores lidos por PostgresMonitor.database_stats, na ordem do SELECT
+DATABASE_COUNTERS = (
+    "xact_commit", "xact_rollback", "blks_read", "blks_hit", "tup_returned",
+    "tup_fetched", "tup_inserted", "tup_updated", "tup_deleted", "temp_bytes",
+    "deadlocks", "checkpoints_timed", "checkpoints_req", "buffers_checkpoint",
+    "buffers_clean", "wal_bytes",
+)
+
+# Taxas por segundo calculadas a partir de cada leitura
+RATE_COUNTERS = (
+    ("rollbacks", ("xact_rollback",)),
+    ("blks_read", ("blks_read",)),
+    ("blks_hit", ("blks_hit",)),
+    ("tup_returned", ("tup_returned",)),
+    ("tup_fetched", ("tup_fetched",)),
+    ("tup_modified", ("tup_inserted", "tup_updated", "tup_deleted")),
+    ("temp_bytes", ("temp_bytes",)),
+    ("deadlocks", ("deadlocks",)),
+    ("checkpoints_req", ("checkpoints_req",)),
+    ("buffers_written", ("buffers_checkpoint", "buffers_clean")),
+    ("wal_bytes", ("wal_bytes",)),
+)
+
+
+class DatabaseRates:
+    def __init__(self):
+        """Calcula taxas por segundo entre leituras sucessivas de um servidor"""
+        self._previous = None
+        self._previous_time = None
+
+    def update(self, counters, now):
+        """
+        Registra uma leitura e calcula as taxas desde a anterior
+
+        Contadores que diminuíram (pg_stat_reset, reinício do servidor) ou
+        indisponíveis na versão do servidor ficam sem taxa neste ciclo.
+
+        Args:
+            counters: Dicionário contador -> valor acumulado (ou None)
+            now: Instante da leitura em segundos (relógio monotônico)
+
+        Returns:
+            Dicionário taxa -> valor por segundo (com tps e hit_ratio), ou
+            None na primeira leitura
+        """
+        previous, previous_time = self._previous, self._previous_time
+        self._previous, self._previous_time = counters, now
+        if previous is None or now <= previous_time:
+            return None
+
+        elapsed = now - previous_time
+        deltas = {}
+        for name, value in counters.items():
+            old = previous.get(name)
+            if value is not None and old is not None and value >= old:
+                deltas[name] = value - old
+
+        def rate(*names):
+            if any(name not in deltas for name in names):
+                return None
+            return sum(deltas[name] for name in names) / elapsed
+
+        rates = {"tps": rate("xact_commit", "xact_rollback")}
+        for name, sources in RATE_COUNTERS:
+            rates[name] = rate(*sources)
+
+        # Proporção de blocos encontrados em shared_buffers no intervalo
+        read, hit = deltas.get("blks_read"), deltas.get("blks_hit")
+        rates["hit_ratio"] = 100.0 * hit / (hit + read) if read is not None and hit is not None \
+            and hit + read > 0 else None
+        return rates
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Codificação delta das capturas
+
+Cada sessão é identificada por (pid, backend_start, query_start). Só sessões
+novas ou alteradas precisam de um registro completo; as que continuam iguais
+desde a captura anterior viram um marcador "run" e as que terminaram um
+marcador "end". O formato dos registros fica em src.capture_format.
+"""
+from datetime import datetime, timezone
+
+# Campos de uma sessão que podem mudar sem que a consulta mude
+MUTABLE_FIELDS = ("state", "wait_event_type", "wait_event", "blocked_by")
+
+
+def _value(value):
+    """Converte valores do psycopg2 para tipos serializáveis em JSON"""
+    if value is None or isinstance(value, (int, float, str)):
+        return value
+    if isinstance(value, list):
+        # pids de pg_blocking_pids
+        return value
+    if isinstance(value, datetime):
+        # Horários com fuso são gravados em UTC: o mesmo instante tem o mesmo
+        # texto (e a mesma chave de execução) qualquer que seja o fuso da
+        # sessão do servidor ou a origem (captura ou histórico)
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value.isoformat()
+    return str(value)
+
+
+def session_key(session):
+    """Chave que identifica uma execução de consulta: (pid, backend_start, query_start)"""
+    return (session.get("pid"),
+            _value(session.get("backend_start")),
+            _value(session.get("query_start")))
+
+
+class DeltaState:
+    def __init__(self):
+        """
+        Sessões vivas entre as capturas de um arquivo
+
+        Cada sessão guarda o id dos seus registros, os valores mutáveis e o
+        tamanho do último registro completo (usado para estimar a economia).
+        """
+        self.sessions = {}
+        self.next_id = 1
+        self._current = {}
+        self._pending = None
+
+    def reset(self):
+        """Esquece as sessões vivas (um novo header reinicia o estado)"""
+        self.sessions = {}
+        self._current = {}
+
+    def new_id(self):
+        """Reserva o id de um registro que não participa do delta"""
+        session_id = self.next_id
+        self.next_id += 1
+        return session_id
+
+    def match(self, session):
+        """
+        Compara uma sessão com a captura anterior
+
+        Args:
+            session: Sessão da captura atual
+
+        Returns:
+            Tupla (id, tamanho): com tamanho, a sessão continua igual e vira um
+            marcador "run"; com tamanho None, precisa de um registro completo
+            com esse id, informado depois em record()
+        """
+        key = session_key(session)
+        mutable = tuple(_value(session.get(field)) for field in MUTABLE_FIELDS)
+        previous = self.sessions.get(key)
+
+        if previous is not None and previous[1] == mutable:
+            self._current[key] = previous
+            return previous[0], previous[2]
+
+        # Sessão nova ou alterada: o id é reaproveitado se ela já existia
+        session_id = previous[0] if previous is not None else self.new_id()
+        self._pending = (key, session_id, mutable)
+        return session_id, None
+
+    def record(self, size):
+        """Registra o tamanho do registro completo da última sessão de match()"""
+        key, session_id, mutable = self._pending
+        self._pending = None
+        self._current[key] = (session_id, mutable, size)
+
+    def finish(self):
+        """
+        Encerra a captura atual
+
+        Returns:
+            Lista de ids das sessões que terminaram desde a captura anterior
+        """
+        ended = [value[0] for key, value in self.sessions.items() if key not in self._current]
+        self.sessions, self._current = self._current, {}
+        return ended
@@ -0,0 +1,689 @@
+#!/usr/bin/env python
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+import time
+from datetime import datetime
+from itertools import chain
+from src.dbstats import DatabaseRates
+from src.fingerprint import FingerprintAggregator
+from src.incidents import Incident, LongestSessions
+from src.instrumentation import PipelineStats
+from src.metrics import metrics_from_env
+from src.retention import LogJanitor, RetentionPolicy, lower_priority
+from src.sampler import HISTORY_COLUMNS, SessionHistory
+from src.statements import StatementTracker
+from src.triggers import read_pressure
+from src.writer import get_writer
+
+
+_STATE = HISTORY_COLUMNS.index("state")
+_WAIT_EVENT_TYPE = HISTORY_COLUMNS.index("wait_event_type")
+# Esperas que indicam disputa no servidor (sinal pg_waiting dos gatilhos)
+CONTENTION_WAITS = frozenset(("Lock", "LWLock", "IO", "BufferPin"))
+
+
+class CollectionError(Exception):
+    """Erro base para coletas que não puderam ser concluídas"""
+
+
+class CollectionTimeout(CollectionError):
+    """A coleta excedeu o prazo máximo definido"""
+
+
+class CollectionBusy(CollectionError):
+    """Uma coleta anterior do mesmo tipo ainda está em execução"""
+
+
+class CaptureEngine:
+    def __init__(self, load_monitor, targets, emit, collect_timeout=None, max_workers=None):
+        """
+        Inicializa o motor de captura
+
+        Todas as chamadas bloqueantes (psycopg2, psutil, escrita em disco) são
+        executadas em um executor dedicado, fora do loop de eventos. Os
+        resultados são entregues através da função emit(evento, **dados).
+
+        Args:
+            load_monitor: Instância de LoadMonitor
+            targets: Lista de PostgresMonitor, um por servidor monitorado.
+                     Todos os alvos são amostrados concorrentemente
+            emit: Função chamada no loop de eventos para cada evento produzido
+            collect_timeout: Prazo máximo (segundos) de cada coleta.
+                            Se None, lê do ambiente MONITOR_COLLECT_TIMEOUT
+                            ou usa o intervalo de verificação
+            max_workers: Número de threads do executor de coleta.
+                         Se None, uma por alvo mais uma folga para o sistema
+        """
+        self.load_monitor = load_monitor
+        self.targets = list(targets)
+        self.emit = emit
+
+        # Exportador /metrics opcional (MONITOR_METRICS_PORT): os eventos
+        # passam pelas métricas antes de chegar à interface ou ao registro
+        self.metrics, self.metrics_server = metrics_from_env()
+        if self.metrics is not None:
+            self.emit = self.metrics.observe(emit)
+
+        self.check_interval = load_monitor.check_interval
+        self.capture_interval = load_monitor.capture_interval
+
+        if collect_timeout is None:
+            collect_timeout = float(os.environ.get(
+                'MONITOR_COLLECT_TIMEOUT', str(self.check_interval)))
+        self.collect_timeout = collect_timeout
+
+        if max_workers is None:
+            max_workers = len(self.targets) + 4
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="monitor-coleta")
+        # Coletas em andamento, por nome, para não empilhar chamadas travadas
+        self._pending = {}
+
+        # Histórico contínuo de sessões por alvo (desativado com intervalo 0)
+        self.sample_interval = float(os.environ.get('MONITOR_SAMPLE_INTERVAL', '1'))
+        self.histories = {}
+        if self.sample_interval > 0:
+            self.histories = {target.label: SessionHistory(interval=self.sample_interval)
+                              for target in self.targets}
+
+        # Cada episódio de load alto vai para um arquivo de incidente por alvo;
+        # "full" grava cada captura por completo e "delta" só as sessões que mudaram
+        self.capture_mode = os.environ.get('MONITOR_CAPTURE_MODE', 'full')
+        self.incident = None
+
+        # Agregado por fingerprint das capturas do episódio atual, por alvo
+        self.aggregators = {}
+        # Consumo por comando (pg_stat_statements) no episódio atual, por alvo
+        self.statements = {}
+
+        # Sinais do PostgreSQL para os gatilhos, da última amostra de cada alvo
+        self.session_signals = {}
+        # Informações do sistema da última verificação, para reavaliar os
+        # gatilhos a cada amostra sem ler CPU e memória de novo
+        self.last_system_info = None
+        # Acorda o loop de verificação quando uma amostra muda o estado de load
+        # alto (criado no loop de eventos, em run)
+        self._wake = None
+
+        # Taxas de atividade de cada servidor (pg_stat_database, checkpoints e
+        # WAL), lidas a cada verificação (MONITOR_DATABASE_STATS=0 desativa)
+        self.database_rates = {}
+        if os.environ.get('MONITOR_DATABASE_STATS', '1').lower() not in ('0', 'false', 'no'):
+            self.database_rates = {target.label: DatabaseRates() for target in self.targets}
+        self.database_signals = {}
+
+        # Tempos das etapas de coleta e ciclos perdidos (MONITOR_INSTRUMENTATION)
+        self.pipeline = PipelineStats()
+
+        # Thread de gravação dos arquivos de captura (None se síncrona)
+        self.writer = get_writer()
+
+        # Retenção e compactação do diretório de logs, em uma thread própria de
+        # baixa prioridade, para não disputar CPU e disco com as coletas
+        self.janitor = None
+        self.retention_executor = None
+        policy = RetentionPolicy()
+        if policy.enabled and self.targets:
+            self.janitor = LogJanitor(self.targets[0].log_root, policy)
+            self.retention_executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="monitor-retencao", initializer=lower_priority)
+
+        self.high_load_time = None
+        self.last_log_time = None
+
+    async def collect(self, name, func, *args, cancel=None, timeout=None):
+        """
+        Executa func(*args) no executor respeitando o prazo máximo
+
+        Args:
+            name: Nome da coleta (uma só coleta de cada nome por vez)
+            func: Função bloqueante a executar
+            cancel: Função chamada se o prazo expirar, para interromper a coleta
+            timeout: Prazo desta coleta. Se None, usa collect_timeout
+
+        Raises:
+            CollectionBusy: Se a coleta anterior de mesmo nome não terminou
+            CollectionTimeout: Se o prazo expirou
+        """
+        if timeout is None:
+            timeout = self.collect_timeout
+
+        pending = self._pending.get(name)
+        if pending is not None and not pending.done():
+            raise CollectionBusy(f"Coleta '{name}' anterior ainda em execução")
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, func, *args)
+        self._pending[name] = future
+
+        try:
+            # shield: o prazo expira para o loop, mas a thread segue sendo rastreada
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if cancel is not None:
+                try:
+                    cancel()
+                except Exception as e:
+                    print(f"Erro ao cancelar coleta '{name}': {e}")
+            raise CollectionTimeout(
+                f"Coleta '{name}' excedeu o prazo de {timeout:g}s")
+
+    async def system_info(self):
+        """Coleta as informações do sistema; None se a coleta falhar"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            info = await self.collect("system", self.load_monitor.get_system_info)
+        except CollectionError as e:
+            self.emit("notice", message=str(e), severity="warning")
+            return None
+        self.pipeline.record("system", (loop.time() - started) * 1000)
+        return info
+
+    async def sample_database(self, target):
+        """Lê os contadores de atividade de um alvo e emite as taxas por segundo"""
+        try:
+            counters = await self.collect(f"database:{target.label}", target.database_stats)
+        except CollectionError as e:
+            self.emit("notice", message=f"[{target.label}] {e}", severity="warning")
+            counters = None
+        if counters is None:
+            # Sem leitura, os sinais do alvo deixam de valer para os gatilhos
+            self.database_signals.pop(target.label, None)
+            return
+
+        rates = self.database_rates[target.label].update(counters, time.monotonic())
+        if rates is None:
+            return
+        self.database_signals[target.label] = {
+            f"db_{name}": value for name, value in rates.items()
+            if value is not None and name != "hit_ratio"}
+        self.emit("database_stats", target=target.label, rates=rates)
+
+    async def tick(self):
+        """Executa um ciclo de verificação de load e, se necessário, de captura"""
+        # Sistema e servidores são lidos em paralelo, antes da avaliação dos gatilhos
+        system_info, *_ = await asyncio.gather(
+            self.system_info(),
+            *(self.sample_database(target) for target in self.targets
+              if target.label in self.database_rates))
+        self.last_system_info = system_info
+
+        # Sem as informações do sistema, as regras são avaliadas só com o load
+        # average e os sinais do PostgreSQL
+        self.load_monitor.check_load_status(self.trigger_signals(system_info))
+        if self.metrics is not None:
+            # O limiar pode ser alterado pela interface a qualquer momento
+            self.metrics.threshold.set(self.load_monitor.threshold)
+
+        if system_info is not None:
+            system_info["is_high_load"] = self.load_monitor.is_load_high
+            system_info["triggers"] = self.load_monitor.triggers.firing()
+            self.emit("system_info", info=system_info)
+
+        if self.histories:
+            stats = [history.stats() for history in self.histories.values()]
+            self.emit("history_stats",
+                      samples=sum(st["samples"] for st in stats),
+                      memory_bytes=sum(st["memory_bytes"] for st in stats))
+
+        # Custo das próprias coletas no servidor, por alvo
+        self.emit("collection_cost", costs={
+            target.label: {kind: cost.as_dict() for kind, cost in target.costs.items()}
+            for target in self.targets
+        })
+
+        writer_stats = None
+        if self.writer is not None:
+            writer_stats = self.writer.stats()
+            self.emit("writer_stats", stats=writer_stats)
+
+        if self.pipeline.enabled:
+            stats = self.pipeline.snapshot()
+            if writer_stats is not None and writer_stats["latency"]["count"]:
+                # Lotes gravados pela thread de gravação, fora das coletas
+                stats["stages"]["disk"] = writer_stats["latency"]
+            self.emit("pipeline_stats", stats=stats)
+
+        if self.load_monitor.is_load_high:
+            load = self.load_monitor.get_load_average()[0]
+            # Marca quando começou o load alto
+            if self.high_load_time is None:
+                self.high_load_time = datetime.now()
+                self.last_log_time = None
+                self.aggregators = {target.label: FingerprintAggregator()
+                                    for target in self.targets}
+                self.statements = {}
+                triggers = self.load_monitor.triggers.firing()
+                self.incident = Incident(self.high_load_time, load, triggers)
+                self.emit("high_load_start", load=load,
+                          threshold=self.load_monitor.threshold,
+                          triggers=triggers, incident=self.incident.id)
+                await self.open_incident()
+                # Snapshot inicial de pg_stat_statements, base das diferenças do episódio
+                await asyncio.gather(*(self.snapshot_statements(target) for target in self.targets))
+                await self.flush_histories()
+            else:
+                self.incident.update(load)
+
+            # Se é a primeira vez ou se passou o intervalo de captura desde o último log
+            current_time = datetime.now()
+            if self.last_log_time is None or \
+                    (current_time - self.last_log_time).total_seconds() >= self.capture_interval:
+                await self.capture()
+                self.last_log_time = current_time
+        elif self.high_load_time is not None:
+            # O load estava alto e agora está normal
+            duration = datetime.now() - self.high_load_time
+            self.emit("high_load_end", duration=duration.total_seconds(),
+                      incident=self.incident.id)
+            self.high_load_time = None
+            self.incident.close()
+            await self.summarize_incident()
+
+    def trigger_signals(self, system_info):
+        """Sinais do ciclo para as regras de disparo"""
+        signals = dict(system_info["signals"]) if system_info is not None else {}
+        # Com vários servidores, vale o que estiver em pior situação
+        for values in chain(self.session_signals.values(), self.database_signals.values()):
+            for name, value in values.items():
+                signals[name] = max(value, signals.get(name, value))
+        return signals
+
+    async def capture(self):
+        """Obtém e salva as consultas ativas de todos os alvos, em paralelo"""
+        # O ciclo custa o tempo do alvo mais lento, não a soma de todos
+        await asyncio.gather(*(self.capture_target(target) for target in self.targets),
+                             *(self.snapshot_statements(target) for target in self.targets))
+
+    async def snapshot_statements(self, target):
+        """Tira um snapshot de pg_stat_statements e o registra no episódio atual"""
+        try:
+            # Sem cancelamento: cancelaria também a captura que roda em paralelo;
+            # o statement_timeout da sessão limita a consulta no servidor
+            snapshot = await self.collect(
+                f"statements:{target.label}", target.statements_snapshot)
+        except CollectionError as e:
+            self.emit("notice", message=f"[{target.label}] {e}", severity="warning")
+            return
+        if snapshot is None:
+            return
+
+        tracker = self.statements.get(target.label)
+        if tracker is None:
+            self.statements[target.label] = StatementTracker(snapshot)
+        else:
+            tracker.update(snapshot)
+
+    async def capture_target(self, target):
+        """Obtém e salva as consultas ativas de um alvo, fora do loop de eventos"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+
+        incident_writer = longest = None
+        if self.incident is not None:
+            incident_writer = self.incident.writers.get(target.label)
+            longest = self.incident.longest.get(target.label)
+        aggregator = self.aggregators.get(target.label)
+
+        def stream():
+            # Leitura, normalização, gravação e indexação em um único passe,
+            # fora do loop de eventos e sem materializar a captura em memória
+            streaming = time.perf_counter()
+            sessions = target.iter_active_queries()
+            first = next(sessions, None)
+            if first is None:
+                return None, 0, [], target.last_timings, False
+            sessions = chain((first,), sessions)
+            if target.resources is not None:
+                sessions = target.resources.annotate(sessions)
+            if aggregator is not None:
+                sessions = aggregator.observe(sessions)
+            if longest is not None:
+                sessions = longest.observe(sessions)
+            writer = incident_writer
+            dropped = writer.dropped if writer is not None else 0
+            try:
+                if writer is not None:
+                    summary = target.store_capture(writer, sessions, self.high_load_time)
+                else:
+                    writer = target.queries_writer()
+                    summary = target.store_capture(writer, sessions)
+            finally:
+                if writer is not None and writer is not incident_writer:
+                    writer.close()
+            # As etapas se intercalam no streaming: a gravação (fingerprints,
+            # arquivo e índice) é o que resta do tempo total
+            timings = dict(target.last_timings)
+            if timings and target.resources is not None:
+                timings["proc"] = target.resources.last_elapsed_ms
+            if timings:
+                total_ms = (time.perf_counter() - streaming) * 1000
+                timings["write"] = max(0.0, total_ms - sum(timings.values()))
+            return (writer.path, summary.sessions, writer.last_blockers, timings,
+                    writer.dropped > dropped)
+
+        try:
+            log_path, count, blockers, timings, dropped = await self.collect(
+                f"queries:{target.label}", stream, cancel=target.cancel)
+        except (CollectionError, OSError) as e:
+            self.emit("target_status", target=target.label, ok=False, message=str(e))
+            self.emit("notice", message=f"[{target.label}] {e}", severity="error")
+            return
+
+        if target.last_error:
+            self.emit("target_status", target=target.label, ok=False,
+                      message=target.last_error)
+            return
+
+        # Lista vazia também é emitida, para limpar os bloqueadores exibidos
+        self.emit("lock_blockers", target=target.label, blockers=blockers)
+
+        if not count:
+            self.emit("target_status", target=target.label, ok=True,
+                      message="Nenhuma consulta ativa")
+            self.emit("capture_empty", target=target.label)
+            return
+
+        elapsed = loop.time() - started
+        if dropped:
+            # Fila de gravação cheia: a captura foi lida e agregada, mas não gravada
+            self.emit("target_status", target=target.label, ok=True,
+                      message=f"{count} consultas, captura descartada (fila de gravação cheia)")
+            self.emit("capture_dropped", target=target.label, count=count)
+            return
+
+        self.pipeline.record_stages(timings)
+        self.pipeline.record("capture", elapsed * 1000)
+        self.emit("target_status", target=target.label, ok=True,
+                  message=f"{count} consultas em {elapsed:.1f}s")
+        self.emit("capture_saved", target=target.label, path=log_path, count=count,
+                  elapsed=elapsed)
+
+    async def open_incident(self):
+        """Cria o arquivo do incidente de cada alvo, onde vai todo o episódio"""
+        delta = self.capture_mode == "delta"
+        for target in self.targets:
+            writer = target.incident_writer(self.incident, delta)
+            self.incident.writers[target.label] = writer
+            self.incident.longest[target.label] = LongestSessions()
+            try:
+                await self.collect(f"incident:{target.label}", target.open_incident,
+                                   writer, self.incident.start)
+            except (CollectionError, OSError) as e:
+                self.emit("notice", message=f"[{target.label}] {e}", severity="error")
+
+    async def summarize_incident(self):
+        """
+        Encerra o incidente: grava o resumo em cada arquivo e o emite
+
+        O resumo inclui os fingerprints que mais consumiram tempo nas
+        capturas, as sessões mais longas e os comandos de pg_stat_statements
+        que mais consumiram tempo de execução durante o próprio episódio.
+        """
+        incident = self.incident
+        for target in self.targets:
+            queryids = self.summary_queryids(target)
+            texts = {}
+            if queryids:
+                try:
+                    texts = await self.collect(
+                        f"statement_texts:{target.label}", target.statement_texts, queryids)
+                except CollectionError:
+                    pass
+
+            writer = incident.writers.get(target.label)
+            summary = self.incident_summary(target, texts)
+            if writer is not None:
+                try:
+                    await self.collect(f"incident:{target.label}", target.close_incident,
+                                       writer, summary, incident.end)
+                except (CollectionError, OSError) as e:
+                    self.emit("notice", message=f"[{target.label}] {e}", severity="error")
+                self.report_delta_savings(target.label, writer)
+
+            self.emit("incident_summary", path=writer.path if writer is not None else None,
+                      **summary)
+        self.incident = None
+        self.aggregators = {}
+        self.statements = {}
+
+    def summary_queryids(self, target):
+        """queryid dos comandos de pg_stat_statements do resumo do incidente de um alvo"""
+        tracker = self.statements.get(target.label)
+        return [statement["queryid"] for statement in tracker.top(5)] \
+            if tracker is not None else []
+
+    def incident_summary(self, target, texts, interrupted=False):
+        """
+        Resumo do incidente atual de um alvo, encerrado ou interrompido
+
+        Args:
+            target: PostgresMonitor do alvo
+            texts: Dicionário queryid -> SQL dos comandos de summary_queryids()
+            interrupted: Se o monitor foi encerrado com o incidente em andamento
+        """
+        tracker = self.statements.get(target.label)
+        statements = tracker.top(5) if tracker is not None else []
+        # Os textos só são lidos para os comandos do resumo
+        for statement in statements:
+            statement["query"] = texts.get(statement["queryid"])
+        writer = self.incident.writers.get(target.label)
+        return self.incident.summary(
+            target.label, self.aggregators.get(target.label), statements,
+            interrupted=interrupted, dropped=writer.dropped if writer is not None else 0)
+
+    def report_delta_savings(self, label, writer):
+        """Informa a economia da captura delta em um arquivo de incidente encerrado"""
+        if writer.delta and writer.full_equivalent_bytes:
+            saved = 100 * (1 - writer.raw_bytes / writer.full_equivalent_bytes)
+            self.emit("notice", severity="information",
+                      message=f"[{label}] Captura delta: {writer.captures} capturas, "
+                              f"{writer.raw_bytes / 1024:.0f} KB "
+                              f"({saved:.0f}% menor que a captura completa)")
+
+    def interrupt_incident(self):
+        """Grava o resumo parcial do incidente em andamento ao encerrar o monitor"""
+        incident = self.incident
+        if incident is None:
+            return
+        incident.close()
+        for target in self.targets:
+            writer = incident.writers.get(target.label)
+            if writer is None:
+                continue
+            # Fora do loop de eventos: os textos são lidos aqui mesmo, com o
+            # statement_timeout da sessão como limite
+            queryids = self.summary_queryids(target)
+            texts = target.statement_texts(queryids) if queryids else {}
+            summary = self.incident_summary(target, texts, interrupted=True)
+            try:
+                target.close_incident(writer, summary, incident.end)
+            except OSError as e:
+                print(f"Erro ao encerrar o incidente ({target.label}): {e}")
+        self.incident = None
+
+    async def sample(self, target):
+        """Amostra as sessões de um alvo e guarda no seu histórico"""
+        started = time.perf_counter()
+        try:
+            rows = await self.collect(
+                f"sample:{target.label}", target.sample_activity,
+                timeout=max(1.0, 2 * self.sample_interval))
+        except CollectionError:
+            # Amostras perdidas não interrompem o histórico
+            return
+        if rows is None:
+            # Falha na leitura não é ausência de sessões: os sinais e a visão
+            # em tempo real ficam com a última amostra válida
+            return
+        self.pipeline.record("sample", (time.perf_counter() - started) * 1000)
+        timestamp = time.time()
+        if rows:
+            self.histories[target.label].add(timestamp, rows, os.getloadavg())
+
+        active = waiting = lock_waiting = 0
+        for row in rows:
+            if row[_STATE] == "active":
+                active += 1
+                wait = row[_WAIT_EVENT_TYPE]
+                if wait in CONTENTION_WAITS:
+                    waiting += 1
+                    if wait == "Lock":
+                        lock_waiting += 1
+        self.session_signals[target.label] = {
+            "pg_active": active, "pg_waiting": waiting, "pg_lock_waiting": lock_waiting}
+
+        # Também alimenta a visão de sessões em tempo real (lista vazia limpa a visão)
+        self.emit("sessions", target=target.label, timestamp=timestamp, rows=rows)
+
+    async def flush_histories(self):
+        """Grava no arquivo do incidente o histórico anterior ao load alto de cada alvo"""
+        for target in self.targets:
+            history = self.histories.get(target.label)
+            writer = self.incident.writers.get(target.label)
+            if not history or writer is None:
+                continue
+            # A cópia é feita no loop, onde o histórico é alterado; as amostras
+            # posteriores ao disparo já fazem parte do incidente
+            cutoff = self.incident.start.timestamp()
+            samples = [sample for sample in history.snapshot() if sample[0] <= cutoff]
+            if not samples:
+                continue
+            try:
+                path = await self.collect(
+                    f"history:{target.label}", target.store_history, writer, samples)
+            except (CollectionError, OSError) as e:
+                self.emit("notice", message=f"[{target.label}] {e}", severity="error")
+                continue
+            self.emit("history_saved", target=target.label,
+                      path=path, samples=len(samples))
+
+    async def pressure(self):
+        """Pressão de CPU, I/O e memória (PSI); vazio se a leitura falhar"""
+        try:
+            return await self.collect("pressure", read_pressure,
+                                      timeout=max(1.0, self.sample_interval))
+        except CollectionError:
+            return {}
+
+    async def sample_tick(self):
+        """
+        Amostra todos os alvos e reavalia as regras de disparo
+
+        As sessões e a pressão (PSI) são lidas a cada amostra, então as regras
+        são avaliadas também aqui, e não só a cada verificação: um episódio é
+        detectado na cadência do amostrador. CPU e taxas do servidor ficam com
+        os valores da última verificação. Se o estado de load alto mudar, o
+        loop de verificação é acordado para abrir ou encerrar o incidente.
+
+        Returns:
+            True se o estado de load alto mudou
+        """
+        pressure, *_ = await asyncio.gather(
+            self.pressure(), *(self.sample(target) for target in self.targets))
+        signals = self.trigger_signals(self.last_system_info)
+        signals.update(pressure)
+        changed = self.load_monitor.check_load_status(signals)
+        if changed and self._wake is not None:
+            self._wake.set()
+        return changed
+
+    async def run_sampler(self, is_active):
+        """Loop do amostrador contínuo de sessões, na cadência de sample_interval"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            started = loop.time()
+            if is_active():
+                await self.sample_tick()
+                self.pipeline.cycle("sample", loop.time() - started, self.sample_interval)
+            elapsed = loop.time() - started
+            await asyncio.sleep(max(0.0, self.sample_interval - elapsed))
+
+    async def run_retention(self):
+        """Loop da retenção e compactação dos logs, a cada intervalo da política"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            # Com um incidente aberto o disco fica para as capturas: só os
+            # limites são aplicados, e nunca aos arquivos em gravação
+            in_use = [writer.path for writer in self.incident.writers.values()] \
+                if self.incident is not None else []
+            try:
+                result = await loop.run_in_executor(
+                    self.retention_executor, self.janitor.run, in_use, self.incident is None)
+            except OSError as e:
+                self.emit("notice", message=f"Erro na retenção dos logs: {e}", severity="error")
+            else:
+                self.emit("retention", **result)
+            await asyncio.sleep(self.janitor.policy.interval)
+
+    async def run(self, is_active):
+        """
+        Loop principal de monitoramento
+
+        Mantém a cadência de check_interval descontando o tempo gasto em cada
+        ciclo, de modo que uma coleta lenta não atrasa as verificações seguintes.
+        Uma mudança de estado detectada pelo amostrador antecipa a verificação.
+
+        Args:
+            is_active: Função que indica se o monitoramento está ativo
+        """
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+
+        self._wake = asyncio.Event()
+        sampler = None
+        if self.histories:
+            sampler = asyncio.ensure_future(self.run_sampler(is_active))
+        retention = None
+        if self.janitor is not None:
+            retention = asyncio.ensure_future(self.run_retention())
+
+        try:
+            await self._run_checks(is_active)
+        finally:
+            if sampler is not None:
+                sampler.cancel()
+            if retention is not None:
+                retention.cancel()
+            if self.metrics_server is not None:
+                self.metrics_server.stop()
+
+    async def _run_checks(self, is_active):
+        """Loop de verificação de load e captura"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            if not is_active():
+                await asyncio.sleep(1)
+                continue
+
+            started = loop.time()
+            self._wake.clear()
+            await self.tick()
+
+            # Espera apenas o que resta do intervalo de verificação, ou até o
+            # amostrador detectar uma mudança de estado
+            elapsed = loop.time() - started
+            self.pipeline.cycle("check", elapsed, self.check_interval)
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(0.0, self.check_interval - elapsed))
+            except asyncio.TimeoutError:
+                pass
+
+    def shutdown(self):
+        """Encerra o executor sem aguardar coletas travadas"""
+        self.interrupt_incident()
+        # O que já está na fila de gravação vai para o disco, com um prazo
+        if self.writer is not None and not self.writer.flush(timeout=max(5.0, self.collect_timeout)):
+            print("Gravação pendente não concluída no prazo ao encerrar")
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        self.executor.shutdown(wait=False)
+        if self.janitor is not None:
+            # Uma compactação em andamento para no próximo arquivo
+            self.janitor.stop()
+            self.retention_executor.shutdown(wait=False)
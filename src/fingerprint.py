@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+import hashlib
+import os
+import re
+from collections import Counter
+from functools import lru_cache
+
+# Um único passe de regex separa os trechos que precisam de tratamento
+_TOKEN = re.compile(r"""
+      (?P<comment>--[^\n]*|/\*.*?\*/)
+    | (?P<string>[eE]'(?:[^'\\]|\\.|'')*'|[bBxXnNuU]?&?'(?:[^']|'')*')
+    | (?P<dollar>\$(?P<tag>[A-Za-z_]\w*)?\$.*?\$(?P=tag)?\$)
+    | (?P<param>\$\d+)
+    | (?P<quoted>"(?:[^"]|"")*")
+    | (?P<number>(?<![\w.$])(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?(?!\w))
+    | (?P<space>\s+)
+""", re.S | re.X)
+
+# Listas de literais: IN (?, ?, ?), ARRAY[?, ?] e VALUES (?, ?), (?, ?)
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.I)
+_ARRAY_LIST = re.compile(r"\bARRAY\s*\[\s*\?(?:\s*,\s*\?)*\s*\]", re.I)
+_VALUES_LIST = re.compile(
+    r"(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+")
+
+
+def _replace_token(match):
+    kind = match.lastgroup
+    if kind in ("string", "dollar", "param", "number"):
+        return "?"
+    if kind in ("comment", "space"):
+        return " "
+    return match.group(0)
+
+
+def normalize_query(sql):
+    """
+    Normaliza um SQL para agrupar execuções do mesmo comando
+
+    Substitui literais e parâmetros por ?, colapsa listas de literais,
+    remove comentários e reduz espaços em branco.
+    """
+    normalized = _TOKEN.sub(_replace_token, sql)
+    normalized = _IN_LIST.sub("IN (...)", normalized)
+    normalized = _ARRAY_LIST.sub("ARRAY[...]", normalized)
+    normalized = _VALUES_LIST.sub(r"\1, ...", normalized)
+    return " ".join(normalized.split()).rstrip(" ;")
+
+
+@lru_cache(maxsize=int(os.environ.get('MONITOR_FINGERPRINT_CACHE', '4096')))
+def fingerprint(sql):
+    """
+    Retorna (fingerprint, SQL normalizado) de um comando
+
+    O resultado fica em cache LRU pelo texto original, de modo que comandos
+    repetidos entre amostras não são normalizados novamente.
+    """
+    normalized = normalize_query(sql or "")
+    digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).hexdigest()
+    return digest, normalized
+
+
+def duration_seconds(duration):
+    """Converte a duração de uma sessão (timedelta, segundos ou None) para segundos"""
+    if duration is None:
+        return 0.0
+    if hasattr(duration, "total_seconds"):
+        return max(0.0, duration.total_seconds())
+    return max(0.0, float(duration))
+
+
+class FingerprintStats:
+    __slots__ = ("fingerprint", "query", "samples", "executions",
+                 "total_duration", "max_duration", "waits")
+
+    def __init__(self, fingerprint, query):
+        """Estatísticas acumuladas de um fingerprint"""
+        self.fingerprint = fingerprint
+        self.query = query
+        # Vezes em que o comando apareceu nas capturas
+        self.samples = 0
+        # Execuções distintas (pid, backend_start, query_start)
+        self.executions = 0
+        # Soma da maior duração observada de cada execução
+        self.total_duration = 0.0
+        self.max_duration = 0.0
+        # Amostras por evento de espera ("CPU" quando não está esperando)
+        self.waits = Counter()
+
+    def merge(self, other):
+        """Soma as estatísticas de outro agregado do mesmo fingerprint"""
+        self.samples += other.samples
+        self.executions += other.executions
+        self.total_duration += other.total_duration
+        self.max_duration = max(self.max_duration, other.max_duration)
+        self.waits.update(other.waits)
+
+    def as_dict(self):
+        return {
+            "fingerprint": self.fingerprint,
+            "query": self.query,
+            "samples": self.samples,
+            "executions": self.executions,
+            "total_duration": self.total_duration,
+            "max_duration": self.max_duration,
+            "waits": dict(self.waits),
+        }
+
+
+class FingerprintAggregator:
+    def __init__(self):
+        """
+        Agrega as sessões capturadas por fingerprint ao longo de um incidente
+
+        Uma mesma execução aparece em várias capturas enquanto está rodando; a
+        duração total soma apenas a maior duração observada de cada execução.
+        Só as execuções da última captura ficam em memória: uma execução que
+        some de uma captura já terminou, então a memória não cresce com a
+        duração do incidente.
+        """
+        self.stats = {}
+        # Maior duração já contabilizada de cada execução da captura anterior
+        # e da captura em andamento
+        self._executions = {}
+        self._current = {}
+        self.samples = 0
+
+    def add_session(self, session):
+        """Acrescenta uma sessão capturada ao agregado"""
+        digest, normalized = fingerprint(session.get("query") or "")
+        stats = self.stats.get(digest)
+        if stats is None:
+            stats = self.stats[digest] = FingerprintStats(digest, normalized)
+
+        duration = duration_seconds(session.get("duration"))
+        stats.samples += 1
+        stats.max_duration = max(stats.max_duration, duration)
+
+        wait_type = session.get("wait_event_type")
+        stats.waits[f"{wait_type}:{session.get('wait_event')}" if wait_type else "CPU"] += 1
+
+        key = (session.get("pid"), session.get("backend_start"), session.get("query_start"))
+        previous = self._current.get(key, self._executions.get(key))
+        if previous is None:
+            stats.executions += 1
+            stats.total_duration += duration
+            self._current[key] = duration
+        elif duration > previous:
+            stats.total_duration += duration - previous
+            self._current[key] = duration
+        else:
+            self._current[key] = previous
+
+    def observe(self, queries):
+        """
+        Agrega uma captura à medida que as sessões são consumidas
+
+        Permite encadear o agregado entre a leitura em streaming e a gravação
+        sem materializar a captura em uma lista.
+
+        Args:
+            queries: Iterável de sessões de get_active_queries()
+        """
+        for session in queries:
+            self.add_session(session)
+            yield session
+        self.samples += 1
+        # As execuções que não estão nesta captura terminaram
+        self._executions, self._current = self._current, {}
+
+    def add(self, queries):
+        """
+        Acrescenta uma captura ao agregado
+
+        Args:
+            queries: Lista de sessões de get_active_queries()
+        """
+        for _ in self.observe(queries):
+            pass
+
+    def top(self, n=10, key="total_duration"):
+        """
+        Retorna os fingerprints mais relevantes
+
+        Args:
+            n: Quantidade de fingerprints
+            key: Critério de ordenação: total_duration, max_duration,
+                 samples ou executions
+        """
+        return sorted(self.stats.values(), key=lambda s: getattr(s, key), reverse=True)[:n]
+
+
+class CaptureSummary:
+    __slots__ = ("sessions", "peak_duration", "_fingerprints")
+
+    def __init__(self):
+        """
+        Resumo de uma captura para o índice de logs
+
+        Calculado sessão a sessão durante a gravação: número de sessões, maior
+        duração e o fingerprint mais frequente.
+        """
+        self.sessions = 0
+        self.peak_duration = 0.0
+        # fingerprint -> [ocorrências, SQL normalizado]
+        self._fingerprints = {}
+
+    def add_session(self, session):
+        self.sessions += 1
+        self.peak_duration = max(self.peak_duration, duration_seconds(session.get("duration")))
+        digest, normalized = fingerprint(session.get("query") or "")
+        entry = self._fingerprints.get(digest)
+        if entry is None:
+            self._fingerprints[digest] = [1, normalized]
+        else:
+            entry[0] += 1
+
+    def observe(self, queries):
+        """Resume as sessões à medida que são consumidas"""
+        for session in queries:
+            self.add_session(session)
+            yield session
+
+    def top(self):
+        """Retorna (fingerprint, SQL normalizado) mais frequente, ou (None, None)"""
+        if not self._fingerprints:
+            return None, None
+        digest = max(self._fingerprints, key=lambda digest: self._fingerprints[digest][0])
+        return digest, self._fingerprints[digest][1]
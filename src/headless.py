@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Modo headless: o ciclo de verificação e captura sem a interface
+
+Executa o mesmo CaptureEngine usado pela interface, mas sem importar o
+Textual, para rodar como serviço (systemd) com pouca memória e início rápido.
+Cada evento do motor vira uma linha JSON na saída padrão; as mensagens de
+erro dos módulos, impressas como texto, vão para a saída de erro.
+"""
+import asyncio
+import json
+import os
+import signal
+import sys
+from contextlib import redirect_stdout
+from datetime import datetime
+
+# Eventos periódicos, registrados apenas no modo detalhado
+PERIODIC_EVENTS = frozenset(("system_info", "history_stats", "collection_cost", "pipeline_stats",
+                             "database_stats", "writer_stats"))
+# Eventos que só interessam à interface (amostras brutas de sessões)
+SKIPPED_EVENTS = frozenset(("sessions",))
+
+
+class EventLogger:
+    def __init__(self, stream=None, verbose=False):
+        """
+        Registra os eventos do motor como linhas JSON
+
+        Args:
+            stream: Arquivo de saída. Se None, usa a saída padrão atual
+            verbose: Se True, registra também os eventos periódicos
+        """
+        self.stream = stream or sys.stdout
+        self.verbose = verbose
+
+    def __call__(self, event, **data):
+        if event in SKIPPED_EVENTS or (event in PERIODIC_EVENTS and not self.verbose):
+            return
+        record = {"ts": datetime.now().isoformat(timespec="milliseconds"), "event": event}
+        record.update(data)
+        self.stream.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        self.stream.flush()
+
+
+async def run(threshold=None, verbose=False):
+    """
+    Executa o monitoramento até receber SIGTERM ou SIGINT
+
+    Args:
+        threshold: Limiar de load average. Se None, lê do ambiente MONITOR_THRESHOLD
+        verbose: Se True, registra também os eventos periódicos
+    """
+    from src.engine import CaptureEngine
+    from src.monitor import LoadMonitor
+    from src.targets import create_monitors
+
+    log = EventLogger(verbose=verbose)
+
+    # Os prints dos módulos não se misturam às linhas JSON
+    with redirect_stdout(sys.stderr):
+        engine = CaptureEngine(LoadMonitor(threshold), create_monitors(), emit=log)
+        log("started", pid=os.getpid(), targets=[target.label for target in engine.targets],
+            threshold=engine.load_monitor.threshold,
+            triggers=[rule.as_dict() for rule in engine.load_monitor.triggers.rules],
+            check_interval=engine.check_interval,
+            capture_interval=engine.capture_interval, capture_mode=engine.capture_mode)
+
+        loop = asyncio.get_running_loop()
+        task = asyncio.ensure_future(engine.run(lambda: True))
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, task.cancel)
+
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        finally:
+            engine.shutdown()
+            log("stopped")
+
+
+def main(threshold=None, verbose=False):
+    """Ponto de entrada do modo headless"""
+    asyncio.run(run(threshold, verbose))
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+Incidentes: os episódios de load alto como unidade de registro
+
+Cada episódio gera, por servidor, um único arquivo de captura append-only
+(pg_incident_<início>), com o header do incidente no início, as amostras do
+histórico anteriores ao disparo, todas as capturas do episódio e, ao
+encerrar, um registro "summary" com o resumo: início e fim, pico de load,
+gatilhos, número de capturas, fingerprints que mais consumiram tempo, sessões
+mais longas e comandos do pg_stat_statements.
+"""
+from datetime import datetime
+
+from src.fingerprint import duration_seconds
+
+# Prefixo dos arquivos de incidente
+INCIDENT_PREFIX = "pg_incident_"
+# Itens de cada lista do resumo
+SUMMARY_ITEMS = 5
+# Tamanho máximo do SQL guardado no resumo
+SUMMARY_QUERY_CHARS = 500
+
+
+def incident_filename(start, extension):
+    """Nome do arquivo de um incidente, pelo momento de início"""
+    return f"{INCIDENT_PREFIX}{start.strftime('%Y%m%d_%H%M%S')}{extension}"
+
+
+class LongestSessions:
+    def __init__(self, n=SUMMARY_ITEMS):
+        """
+        Mantém as execuções mais longas vistas nas capturas de um incidente
+
+        Cada execução (pid, backend_start, query_start) conta uma vez, com a
+        maior duração observada; a memória fica limitada a poucas vezes n.
+
+        Args:
+            n: Quantidade de execuções do resultado
+        """
+        self.n = n
+        # Chave da execução -> (duração em segundos, sessão resumida)
+        self._executions = {}
+
+    def add_session(self, session):
+        duration = duration_seconds(session.get("duration"))
+        key = (session.get("pid"), session.get("backend_start"), session.get("query_start"))
+        previous = self._executions.get(key)
+        if previous is not None and previous[0] >= duration:
+            return
+        if previous is None and len(self._executions) >= 4 * self.n:
+            # Descarta as mais curtas antes de crescer
+            self._executions = dict(sorted(
+                self._executions.items(), key=lambda item: item[1][0], reverse=True)[:self.n])
+            if duration <= min(value[0] for value in self._executions.values()):
+                return
+        query = session.get("query")
+        query_start = session.get("query_start")
+        self._executions[key] = (duration, {
+            "pid": session.get("pid"),
+            "usename": session.get("usename"),
+            "datname": session.get("datname"),
+            "query_start": query_start.isoformat() if isinstance(query_start, datetime)
+            else query_start,
+            "query": query[:SUMMARY_QUERY_CHARS] if query else query,
+        })
+
+    def observe(self, queries):
+        """Acompanha as sessões à medida que são consumidas"""
+        for session in queries:
+            self.add_session(session)
+            yield session
+
+    def top(self):
+        """Execuções mais longas, da maior para a menor, com a duração em segundos"""
+        ranked = sorted(self._executions.values(), key=lambda value: value[0], reverse=True)
+        return [dict(session, duration=duration) for duration, session in ranked[:self.n]]
+
+
+class Incident:
+    def __init__(self, start, load=None, triggers=()):
+        """
+        Episódio de load alto, do disparo até a normalização
+
+        Args:
+            start: Momento (datetime) em que o load alto foi detectado
+            load: Load average de 1 minuto no disparo
+            triggers: Descrições das regras que dispararam o episódio
+        """
+        self.start = start
+        self.end = None
+        self.peak_load = load or 0.0
+        self.triggers = list(triggers)
+        # Gravador do arquivo do incidente e sessões mais longas, por alvo
+        self.writers = {}
+        self.longest = {}
+
+    @property
+    def id(self):
+        """Identificador do incidente (o início, como nos nomes de arquivo)"""
+        return self.start.strftime("%Y%m%d_%H%M%S")
+
+    @property
+    def duration(self):
+        """Duração em segundos (até agora, se ainda estiver aberto)"""
+        return ((self.end or datetime.now()) - self.start).total_seconds()
+
+    def update(self, load):
+        """Registra o load average de uma verificação durante o episódio"""
+        self.peak_load = max(self.peak_load, load)
+
+    def close(self, end=None):
+        """Marca o fim do episódio"""
+        self.end = end or datetime.now()
+
+    def header(self):
+        """Campos do incidente gravados no header de cada arquivo"""
+        return {"incident": self.id, "start": self.start.isoformat(),
+                "triggers": self.triggers}
+
+    def summary(self, target, aggregator=None, statements=(), interrupted=False, dropped=0):
+        """
+        Resumo do incidente para um alvo, gravado ao fim do arquivo
+
+        Args:
+            target: Nome do alvo
+            aggregator: FingerprintAggregator das capturas do alvo
+            statements: Comandos de StatementTracker.top() (com o texto, se lido)
+            interrupted: Se o monitor foi encerrado com o episódio em andamento
+            dropped: Capturas descartadas com a fila de gravação cheia (lidas e
+                     agregadas no resumo, mas ausentes do arquivo)
+        """
+        longest = self.longest.get(target)
+        top = [stats.as_dict() for stats in aggregator.top(SUMMARY_ITEMS)] \
+            if aggregator is not None else []
+        for stats in top:
+            if stats["query"]:
+                stats["query"] = stats["query"][:SUMMARY_QUERY_CHARS]
+        return {
+            "incident": self.id,
+            "target": target,
+            "start": self.start.isoformat(),
+            "end": (self.end or datetime.now()).isoformat(),
+            "duration": self.duration,
+            "peak_load": round(self.peak_load, 2),
+            "triggers": self.triggers,
+            "captures": aggregator.samples if aggregator is not None else 0,
+            "dropped": dropped,
+            "top": top,
+            "longest": longest.top() if longest is not None else [],
+            "statements": list(statements),
+            "interrupted": interrupted,
+        }
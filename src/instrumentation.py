@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+Instrumentação do próprio monitor
+
+Mede quanto cada etapa da coleta custa (conexão, consulta, conversão das
+linhas, gravação, amostragem, informações do sistema) em histogramas de
+faixas fixas, e conta os ciclos que estouraram o intervalo configurado.
+Com MONITOR_INSTRUMENTATION=0 nada é medido e cada ponto de medição custa
+apenas um teste de atributo.
+"""
+import os
+from bisect import bisect_left
+
+# Limites superiores das faixas dos histogramas, em milissegundos
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+def instrumentation_enabled():
+    """Se a instrumentação está ativa no ambiente (MONITOR_INSTRUMENTATION, padrão: ativa)"""
+    return os.environ.get('MONITOR_INSTRUMENTATION', '1').lower() not in ('0', 'false', 'no')
+
+
+class LatencyHistogram:
+    __slots__ = ("counts", "count", "sum_ms", "max_ms")
+
+    def __init__(self):
+        """Histograma de latências com as faixas de BUCKETS_MS (e uma acima de todas)"""
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, elapsed_ms):
+        self.counts[bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+        self.count += 1
+        self.sum_ms += elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+
+    def quantile(self, q):
+        """
+        Estimativa do quantil q (0 a 1)
+
+        Interpola linearmente dentro da faixa em que o quantil cai; na faixa
+        acima de todas, usa o maior valor observado como limite.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if not bucket_count or seen + bucket_count < rank:
+                seen += bucket_count
+                continue
+            lower = BUCKETS_MS[index - 1] if index > 0 else 0.0
+            upper = BUCKETS_MS[index] if index < len(BUCKETS_MS) else self.max_ms
+            upper = min(upper, self.max_ms)
+            lower = min(lower, upper)
+            return lower + (upper - lower) * (rank - seen) / bucket_count
+        return self.max_ms
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum_ms": self.sum_ms,
+            "max_ms": self.max_ms,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": list(self.counts),
+        }
+
+
+class CycleStats:
+    __slots__ = ("cycles", "overruns", "missed")
+
+    def __init__(self):
+        """Contagem de ciclos de um loop e dos que estouraram o intervalo"""
+        self.cycles = 0
+        # Ciclos que levaram mais que o intervalo
+        self.overruns = 0
+        # Ciclos que deixaram de começar na hora por causa dos estouros
+        self.missed = 0
+
+    def as_dict(self):
+        return {"cycles": self.cycles, "overruns": self.overruns, "missed": self.missed}
+
+
+class PipelineStats:
+    def __init__(self, enabled=None):
+        """
+        Tempos das etapas de coleta e ciclos perdidos do monitor
+
+        Só é alterado pelo loop de eventos: as etapas executadas no executor
+        devolvem seus tempos junto com o resultado da coleta.
+
+        Args:
+            enabled: Se None, lê do ambiente MONITOR_INSTRUMENTATION (padrão: ativo)
+        """
+        if enabled is None:
+            enabled = instrumentation_enabled()
+        self.enabled = enabled
+        self.stages = {}
+        self.loops = {}
+
+    def record(self, stage, elapsed_ms):
+        """Registra a duração de uma etapa"""
+        if not self.enabled:
+            return
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = LatencyHistogram()
+        histogram.observe(elapsed_ms)
+
+    def record_stages(self, timings):
+        """Registra as durações de um dicionário etapa -> milissegundos"""
+        if not self.enabled:
+            return
+        for stage, elapsed_ms in timings.items():
+            self.record(stage, elapsed_ms)
+
+    def cycle(self, loop, elapsed, interval):
+        """
+        Registra um ciclo de um loop periódico
+
+        Args:
+            loop: Nome do loop ("check" ou "sample")
+            elapsed: Duração do ciclo em segundos
+            interval: Intervalo configurado do loop em segundos
+        """
+        if not self.enabled:
+            return
+        stats = self.loops.get(loop)
+        if stats is None:
+            stats = self.loops[loop] = CycleStats()
+        stats.cycles += 1
+        if interval > 0 and elapsed > interval:
+            stats.overruns += 1
+            # O próximo ciclo começa logo após este, sem esperar: os ciclos
+            # que deveriam ter começado durante o estouro foram perdidos
+            stats.missed += int(elapsed // interval)
+
+    def snapshot(self):
+        """Estado atual, em tipos simples, para a interface e a exportação"""
+        return {
+            "stages": {stage: histogram.as_dict() for stage, histogram in self.stages.items()},
+            "loops": {loop: stats.as_dict() for loop, stats in self.loops.items()},
+        }
@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+Grafo de espera por locks de uma captura
+
+Cada sessão esperando por lock traz a lista de pids que a bloqueiam
+(pg_blocking_pids). O grafo resolve, para cada sessão bloqueada, os
+bloqueadores raiz (os que não esperam por ninguém) e a profundidade da
+cadeia até eles.
+"""
+from collections import Counter
+
+# Caracteres do SQL guardados para descrever os bloqueadores raiz
+QUERY_PREVIEW = 120
+
+
+class LockGraph:
+    def __init__(self, blocked_by):
+        """
+        Resolve o grafo de espera
+
+        O percurso é iterativo (sem recursão) e cada sessão é visitada uma
+        única vez mesmo com milhares de sessões em espera. Ciclos (deadlocks
+        ainda não detectados pelo servidor) são resolvidos como um bloco: se
+        o ciclo espera por alguém fora dele, herda as raízes de fora; senão o
+        menor pid do ciclo passa a ser a raiz. O resultado não depende da
+        ordem das sessões.
+
+        Args:
+            blocked_by: Dicionário pid -> pids que bloqueiam a sessão
+        """
+        self.blocked_by = {pid: tuple(blockers) for pid, blockers in blocked_by.items() if blockers}
+        # Profundidade da cadeia: 0 para quem não espera, 1 para quem espera um
+        # bloqueador raiz, e assim por diante
+        self.depth = {}
+        # Bloqueadores raiz alcançados a partir de cada sessão
+        self.roots = {}
+        # Sessões que fazem parte de um ciclo de espera
+        self.cycles = set()
+        self._resolve()
+
+    def _resolve(self):
+        # Componentes fortemente conexos (Tarjan, iterativo): cada componente
+        # sai depois de todos os componentes pelos quais espera
+        blocked_by = self.blocked_by
+        index, low = {}, {}
+        stack, on_stack = [], set()
+
+        for start in blocked_by:
+            if start in index:
+                continue
+            index[start] = low[start] = len(index)
+            stack.append(start)
+            on_stack.add(start)
+            work = [(start, iter(blocked_by[start]))]
+
+            while work:
+                pid, blockers = work[-1]
+                for blocker in blockers:
+                    if blocker not in blocked_by:
+                        continue
+                    if blocker not in index:
+                        index[blocker] = low[blocker] = len(index)
+                        stack.append(blocker)
+                        on_stack.add(blocker)
+                        work.append((blocker, iter(blocked_by[blocker])))
+                        break
+                    if blocker in on_stack:
+                        low[pid] = min(low[pid], index[blocker])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[pid])
+                    if low[pid] == index[pid]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == pid:
+                                break
+                        self._resolve_component(component)
+
+    def _resolve_component(self, component):
+        depth, roots, blocked_by = self.depth, self.roots, self.blocked_by
+        members = set(component)
+        outside = {blocker for pid in component for blocker in blocked_by[pid]
+                   if blocker not in members}
+        if len(component) > 1 or component[0] in blocked_by[component[0]]:
+            self.cycles.update(component)
+
+        for blocker in outside:
+            if blocker not in depth:
+                depth[blocker] = 0
+                roots[blocker] = frozenset((blocker,))
+        if outside:
+            level = 1 + max(depth[blocker] for blocker in outside)
+            reached = frozenset().union(*(roots[blocker] for blocker in outside))
+            for pid in component:
+                depth[pid] = level
+                roots[pid] = reached
+            return
+
+        # Ciclo que só espera por si mesmo: o menor pid é a raiz
+        root = min(component)
+        for pid in component:
+            depth[pid] = 0 if pid == root else 1
+            roots[pid] = frozenset((root,))
+
+    def root_blockers(self):
+        """
+        Bloqueadores raiz, dos que mais bloqueiam para os que menos bloqueiam
+
+        Returns:
+            Lista de dicionários com pid, blocked (sessões bloqueadas direta ou
+            indiretamente), depth (maior cadeia abaixo do bloqueador) e cycle
+        """
+        blocked = Counter()
+        max_depth = {}
+        for pid in self.blocked_by:
+            for root in self.roots[pid]:
+                if root == pid:
+                    continue
+                blocked[root] += 1
+                max_depth[root] = max(max_depth.get(root, 0), self.depth[pid] - self.depth[root])
+        return [
+            {"pid": root, "blocked": count, "depth": max_depth[root], "cycle": root in self.cycles}
+            for root, count in blocked.most_common()
+        ]
+
+
+class BlockingCollector:
+    def __init__(self):
+        """
+        Acumula, sessão a sessão, o necessário para o grafo de espera
+
+        Guarda a lista de bloqueadores das sessões em espera e uma descrição
+        curta de cada sessão, para identificar os bloqueadores raiz.
+        """
+        self.blocked_by = {}
+        self.sessions = {}
+
+    def add_session(self, session):
+        pid = session.get("pid")
+        query = session.get("query")
+        self.sessions[pid] = (session.get("usename"), session.get("state"),
+                              query[:QUERY_PREVIEW] if query else query)
+        blockers = session.get("blocked_by")
+        if blockers:
+            self.blocked_by[pid] = blockers
+
+    def root_blockers(self):
+        """Bloqueadores raiz da captura, com usuário, estado e início do SQL"""
+        if not self.blocked_by:
+            return []
+        result = LockGraph(self.blocked_by).root_blockers()
+        for root in result:
+            # Bloqueadores fora da captura (ex.: sessões ociosas) ficam sem descrição
+            root["usename"], root["state"], root["query"] = \
+                self.sessions.get(root["pid"], (None, None, None))
+        return result
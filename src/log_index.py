@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+import json
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+INDEX_FILENAME = "index.sqlite3"
+
+# Tipo de cada arquivo pelo prefixo do nome
+KIND_PREFIXES = (
+    ("pg_queries_", "queries"),
+    ("pg_history_", "history"),
+    ("pg_delta_", "delta"),
+    ("pg_incident_", "incident"),
+    ("pg_archive_", "archive"),
+)
+LOG_EXTENSIONS = ('.log', '.pgcap', '.pgcap.gz', '.pgcap.zst')
+
+# Data e hora no nome (os arquivos diários da compactação só têm a data)
+_TIMESTAMP = re.compile(r"_(\d{8})(?:_(\d{6}))?(?!\d)")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    path TEXT PRIMARY KEY,
+    target TEXT,
+    kind TEXT,
+    timestamp TEXT NOT NULL,
+    host TEXT,
+    sessions INTEGER,
+    peak_duration REAL,
+    top_fingerprint TEXT,
+    top_query TEXT,
+    end_timestamp TEXT,
+    peak_load REAL,
+    captures INTEGER,
+    triggers TEXT
+);
+CREATE INDEX IF NOT EXISTS captures_timestamp ON captures (timestamp);
+"""
+
+# Colunas acrescentadas depois da primeira versão do índice (dos incidentes)
+_ADDED_COLUMNS = (
+    ("end_timestamp", "TEXT"),
+    ("peak_load", "REAL"),
+    ("captures", "INTEGER"),
+    ("triggers", "TEXT"),
+)
+
+_UPSERT = """
+    INSERT INTO captures (path, target, kind, timestamp, host, sessions,
+                          peak_duration, top_fingerprint, top_query)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(path) DO UPDATE SET
+        target = coalesce(target, excluded.target),
+        host = coalesce(host, excluded.host),
+        sessions = max(coalesce(sessions, 0), coalesce(excluded.sessions, 0)),
+        top_fingerprint = CASE WHEN coalesce(excluded.peak_duration, 0)
+            >= coalesce(peak_duration, 0)
+            THEN excluded.top_fingerprint ELSE top_fingerprint END,
+        top_query = CASE WHEN coalesce(excluded.peak_duration, 0)
+            >= coalesce(peak_duration, 0)
+            THEN excluded.top_query ELSE top_query END,
+        peak_duration = max(coalesce(peak_duration, 0),
+                            coalesce(excluded.peak_duration, 0))
+"""
+
+# Caminhos por comando nas consultas com IN (abaixo do limite de variáveis do SQLite)
+_CHUNK = 500
+
+# Índices abertos, um por diretório de logs
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(log_root=None):
+    """
+    Retorna o índice compartilhado de um diretório de logs
+
+    Args:
+        log_root: Diretório raiz dos logs. Se None, usa logs/ no diretório atual
+    """
+    log_root = os.path.abspath(log_root or os.path.join(os.getcwd(), "logs"))
+    with _indexes_lock:
+        index = _indexes.get(log_root)
+        if index is None:
+            index = _indexes[log_root] = LogIndex(log_root)
+        return index
+
+
+def file_kind(filename):
+    """Tipo do arquivo (queries, history, delta, incident, archive) pelo prefixo do nome"""
+    basename = os.path.basename(filename)
+    for prefix, kind in KIND_PREFIXES:
+        if basename.startswith(prefix):
+            return kind
+    return None
+
+
+def file_timestamp(path):
+    """Momento de um arquivo de log pelo nome, ou pela data de modificação"""
+    match = _TIMESTAMP.search(os.path.basename(path))
+    try:
+        return datetime.strptime(match.group(1) + (match.group(2) or "000000"), "%Y%m%d%H%M%S")
+    except (AttributeError, ValueError):
+        return datetime.fromtimestamp(os.path.getmtime(path))
+
+
+class LogIndex:
+    def __init__(self, log_root):
+        """
+        Índice persistente (SQLite) dos arquivos de captura
+
+        Atualizado a cada arquivo gravado, substitui a listagem e ordenação
+        do diretório de logs na interface, inclusive para paginação e busca.
+        Os arquivos de incidente recebem também o fim, o pico de load, o
+        número de capturas e os gatilhos do episódio quando ele se encerra.
+
+        Args:
+            log_root: Diretório raiz dos logs; o índice fica em log_root/index.sqlite3
+        """
+        self.log_root = log_root
+        os.makedirs(log_root, exist_ok=True)
+        self.path = os.path.join(log_root, INDEX_FILENAME)
+
+        # Uma só conexão compartilhada entre as threads, protegida por lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # Com WAL, NORMAL só sincroniza no checkpoint: um commit por
+            # captura não custa um fsync, e o índice pode ser refeito (rebuild)
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+            existing = {row[1] for row in self._conn.execute("PRAGMA table_info(captures)")}
+            for column, kind in _ADDED_COLUMNS:
+                if column not in existing:
+                    self._conn.execute(f"ALTER TABLE captures ADD COLUMN {column} {kind}")
+
+        # Diretórios com logs anteriores ao índice são indexados uma única vez
+        if self.count() == 0:
+            self.rebuild()
+
+    def relpath(self, path):
+        return os.path.relpath(os.path.abspath(path), self.log_root)
+
+    def add(self, path, timestamp, target=None, host=None, sessions=None,
+            peak_duration=None, top_fingerprint=None, top_query=None):
+        """
+        Registra ou atualiza um arquivo no índice
+
+        Em arquivos que recebem várias capturas (episódios delta), o número de
+        sessões e a maior duração acumulam o máximo observado.
+
+        Args:
+            path: Caminho do arquivo de captura
+            timestamp: Momento (datetime) do arquivo
+        """
+        with self._lock, self._conn:
+            self._conn.execute(_UPSERT, (self.relpath(path), target, file_kind(path),
+                  timestamp.strftime("%Y-%m-%d %H:%M:%S"), host, sessions,
+                  peak_duration, top_fingerprint, top_query))
+
+    def close_incident(self, path, end, peak_load, captures, triggers=(),
+                       top_fingerprint=None, top_query=None):
+        """
+        Registra o resumo de um arquivo de incidente encerrado
+
+        Args:
+            path: Arquivo do incidente
+            end: Momento (datetime) do fim do episódio
+            peak_load: Maior load average de 1 minuto do episódio
+            captures: Número de capturas gravadas
+            triggers: Descrições das regras que dispararam o episódio
+            top_fingerprint: Fingerprint que mais consumiu tempo
+            top_query: SQL normalizado desse fingerprint
+        """
+        with self._lock, self._conn:
+            self._conn.execute("""
+                UPDATE captures SET end_timestamp = ?, peak_load = ?, captures = ?,
+                    triggers = ?,
+                    top_fingerprint = coalesce(?, top_fingerprint),
+                    top_query = coalesce(?, top_query)
+                WHERE path = ?
+            """, (end.strftime("%Y-%m-%d %H:%M:%S"), peak_load, captures,
+                  ", ".join(triggers) or None, top_fingerprint, top_query, self.relpath(path)))
+
+    def remove(self, *paths):
+        """Remove arquivos do índice"""
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM captures WHERE path = ?",
+                                   [(self.relpath(path),) for path in paths])
+
+    def rename(self, path, new_path):
+        """Aponta o registro de um arquivo para o seu novo caminho (ex.: após comprimi-lo)"""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE captures SET path = ? WHERE path = ?",
+                               (self.relpath(new_path), self.relpath(path)))
+
+    def archive(self, path, timestamp, sources, captures, end, target=None):
+        """
+        Substitui no índice os arquivos compactados pelo arquivo diário que os reúne
+
+        O arquivo diário fica com o maior número de sessões e a maior duração
+        dos arquivos de origem, e acumula as capturas de compactações anteriores.
+
+        Args:
+            path: Arquivo diário
+            timestamp: Início (datetime) do dia
+            sources: Arquivos reunidos no arquivo diário
+            captures: Número de capturas dos arquivos de origem
+            end: Momento (datetime) do arquivo de origem mais recente
+            target: Nome do alvo
+        """
+        relative = [self.relpath(source) for source in sources]
+        with self._lock, self._conn:
+            rows = []
+            for start in range(0, len(relative), _CHUNK):
+                chunk = relative[start:start + _CHUNK]
+                rows.extend(self._conn.execute(
+                    f"SELECT host, sessions, peak_duration, top_fingerprint, top_query "
+                    f"FROM captures WHERE path IN ({','.join('?' * len(chunk))})", chunk))
+            self._conn.executemany("DELETE FROM captures WHERE path = ?",
+                                   [(source,) for source in relative])
+
+            host = next((row[0] for row in rows if row[0]), None)
+            sessions = max((row[1] for row in rows if row[1] is not None), default=None)
+            peak = max(rows, key=lambda row: row[2] or 0, default=(None,) * 5)
+            self._conn.execute(_UPSERT, (
+                self.relpath(path), target, file_kind(path),
+                timestamp.strftime("%Y-%m-%d %H:%M:%S"), host, sessions, peak[2], peak[3],
+                peak[4]))
+            self._conn.execute("""
+                UPDATE captures SET captures = coalesce(captures, 0) + ?,
+                    end_timestamp = max(coalesce(end_timestamp, ''), ?)
+                WHERE path = ?
+            """, (captures, end.strftime("%Y-%m-%d %H:%M:%S"), self.relpath(path)))
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            columns = [desc[0] for desc in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def count(self, search=None):
+        """Número de arquivos no índice (que casam com a busca, se informada)"""
+        where, params = self._where(search)
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT count(*) FROM captures {where}", params).fetchone()[0]
+
+    def recent(self, limit=20, offset=0, search=None):
+        """
+        Lista os arquivos do mais recente para o mais antigo
+
+        Args:
+            limit: Tamanho da página
+            offset: Quantidade de arquivos a pular
+            search: Texto buscado no caminho, servidor ou SQL de maior duração
+
+        Returns:
+            Lista de dicionários com as colunas do índice
+        """
+        where, params = self._where(search)
+        return self._query(
+            f"SELECT * FROM captures {where} ORDER BY timestamp DESC, path DESC LIMIT ? OFFSET ?",
+            params + (limit, offset))
+
+    def _where(self, search):
+        if not search:
+            return "", ()
+        pattern = f"%{search}%"
+        return ("WHERE path LIKE ? OR target LIKE ? OR host LIKE ? OR top_query LIKE ? "
+                "OR triggers LIKE ?",
+                (pattern, pattern, pattern, pattern, pattern))
+
+    def rebuild(self):
+        """
+        Indexa os arquivos já existentes no diretório de logs
+
+        Usa apenas o nome e a data dos arquivos, sem abri-los; dos arquivos
+        de incidente lê também o header e o resumo gravado no fim, com os
+        mesmos campos que o índice recebe durante o episódio (o número de
+        sessões, que só as capturas têm, fica de fora).
+        """
+        from src.capture_format import open_capture, read_summary
+
+        rows = []
+        for dirpath, _, filenames in os.walk(self.log_root):
+            target = os.path.relpath(dirpath, self.log_root)
+            for filename in filenames:
+                if not filename.endswith(LOG_EXTENSIONS) or file_kind(filename) is None:
+                    continue
+                path = os.path.join(dirpath, filename)
+                timestamp = file_timestamp(path)
+                host = None
+                incident = (None,) * 7
+                if file_kind(filename) == "incident":
+                    try:
+                        with open_capture(path) as f:
+                            header = json.loads(f.readline())
+                        if header.get("host"):
+                            host = f"{header['host']}:{header['port']}"
+                        summary = read_summary(path)
+                    except (OSError, ValueError, EOFError):
+                        summary = None
+                    if summary is not None:
+                        top = summary.get("top") or [{}]
+                        longest = summary.get("longest") or [{}]
+                        incident = (
+                            datetime.fromisoformat(summary["end"]).strftime("%Y-%m-%d %H:%M:%S"),
+                            summary.get("peak_load"), summary.get("captures"),
+                            ", ".join(summary.get("triggers") or ()) or None,
+                            top[0].get("fingerprint"), top[0].get("query"),
+                            longest[0].get("duration"))
+                rows.append((self.relpath(path), None if target == "." else target,
+                             file_kind(filename), timestamp.strftime("%Y-%m-%d %H:%M:%S"), host)
+                            + incident)
+
+        with self._lock, self._conn:
+            self._conn.executemany("""
+                INSERT OR IGNORE INTO captures (path, target, kind, timestamp, host,
+                                                end_timestamp, peak_load, captures, triggers,
+                                                top_fingerprint, top_query, peak_duration)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+        return len(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,416 @@
+#!/usr/bin/env python
+"""
+Exportação das métricas do monitor no formato OpenMetrics
+
+O MetricsRecorder acompanha os eventos do motor de captura e mantém os
+valores já calculados em memória; o MetricsServer atende /metrics em uma
+thread própria apenas formatando esses valores, de modo que uma coleta do
+Prometheus nunca consulta o PostgreSQL nem o disco.
+
+Os valores são escritos só pelo loop de eventos e lidos pela thread do
+servidor a partir de cópias das tabelas, sem locks: cada atribuição é
+atômica no interpretador e uma coleta vê, no pior caso, um valor do ciclo
+anterior.
+"""
+import math
+import os
+import threading
+from src.instrumentation import BUCKETS_MS
+from src.sampler import HISTORY_COLUMNS
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+_STATE = HISTORY_COLUMNS.index("state")
+_WAIT_EVENT_TYPE = HISTORY_COLUMNS.index("wait_event_type")
+
+
+class Metric:
+    __slots__ = ("name", "kind", "help", "labelnames", "values")
+
+    def __init__(self, name, kind, help, labelnames=()):
+        """
+        Família de métricas com valores por combinação de rótulos
+
+        Args:
+            name: Nome da família (sem o sufixo _total dos contadores)
+            kind: "gauge" ou "counter"
+            help: Descrição exibida na linha HELP
+            labelnames: Nomes dos rótulos, na ordem das tuplas de valores
+        """
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def set(self, value, *labels):
+        self.values[labels] = value
+
+    def inc(self, amount=1, *labels):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        """Linhas da família no formato OpenMetrics"""
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        sample = f"{self.name}_total" if self.kind == "counter" else self.name
+        # Cópia atômica: o loop de eventos pode incluir rótulos durante a coleta
+        for labels, value in sorted(list(self.values.items())):
+            if labels:
+                pairs = ",".join(f'{name}="{_escape(label)}"'
+                                 for name, label in zip(self.labelnames, labels))
+                lines.append(f"{sample}{{{pairs}}} {_number(value)}")
+            else:
+                lines.append(f"{sample} {_number(value)}")
+        return lines
+
+
+class Histogram(Metric):
+    __slots__ = ()
+
+    def __init__(self, name, help, labelnames=()):
+        """
+        Família de histogramas em segundos, com as faixas de BUCKETS_MS
+
+        Cada valor é uma tupla (contagens por faixa, total, soma em segundos),
+        com as contagens não acumuladas, como em LatencyHistogram.
+        """
+        super().__init__(name, "histogram", help, labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        bounds = [repr(bound / 1000) for bound in BUCKETS_MS] + ["+Inf"]
+        for labels, (counts, count, total) in sorted(list(self.values.items())):
+            pairs = "".join(f'{name}="{_escape(label)}",'
+                            for name, label in zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{pairs}le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_count{{{pairs.rstrip(',')}}} {count}")
+            lines.append(f"{self.name}_sum{{{pairs.rstrip(',')}}} {_number(total)}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    value = float(value)
+    # OpenMetrics só aceita NaN, +Inf e -Inf (repr daria nan, inf e -inf)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(value)
+
+
+class MetricsRecorder:
+    def __init__(self):
+        """
+        Métricas do monitor, atualizadas a partir dos eventos do motor
+
+        Use observe(emit) para interceptar os eventos antes de repassá-los
+        à interface ou ao registro do modo headless.
+        """
+        self.metrics = []
+        gauge = self._gauge
+        counter = self._counter
+
+        self.load = gauge("pgmonitor_load_average", "Load average do sistema", ("period",))
+        self.cpu = gauge("pgmonitor_cpu_percent", "Uso de CPU do sistema (%)")
+        self.cpu_modes = gauge("pgmonitor_cpu_mode_percent",
+                               "Uso de CPU do sistema por modo (%)", ("mode",))
+        self.cpu_cores = gauge("pgmonitor_cpu_core_percent",
+                               "Uso de CPU por núcleo (%)", ("core",))
+        self.memory = gauge("pgmonitor_memory_percent", "Uso de memória do sistema (%)")
+        self.threshold = gauge("pgmonitor_load_threshold", "Limiar de load average configurado")
+        self.high_load = gauge("pgmonitor_high_load", "1 durante um episódio de load alto")
+        self.incidents = counter("pgmonitor_high_load_episodes",
+                                 "Episódios de load alto iniciados")
+        self.incident_seconds = counter("pgmonitor_high_load_seconds",
+                                        "Duração acumulada dos episódios de load alto encerrados")
+
+        self.target_up = gauge("pgmonitor_target_up",
+                               "1 se a última coleta do servidor teve sucesso", ("target",))
+        self.sessions = gauge("pgmonitor_sessions",
+                              "Sessões não ociosas na última amostra", ("target", "state"))
+        self.waiting = gauge("pgmonitor_sessions_waiting",
+                             "Sessões em espera na última amostra", ("target", "wait_event_type"))
+        self.database = gauge("pgmonitor_db_rate",
+                              "Taxas por segundo de pg_stat_database, checkpoints e WAL "
+                              "(hit_ratio em %)", ("target", "stat"))
+        self.blockers = gauge("pgmonitor_lock_root_blockers",
+                              "Bloqueadores raiz de locks na última captura", ("target",))
+
+        self.captures = counter("pgmonitor_captures", "Capturas gravadas", ("target",))
+        self.captured_sessions = counter("pgmonitor_captured_sessions",
+                                         "Sessões gravadas nas capturas", ("target",))
+        self.capture_seconds = gauge("pgmonitor_last_capture_seconds",
+                                     "Duração da última captura (leitura e gravação)", ("target",))
+        self.collection_errors = counter("pgmonitor_collection_errors",
+                                         "Coletas de captura que falharam", ("target",))
+        self.history_saved = counter("pgmonitor_history_files",
+                                     "Arquivos de histórico gravados", ("target",))
+        self.history_bytes = gauge("pgmonitor_history_memory_bytes",
+                                   "Memória ocupada pelos históricos de sessões")
+        self.history_samples = gauge("pgmonitor_history_samples",
+                                     "Amostras guardadas nos históricos de sessões")
+        self.query_ms = gauge("pgmonitor_collection_query_ms",
+                              "Tempo médio por consulta do monitor, medido no cliente "
+                              "(servidor e rede)",
+                              ("target", "kind"))
+        self.query_count = gauge("pgmonitor_collection_queries",
+                                 "Consultas do monitor medidas", ("target", "kind"))
+
+        self.stage_seconds = self._add(Histogram(
+            "pgmonitor_stage_duration_seconds", "Duração das etapas de coleta do monitor",
+            ("stage",)))
+        self.loop_cycles = counter("pgmonitor_loop_cycles",
+                                   "Ciclos executados pelos loops do monitor", ("loop",))
+        self.loop_overruns = counter("pgmonitor_loop_overruns",
+                                     "Ciclos que levaram mais que o intervalo", ("loop",))
+        self.loop_missed = counter("pgmonitor_loop_missed_cycles",
+                                   "Ciclos que não começaram na hora por estouros", ("loop",))
+
+        self.write_queue_bytes = gauge("pgmonitor_write_queue_bytes",
+                                       "Bytes na fila da thread de gravação")
+        self.written_bytes = counter("pgmonitor_written_bytes",
+                                     "Bytes gravados pela thread de gravação")
+        self.dropped_captures = counter("pgmonitor_dropped_captures",
+                                        "Capturas descartadas com a fila de gravação cheia")
+        self.write_blocked = counter("pgmonitor_write_blocked_seconds",
+                                     "Tempo em que as coletas esperaram pela fila de gravação")
+        self.fsyncs = counter("pgmonitor_fsyncs", "fsync feitos pela thread de gravação")
+        self.write_errors = counter("pgmonitor_write_errors",
+                                    "Erros de gravação dos arquivos de captura")
+
+        self.log_bytes = gauge("pgmonitor_log_bytes", "Tamanho total do diretório de logs")
+        self.log_files = gauge("pgmonitor_log_files", "Arquivos no diretório de logs")
+        self.compacted_files = counter("pgmonitor_compacted_files",
+                                       "Arquivos reunidos nos arquivos diários ou comprimidos")
+        self.removed_files = counter("pgmonitor_retention_removed_files",
+                                     "Arquivos removidos pela retenção")
+        self.removed_bytes = counter("pgmonitor_retention_removed_bytes",
+                                     "Bytes liberados pela retenção")
+
+        self._handlers = {
+            "system_info": self._on_system_info,
+            "high_load_start": self._on_high_load_start,
+            "high_load_end": self._on_high_load_end,
+            "target_status": self._on_target_status,
+            "sessions": self._on_sessions,
+            "lock_blockers": self._on_lock_blockers,
+            "database_stats": self._on_database_stats,
+            "capture_saved": self._on_capture_saved,
+            "history_saved": self._on_history_saved,
+            "history_stats": self._on_history_stats,
+            "collection_cost": self._on_collection_cost,
+            "pipeline_stats": self._on_pipeline_stats,
+            "writer_stats": self._on_writer_stats,
+            "retention": self._on_retention,
+        }
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def _gauge(self, name, help, labelnames=()):
+        return self._add(Metric(name, "gauge", help, labelnames))
+
+    def _counter(self, name, help, labelnames=()):
+        return self._add(Metric(name, "counter", help, labelnames))
+
+    def observe(self, emit):
+        """Retorna uma função emit que registra cada evento antes de repassá-lo"""
+        def observed(event, **data):
+            handler = self._handlers.get(event)
+            if handler is not None:
+                try:
+                    handler(**data)
+                except Exception as e:
+                    print(f"Erro ao atualizar métricas ({event}): {e}")
+            emit(event, **data)
+        return observed
+
+    def render(self):
+        """Texto OpenMetrics de todas as métricas"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def _on_system_info(self, info):
+        for period, value in zip(("1m", "5m", "15m"), info["load_average"]):
+            self.load.set(value, period)
+        self.cpu.set(info["cpu_percent"])
+        cpu = info.get("cpu")
+        if cpu:
+            for mode in ("user", "system", "iowait", "steal"):
+                if mode in cpu:
+                    self.cpu_modes.set(cpu[mode], mode)
+            for core, usage in enumerate(cpu["per_core"]):
+                self.cpu_cores.set(usage["percent"], str(core))
+        self.memory.set(info["memory_percent"])
+        self.high_load.set(1 if info["is_high_load"] else 0)
+
+    def _on_high_load_start(self, load, threshold, triggers=None, incident=None):
+        self.high_load.set(1)
+        self.incidents.inc()
+
+    def _on_high_load_end(self, duration, incident=None):
+        self.high_load.set(0)
+        self.incident_seconds.inc(duration)
+
+    def _on_target_status(self, target, ok, message):
+        self.target_up.set(1 if ok else 0, target)
+        if not ok:
+            self.collection_errors.inc(1, target)
+
+    def _on_sessions(self, target, timestamp, rows):
+        states = {}
+        waits = {}
+        for row in rows:
+            state = row[_STATE] or "unknown"
+            states[state] = states.get(state, 0) + 1
+            wait = row[_WAIT_EVENT_TYPE]
+            if wait:
+                waits[wait] = waits.get(wait, 0) + 1
+        # Estados que sumiram da amostra voltam a zero em vez de ficarem congelados
+        for metric, counts in ((self.sessions, states), (self.waiting, waits)):
+            for labels in list(metric.values):
+                if labels[0] == target and labels[1] not in counts:
+                    metric.values[labels] = 0
+            for label, count in counts.items():
+                metric.set(count, target, label)
+
+    def _on_database_stats(self, target, rates):
+        for name, value in rates.items():
+            if value is not None:
+                self.database.set(value, target, name)
+
+    def _on_lock_blockers(self, target, blockers):
+        self.blockers.set(len(blockers), target)
+
+    def _on_capture_saved(self, target, path, count, elapsed=None):
+        self.captures.inc(1, target)
+        self.captured_sessions.inc(count, target)
+        if elapsed is not None:
+            self.capture_seconds.set(elapsed, target)
+
+    def _on_history_saved(self, target, path, samples):
+        self.history_saved.inc(1, target)
+
+    def _on_history_stats(self, samples, memory_bytes):
+        self.history_samples.set(samples)
+        self.history_bytes.set(memory_bytes)
+
+    def _on_collection_cost(self, costs):
+        for target, kinds in costs.items():
+            for kind, cost in kinds.items():
+                if cost["count"]:
+                    self.query_ms.set(cost["average_ms"], target, kind)
+                    self.query_count.set(cost["count"], target, kind)
+
+    def _on_pipeline_stats(self, stats):
+        for stage, histogram in stats["stages"].items():
+            self.stage_seconds.set(
+                (histogram["buckets"], histogram["count"], histogram["sum_ms"] / 1000), stage)
+        for loop, cycles in stats["loops"].items():
+            self.loop_cycles.set(cycles["cycles"], loop)
+            self.loop_overruns.set(cycles["overruns"], loop)
+            self.loop_missed.set(cycles["missed"], loop)
+
+    def _on_writer_stats(self, stats):
+        self.write_queue_bytes.set(stats["queued_bytes"])
+        self.written_bytes.set(stats["written_bytes"])
+        self.dropped_captures.set(stats["dropped_captures"])
+        self.write_blocked.set(stats["blocked_ms"] / 1000)
+        self.fsyncs.set(stats["fsyncs"])
+        self.write_errors.set(stats["errors"])
+
+    def _on_retention(self, compacted, archives, compressed, removed, removed_bytes,
+                      total_bytes, files):
+        self.compacted_files.inc(compacted + compressed)
+        self.removed_files.inc(removed)
+        self.removed_bytes.inc(removed_bytes)
+        self.log_bytes.set(total_bytes)
+        self.log_files.set(files)
+
+
+class MetricsServer:
+    def __init__(self, recorder, port, host="127.0.0.1"):
+        """
+        Servidor HTTP mínimo que atende /metrics em uma thread própria
+
+        Args:
+            recorder: MetricsRecorder com os valores a exportar
+            port: Porta TCP
+            host: Endereço de escuta (padrão: apenas local)
+        """
+        self.recorder = recorder
+        self.address = (host, port)
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        """Inicia o servidor; retorna False se a porta não pôde ser aberta"""
+        # Importado só com o exportador ativo, para não pesar no início
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        recorder = self.recorder
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = recorder.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # As coletas do Prometheus não poluem a saída do monitor
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer(self.address, Handler)
+        except OSError as e:
+            print(f"Erro ao iniciar o exportador de métricas em "
+                  f"{self.address[0]}:{self.address[1]}: {e}")
+            return False
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="monitor-metricas", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+def metrics_from_env():
+    """
+    Cria o gravador e o servidor de métricas conforme o ambiente
+
+    Returns:
+        (MetricsRecorder, MetricsServer), ou (None, None) se MONITOR_METRICS_PORT
+        não estiver definido ou for 0
+    """
+    port = int(os.environ.get('MONITOR_METRICS_PORT', '0') or 0)
+    if not port:
+        return None, None
+    recorder = MetricsRecorder()
+    host = os.environ.get('MONITOR_METRICS_HOST', '127.0.0.1')
+    return recorder, MetricsServer(recorder, port, host)
@@ -2,7 +2,8 @@
 import os
 import time
 from datetime import datetime
-import psutil
+from src.cpu import CpuSampler
+from src.triggers import TriggerEngine, TriggerRule, parse_rules, read_pressure
 
 
 class LoadMonitor:
@@ -28,6 +29,22 @@ class LoadMonitor:
 
         self.is_load_high = False
         self.monitoring = False
+        # Uso de CPU por diferença entre verificações, sem bloquear
+        self.cpu = CpuSampler()
+        self.cpu_count = os.cpu_count() or 1
+
+        # Regras de disparo (MONITOR_TRIGGERS). Sem uma regra própria para
+        # load1, o limiar configurado continua valendo como regra de load1
+        try:
+            rules = parse_rules(os.environ.get('MONITOR_TRIGGERS', ''))
+        except ValueError as e:
+            print(f"Gatilhos ignorados: {e}")
+            rules = []
+        self._threshold_rule = None
+        if not any(rule.signal == "load1" for rule in rules):
+            self._threshold_rule = TriggerRule("load1", self.threshold)
+            rules.insert(0, self._threshold_rule)
+        self.triggers = TriggerEngine(rules)
 
     def get_load_average(self):
         """Retorna o load average do sistema (1, 5, 15 minutos)"""
@@ -38,10 +55,26 @@ class LoadMonitor:
         load_1min, _, _ = self.get_load_average()
         return load_1min >= self.threshold
 
-    def check_load_status(self):
-        """Verifica o status do load e retorna se houve mudança de estado"""
+    def check_load_status(self, signals=None):
+        """
+        Avalia as regras de disparo e retorna se houve mudança de estado
+
+        Args:
+            signals: Sinais já coletados no ciclo (CPU, PSI, PostgreSQL).
+                     O load average é sempre lido aqui
+        """
+        signals = dict(signals or ())
+        load_1min, load_5min, _ = self.get_load_average()
+        signals["load1"] = load_1min
+        signals["load5"] = load_5min
+        signals["load_per_core"] = load_1min / self.cpu_count
+
+        if self._threshold_rule is not None:
+            # O limiar pode ser alterado pela interface a qualquer momento
+            self._threshold_rule.enter = self._threshold_rule.exit = self.threshold
+
         previous_state = self.is_load_high
-        self.is_load_high = self.is_above_threshold()
+        self.is_load_high = self.triggers.evaluate(signals, time.monotonic())
 
         # Retorna True se houve mudança de estado
         return previous_state != self.is_load_high
@@ -52,11 +85,19 @@ class LoadMonitor:
 
     def get_system_info(self):
         """Retorna informações do sistema"""
-        cpu_percent = psutil.cpu_percent(interval=1)
+        # Importado só quando necessário, para um início rápido no modo headless
+        import psutil
+
+        cpu = self.cpu.sample()
         memory = psutil.virtual_memory()
+        # Sinais para as regras de disparo, lidos aqui, fora do loop de eventos
+        signals = read_pressure()
+        signals.update(cpu=cpu["percent"], iowait=cpu["iowait"], steal=cpu["steal"])
         return {
             "load_average": self.get_load_average(),
-            "cpu_percent": cpu_percent,
+            "cpu_percent": cpu["percent"],
+            "cpu": cpu,
+            "signals": signals,
             "memory_percent": memory.percent,
             "time": self.get_current_time(),
             "is_high_load": self.is_load_high
@@ -1,14 +1,120 @@
 #!/usr/bin/env python
 import os
-import psycopg2
-from datetime import datetime
+import threading
+import time
+import weakref
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import chain
+from src.capture_format import CaptureWriter, capture_extension
+from src.fingerprint import CaptureSummary
+from src.incidents import incident_filename
+from src.log_index import get_index
+from src.dbstats import DATABASE_COUNTERS
+from src.procstat import RESOURCE_COLUMNS, BackendResources, is_local
+from src.writer import get_writer
+
+# Colunas de get_active_queries, na ordem do SELECT
+ACTIVE_COLUMNS = (
+    "pid", "usename", "datname", "client_addr", "backend_start", "state",
+    "query_start", "duration", "wait_event_type", "wait_event", "query", "blocked_by",
+)
+# Colunas que podem ser omitidas da captura (MONITOR_CAPTURE_COLUMNS); as
+# demais identificam a sessão e são sempre lidas
+OPTIONAL_COLUMNS = (
+    "usename", "datname", "client_addr", "wait_event_type", "wait_event", "query",
+    "blocked_by",
+)
+
+
+class ActiveSession(namedtuple("ActiveSession", ACTIVE_COLUMNS + RESOURCE_COLUMNS)):
+    """
+    Sessão ativa retornada por get_active_queries
+
+    Tupla compacta, sem dicionário por instância, com get() no estilo de
+    dicionário para os consumidores (gravador, agregados, índice). Os campos
+    de RESOURCE_COLUMNS só são preenchidos pela atribuição por backend
+    (src.procstat).
+    """
+    __slots__ = ()
+
+    def get(self, field, default=None):
+        return getattr(self, field, default)
+
+
+# Colunas de espera antes do PostgreSQL 9.6, que só tem waiting (espera por lock)
+_LEGACY_WAIT_COLUMNS = {
+    "wait_event_type": "CASE WHEN waiting THEN 'Lock' END AS wait_event_type",
+    "wait_event": "NULL::text AS wait_event",
+}
+
+
+def _aware(epoch):
+    """Horário em segundos desde a época (amostras do histórico) como datetime com fuso"""
+    return datetime.fromtimestamp(epoch, timezone.utc) if epoch else None
+
+
+# Campos de recursos vazios, acrescentados a cada linha lida do servidor
+_NO_RESOURCES = (None,) * len(RESOURCE_COLUMNS)
+
+# Coletas que podem usar uma conexão do mesmo alvo ao mesmo tempo: captura,
+# snapshot de pg_stat_statements, amostrador contínuo e contadores do servidor
+COLLECTIONS = ("capture", "sample", "statements", "database")
+
+
+class CollectionCost:
+    __slots__ = ("count", "total_ms", "max_ms", "last_ms", "rows")
+
+    def __init__(self):
+        """
+        Custo de um tipo de coleta (captura ou amostra) observado pelo monitor
+
+        Mede, no cliente, o tempo gasto nas chamadas ao PostgreSQL: execução da
+        consulta, ida e volta pela rede e transferência das linhas, sem o
+        processamento feito pelo monitor. Não é o tempo de execução no servidor
+        (pg_stat_statements), que fica abaixo desse valor.
+        """
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.last_ms = 0.0
+        self.rows = 0
+
+    def record(self, elapsed_ms, rows):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.last_ms = elapsed_ms
+        self.rows = rows
+
+    @property
+    def average_ms(self):
+        return self.total_ms / self.count if self.count else 0.0
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "average_ms": self.average_ms,
+            "max_ms": self.max_ms,
+            "last_ms": self.last_ms,
+            "rows": self.rows,
+        }
 
 
 class PostgresMonitor:
-    def __init__(self, connection_params=None):
+    def __init__(self, connection_params=None, name=None, pool_size=None):
         """
         Inicializa o monitor PostgreSQL com os parâmetros de conexão
         Se connection_params for None, tentará usar variáveis de ambiente do arquivo .env
+
+        Args:
+            connection_params: Parâmetros de conexão do psycopg2
+            name: Nome do alvo no modo multi-servidor. Quando informado, os logs
+                  do alvo ficam em logs/<name>/
+            pool_size: Máximo de conexões simultâneas do pool do alvo.
+                       Se None, lê do ambiente MONITOR_POOL_SIZE (padrão: uma
+                       por coleta concorrente, ver COLLECTIONS)
         """
         self.connection_params = connection_params or {
             'host': os.getenv('PGHOST', 'localhost'),
@@ -17,98 +123,630 @@ class PostgresMonitor:
             'user': os.getenv('PGUSER', 'postgres'),
             'password': os.getenv('PGPASSWORD', '')
         }
-        self.conn = None
+        self.name = name
+        self.pool_size = pool_size or int(os.getenv('MONITOR_POOL_SIZE', str(len(COLLECTIONS))))
+        self.pool = None
+        # O ThreadedConnectionPool falha em vez de esperar quando esgotado; as
+        # coletas esperam aqui por uma conexão livre
+        self._slots = threading.BoundedSemaphore(self.pool_size)
+        # Último erro de conexão ou consulta (None se a última operação teve sucesso)
+        self.last_error = None
+        # Conexões emprestadas do pool, para permitir o cancelamento
+        self._active = set()
+        self._lock = threading.Lock()
+        # Comandos já preparados em cada conexão do pool
+        self._prepared = weakref.WeakKeyDictionary()
+
+        # Perfil da consulta de captura: truncamento do SQL no servidor e
+        # colunas opcionais lidas (as omitidas chegam como None)
+        self.query_chars = int(os.getenv('MONITOR_QUERY_CHARS', '0'))
+        columns = os.getenv('MONITOR_CAPTURE_COLUMNS')
+        self.capture_columns = OPTIONAL_COLUMNS
+        if columns:
+            requested = [column.strip() for column in columns.split(",") if column.strip()]
+            unknown = [column for column in requested if column not in OPTIONAL_COLUMNS]
+            if unknown:
+                print(f"Colunas de captura desconhecidas ignoradas: {', '.join(unknown)}")
+            self.capture_columns = tuple(column for column in OPTIONAL_COLUMNS
+                                         if column in requested)
+
+        # Consumo de CPU, memória e I/O por backend, lido de /proc quando o
+        # servidor roda nesta máquina (MONITOR_PROC_STATS: auto, 1 ou 0)
+        proc_stats = os.getenv('MONITOR_PROC_STATS', 'auto').lower()
+        self.resources = None
+        if os.path.isdir("/proc") and (
+                proc_stats in ('1', 'true', 'yes')
+                or (proc_stats == 'auto' and is_local(self.connection_params))):
+            self.resources = BackendResources()
+
+        # Custo das coletas observado pelo monitor
+        self.costs = {kind: CollectionCost() for kind in COLLECTIONS}
+        # Tempos por etapa da última captura (conexão, consulta e conversão), em ms
+        self.last_timings = {}
+        # Se pg_stat_statements está disponível (None enquanto não se sabe)
+        self.statements_available = None
+        # Se os contadores de database_stats estão disponíveis (None enquanto
+        # não se sabe) e se a leitura ainda inclui a posição do WAL
+        self.database_available = None
+        self.database_wal = True
 
         # Define o diretório para salvar os logs
-        self.log_dir = os.path.join(os.getcwd(), "logs")
+        self.log_root = os.path.join(os.getcwd(), "logs")
+        self.log_dir = self.log_root
+        if name:
+            self.log_dir = os.path.join(self.log_root, name)
         os.makedirs(self.log_dir, exist_ok=True)
 
+    @property
+    def label(self):
+        """Nome de exibição do alvo"""
+        return self.name or f"{self.connection_params['host']}:{self.connection_params['port']}"
+
     def connect(self):
-        """Estabelece conexão com o banco de dados PostgreSQL"""
+        """Cria o pool de conexões com o PostgreSQL, se ainda não existir"""
+        # Importado só quando necessário: o modo headless inicia sem o psycopg2
+        from psycopg2.pool import ThreadedConnectionPool
+
+        with self._lock:
+            try:
+                if self.pool is None or self.pool.closed:
+                    self.pool = ThreadedConnectionPool(
+                        1, self.pool_size, **self.session_params())
+                return True
+            except Exception as e:
+                print(f"Erro ao conectar ao PostgreSQL ({self.label}): {e}")
+                self.last_error = f"Erro ao conectar: {str(e).strip().splitlines()[0]}"
+                self.pool = None
+                return False
+
+    def session_params(self):
+        """
+        Parâmetros de conexão com os limites de sessão do monitor
+
+        O monitor não pode travar nem somar carga a um servidor sobrecarregado:
+        a conexão tem prazo (MONITOR_CONNECT_TIMEOUT, segundos) e cada comando
+        tem statement_timeout e lock_timeout (MONITOR_STATEMENT_TIMEOUT e
+        MONITOR_LOCK_TIMEOUT, milissegundos), definidos na abertura da sessão.
+        """
+        params = dict(self.connection_params)
+        params.setdefault('connect_timeout', int(os.getenv('MONITOR_CONNECT_TIMEOUT', '5')))
+        params.setdefault('application_name', 'pg-monitor')
+        options = (f"-c statement_timeout={int(os.getenv('MONITOR_STATEMENT_TIMEOUT', '2000'))} "
+                   f"-c lock_timeout={int(os.getenv('MONITOR_LOCK_TIMEOUT', '500'))}")
+        params['options'] = f"{params['options']} {options}" if params.get('options') else options
+        return params
+
+    def _execute_prepared(self, conn, cursor, name, sql, params):
+        """
+        Executa um comando preparado na conexão, preparando-o no primeiro uso
+
+        Args:
+            name: Nome do comando preparado
+            sql: Texto do comando, com parâmetros $1, $2...
+            params: Valores dos parâmetros
+        """
+        prepared = self._prepared.setdefault(conn, set())
+        if name not in prepared:
+            cursor.execute(f"PREPARE {name} AS {sql}")
+            prepared.add(name)
+        placeholders = ", ".join(["%s"] * len(params))
+        cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+
+    def capture_query(self, server_version):
+        """
+        SELECT da captura conforme o perfil configurado e a versão do servidor
+
+        wait_event_type, wait_event e pg_blocking_pids só existem a partir do
+        PostgreSQL 9.6; antes disso a espera por lock vem da coluna waiting
+        (wait_event_type 'Lock', sem evento) e o grafo de espera fica vazio.
+        """
+        legacy = server_version < 90600
+        expressions = []
+        for column in ACTIVE_COLUMNS:
+            if column == "duration":
+                expressions.append("now() - query_start AS duration")
+            elif column in OPTIONAL_COLUMNS and column not in self.capture_columns:
+                expressions.append(f"NULL AS {column}")
+            elif column == "query" and self.query_chars > 0:
+                expressions.append(f"left(query, {self.query_chars}) AS query")
+            elif column == "blocked_by":
+                # O grafo de espera vem na mesma consulta; pg_blocking_pids só é
+                # chamada para as sessões que estão de fato esperando por lock
+                expressions.append(
+                    "NULL::int[] AS blocked_by" if legacy else
+                    "CASE WHEN wait_event_type = 'Lock' THEN pg_blocking_pids(pid) END "
+                    "AS blocked_by")
+            elif column in ("wait_event_type", "wait_event") and legacy:
+                expressions.append(_LEGACY_WAIT_COLUMNS[column])
+            else:
+                expressions.append(column)
+        # Sem ORDER BY: a ordenação por duração é feita na leitura dos arquivos
+        return f"""
+        SELECT {", ".join(expressions)}
+        FROM pg_stat_activity
+        WHERE state != 'idle'
+          AND pid != pg_backend_pid()
+        """
+
+    @contextmanager
+    def connection(self):
+        """
+        Empresta uma conexão do pool e a devolve ao final
+
+        Com todas as conexões em uso, espera uma ser devolvida por até
+        MONITOR_CONNECT_TIMEOUT segundos; as consultas do monitor são curtas
+        (statement_timeout), então a espera também é.
+        """
+        if not self._slots.acquire(timeout=float(os.getenv('MONITOR_CONNECT_TIMEOUT', '5'))):
+            raise TimeoutError(f"Nenhuma das {self.pool_size} conexões do pool ficou livre")
         try:
-            if self.conn is None or self.conn.closed:
-                self.conn = psycopg2.connect(**self.connection_params)
-            return True
-        except Exception as e:
-            print(f"Erro ao conectar ao PostgreSQL: {e}")
-            self.conn = None
-            return False
+            pool = self.pool
+            conn = pool.getconn()
+            # Sem autocommit a conexão ficaria "idle in transaction" e, após
+            # um cancelamento, presa em uma transação abortada
+            conn.autocommit = True
+            self._active.add(conn)
+            try:
+                yield conn
+            finally:
+                self._active.discard(conn)
+                # Conexões quebradas são descartadas em vez de voltar ao pool
+                pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            self._slots.release()
 
     def disconnect(self):
-        """Fecha a conexão com o banco de dados"""
-        if self.conn and not self.conn.closed:
-            self.conn.close()
+        """Fecha todas as conexões do pool"""
+        with self._lock:
+            if self.pool is not None and not self.pool.closed:
+                self.pool.closeall()
+            self.pool = None
+
+    def cancel(self):
+        """Cancela as consultas em andamento no alvo (seguro a partir de outra thread)"""
+        for conn in list(self._active):
+            if not conn.closed:
+                conn.cancel()
+
+    def iter_active_queries(self, batch_size=None):
+        """
+        Percorre as consultas ativas no PostgreSQL em streaming
+
+        As linhas vêm de um cursor no servidor, lidas em lotes, de modo que a
+        memória do monitor não cresce com o número de sessões. Erros são
+        registrados em last_error e encerram a iteração.
+
+        Args:
+            batch_size: Linhas buscadas por vez.
+                        Se None, lê do ambiente MONITOR_FETCH_SIZE
+
+        Yields:
+            ActiveSession, sem ordem definida: a consulta não ordena no servidor,
+            e quem precisa da ordem por duração ordena na leitura (ver
+            CaptureReader.snapshots)
+        """
+        if batch_size is None:
+            batch_size = int(os.getenv('MONITOR_FETCH_SIZE', '500'))
+
+        self.last_timings = {}
+        connecting = time.perf_counter()
+        if not self.connect():
+            return
+
+        try:
+            with self.connection() as conn:
+                connect_ms = (time.perf_counter() - connecting) * 1000
+                # Cursores no servidor exigem uma transação, que também dá uma
+                # visão consistente de pg_stat_activity durante toda a leitura
+                conn.autocommit = False
+                try:
+                    # A captura não usa comando preparado como o amostrador:
+                    # DECLARE (o cursor no servidor da leitura em lotes) só
+                    # aceita SELECT ou VALUES, não EXECUTE
+                    cursor = conn.cursor(name="monitor_active_queries")
+                    # Mede só o tempo das chamadas ao servidor, não o
+                    # processamento de cada lote pelo consumidor
+                    started = time.perf_counter()
+                    cursor.execute(self.capture_query(conn.server_version))
+                    elapsed = time.perf_counter() - started
+                    rows = 0
+                    converting = 0.0
+                    while True:
+                        started = time.perf_counter()
+                        batch = cursor.fetchmany(batch_size)
+                        elapsed += time.perf_counter() - started
+                        if not batch:
+                            break
+                        rows += len(batch)
+                        started = time.perf_counter()
+                        sessions = [ActiveSession._make(row + _NO_RESOURCES) for row in batch]
+                        converting += time.perf_counter() - started
+                        yield from sessions
+                    cursor.close()
+                    self.costs["capture"].record(elapsed * 1000, rows)
+                    self.last_timings = {"connect": connect_ms, "query": elapsed * 1000,
+                                         "convert": converting * 1000}
+                finally:
+                    if not conn.closed:
+                        conn.rollback()
+            self.last_error = None
+
+        except Exception as e:
+            print(f"Erro ao obter consultas ativas ({self.label}): {e}")
+            self.last_error = f"Erro ao obter consultas: {e}"
 
     def get_active_queries(self):
-        """Obtém as consultas ativas no PostgreSQL"""
+        """Obtém as consultas ativas no PostgreSQL como uma lista de ActiveSession"""
+        return list(self.iter_active_queries())
+
+    def sample_activity(self, query_chars=None):
+        """
+        Amostra leve de pg_stat_activity para o histórico de sessões
+
+        Retorna as linhas como tuplas, na ordem de sampler.HISTORY_COLUMNS,
+        com o texto SQL truncado no servidor e os horários em segundos desde a época.
+
+        Args:
+            query_chars: Máximo de caracteres do SQL.
+                         Se None, lê do ambiente MONITOR_HISTORY_QUERY_CHARS
+
+        Returns:
+            Lista de linhas, ou None se a amostra falhar (o que é diferente de
+            nenhuma sessão ativa)
+        """
+        if query_chars is None:
+            query_chars = int(os.getenv('MONITOR_HISTORY_QUERY_CHARS', '1024'))
+
         if not self.connect():
-            return []
+            return None
 
         try:
-            cursor = self.conn.cursor()
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                # Comando preparado uma vez por conexão e reutilizado a cada
+                # amostra: o servidor não analisa nem planeja a consulta de novo
+                started = time.perf_counter()
+                if conn.server_version < 90600:
+                    waits = ", ".join(_LEGACY_WAIT_COLUMNS.values())
+                else:
+                    waits = "wait_event_type, wait_event"
+                self._execute_prepared(conn, cursor, "monitor_sample", f"""
+                SELECT pid, usename, datname, state,
+                       extract(epoch FROM backend_start)::float8,
+                       extract(epoch FROM query_start)::float8,
+                       {waits}, left(query, $1)
+                FROM pg_stat_activity
+                WHERE state != 'idle'
+                  AND pid != pg_backend_pid()
+                """, (query_chars,))
+                rows = cursor.fetchall()
+                self.costs["sample"].record((time.perf_counter() - started) * 1000, len(rows))
+                cursor.close()
+            return rows
+        except Exception as e:
+            print(f"Erro ao amostrar sessões ({self.label}): {e}")
+            return None
 
-            # Consulta para obter queries ativas no PostgreSQL
-            query = """
-            SELECT pid, usename, datname, client_addr,
-                   state, query_start, now() - query_start AS duration,
-                   wait_event_type, wait_event, query
-            FROM pg_stat_activity
-            WHERE state != 'idle'
-              AND pid != pg_backend_pid()
-            ORDER BY duration DESC;
-            """
+    def database_query(self, server_version, wal=True):
+        """
+        SELECT dos contadores de database_stats para a versão do servidor
 
-            cursor.execute(query)
-            rows = cursor.fetchall()
+        O PostgreSQL 17 moveu os contadores de checkpoint de pg_stat_bgwriter
+        para pg_stat_checkpointer. A posição do WAL (ou do replay, em uma
+        réplica) vem das funções pg_*_wal_lsn desde o PostgreSQL 10 e das
+        antigas pg_*_xlog_location no 9.4 a 9.6, sem depender de pg_stat_wal;
+        antes disso, ou com wal=False, fica como NULL.
+        """
+        if server_version >= 170000:
+            checkpoints = """
+                (SELECT num_timed FROM pg_stat_checkpointer),
+                (SELECT num_requested FROM pg_stat_checkpointer),
+                (SELECT buffers_written FROM pg_stat_checkpointer),
+                (SELECT buffers_clean FROM pg_stat_bgwriter),"""
+        else:
+            checkpoints = """
+                (SELECT checkpoints_timed FROM pg_stat_bgwriter),
+                (SELECT checkpoints_req FROM pg_stat_bgwriter),
+                (SELECT buffers_checkpoint FROM pg_stat_bgwriter),
+                (SELECT buffers_clean FROM pg_stat_bgwriter),"""
+        if not wal or server_version < 90400:
+            position = "NULL::float8"
+        else:
+            replay, current = ("pg_last_wal_replay_lsn", "pg_current_wal_lsn") \
+                if server_version >= 100000 \
+                else ("pg_last_xlog_replay_location", "pg_current_xlog_location")
+            position = f"""(CASE WHEN pg_is_in_recovery() THEN {replay}()
+                     ELSE {current}() END - '0/0'::pg_lsn)::float8"""
+        return f"""
+        SELECT sum(xact_commit), sum(xact_rollback), sum(blks_read), sum(blks_hit),
+               sum(tup_returned), sum(tup_fetched), sum(tup_inserted), sum(tup_updated),
+               sum(tup_deleted), sum(temp_bytes), sum(deadlocks),{checkpoints}
+               {position}
+        FROM pg_stat_database
+        """
+
+    def database_stats(self):
+        """
+        Contadores acumulados de atividade do servidor
 
-            # Transformar dados em dicionários para facilitar o uso
-            columns = [desc[0] for desc in cursor.description]
-            result = [dict(zip(columns, row)) for row in rows]
+        Uma única consulta, somando todos os bancos de pg_stat_database, com os
+        contadores de checkpoint/bgwriter e a posição do WAL.
 
-            cursor.close()
-            return result
+        Se uma função ou visão não existir no servidor, a leitura seguinte é
+        feita sem a posição do WAL; se ainda assim faltar algo, a consulta
+        deixa de ser feita para o alvo, como com pg_stat_statements.
+
+        Returns:
+            Dicionário contador -> valor, na ordem de dbstats.DATABASE_COUNTERS,
+            ou None se a leitura falhar ou não estiver disponível
+        """
+        import psycopg2.errors
 
+        if self.database_available is False or not self.connect():
+            return None
+
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                started = time.perf_counter()
+                cursor.execute(self.database_query(conn.server_version, self.database_wal))
+                row = cursor.fetchone()
+                self.costs["database"].record((time.perf_counter() - started) * 1000, 1)
+                cursor.close()
+        except (psycopg2.errors.UndefinedFunction, psycopg2.errors.UndefinedTable,
+                psycopg2.errors.UndefinedColumn) as e:
+            reason = str(e).strip().splitlines()[0]
+            if self.database_wal:
+                print(f"Posição do WAL indisponível ({self.label}): {reason}")
+                self.database_wal = False
+            else:
+                print(f"Estatísticas do servidor indisponíveis ({self.label}): {reason}")
+                self.database_available = False
+            return None
         except Exception as e:
-            print(f"Erro ao obter consultas ativas: {e}")
-            return []
+            print(f"Erro ao ler estatísticas do servidor ({self.label}): {e}")
+            return None
 
-    def save_queries_to_file(self, queries, filename=None):
-        """Salva as consultas em um arquivo"""
-        if not queries:
-            return False
+        self.database_available = True
+
+        return {name: float(value) if value is not None else None
+                for name, value in zip(DATABASE_COUNTERS, row)}
+
+    def statements_snapshot(self):
+        """
+        Snapshot dos contadores de pg_stat_statements
+
+        Lê apenas os contadores, sem o texto dos comandos, que fica em um
+        arquivo externo no servidor e é caro de ler.
+
+        Returns:
+            Dicionário (userid, dbid, queryid) -> tupla na ordem de
+            statements.STATEMENT_COUNTERS, ou None se a extensão não estiver
+            disponível ou a leitura falhar
+        """
+        import psycopg2.errors
+
+        if self.statements_available is False or not self.connect():
+            return None
+
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                # total_exec_time substituiu total_time no PostgreSQL 13
+                time_column = "total_exec_time" if conn.server_version >= 130000 else "total_time"
+                started = time.perf_counter()
+                cursor.execute(f"""
+                SELECT userid, dbid, queryid, calls, {time_column}, rows, shared_blks_read
+                FROM pg_stat_statements(false)
+                WHERE queryid IS NOT NULL;
+                """)
+                rows = cursor.fetchall()
+                self.costs["statements"].record((time.perf_counter() - started) * 1000, len(rows))
+                cursor.close()
+        except (psycopg2.errors.UndefinedFunction, psycopg2.errors.UndefinedTable,
+                psycopg2.errors.ObjectNotInPrerequisiteState) as e:
+            # Extensão não instalada no banco ou não carregada em shared_preload_libraries
+            print(f"pg_stat_statements indisponível ({self.label}): {str(e).strip().splitlines()[0]}")
+            self.statements_available = False
+            return None
+        except Exception as e:
+            print(f"Erro ao ler pg_stat_statements ({self.label}): {e}")
+            return None
+
+        self.statements_available = True
+        snapshot = {}
+        for userid, dbid, queryid, *counters in rows:
+            key = (userid, dbid, queryid)
+            previous = snapshot.get(key)
+            # No PostgreSQL 14+ o mesmo comando pode ter uma linha de nível
+            # superior e outra aninhada; as duas são somadas
+            snapshot[key] = tuple(counters) if previous is None else \
+                tuple(value + old for value, old in zip(counters, previous))
+        return snapshot
+
+    def statement_texts(self, queryids):
+        """
+        Texto dos comandos de pg_stat_statements
+
+        Args:
+            queryids: Lista de queryid
+
+        Returns:
+            Dicionário queryid -> SQL
+        """
+        if not queryids or not self.connect():
+            return {}
+
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                SELECT DISTINCT ON (queryid) queryid, query
+                FROM pg_stat_statements
+                WHERE queryid = ANY(%s);
+                """, (list(queryids),))
+                texts = dict(cursor.fetchall())
+                cursor.close()
+            return texts
+        except Exception as e:
+            print(f"Erro ao ler textos de pg_stat_statements ({self.label}): {e}")
+            return {}
+
+    def capture_header(self):
+        """Informações do servidor gravadas no header dos arquivos de captura"""
+        return {
+            "target": self.name,
+            "host": self.connection_params['host'],
+            "port": self.connection_params['port'],
+            "database": self.connection_params['database'],
+        }
+
+    def index_capture(self, path, summary, timestamp=None):
+        """
+        Registra um arquivo de captura no índice de logs
 
+        Args:
+            path: Arquivo gravado
+            summary: CaptureSummary das sessões gravadas
+            timestamp: Momento da captura. Se None, usa o atual
+        """
+        try:
+            top_fingerprint, top_query = summary.top()
+            get_index(self.log_root).add(
+                path, timestamp or datetime.now(), target=self.name,
+                host=f"{self.connection_params['host']}:{self.connection_params['port']}",
+                sessions=summary.sessions, peak_duration=summary.peak_duration,
+                top_fingerprint=top_fingerprint, top_query=top_query)
+        except Exception as e:
+            print(f"Erro ao atualizar o índice de logs: {e}")
+
+    def store_capture(self, writer, queries, timestamp=None):
+        """
+        Grava uma captura em streaming e a registra no índice
+
+        Com o escritor em segundo plano, o registro no índice é feito pela
+        thread de gravação, depois dos blocos da captura.
+
+        Args:
+            writer: CaptureWriter de destino
+            queries: Iterável de sessões de get_active_queries()
+            timestamp: Momento registrado no índice. Se None, usa o atual
+
+        Returns:
+            O CaptureSummary da captura
+        """
+        summary = CaptureSummary()
+        # Uma captura descartada (fila de gravação cheia) não entra no índice
+        if writer.write_capture(summary.observe(queries)) is not None:
+            timestamp = timestamp or datetime.now()
+            if writer.sink is not None:
+                # O commit no índice fica com a thread de gravação, depois da captura
+                writer.sink.call(self.index_capture, writer.path, summary, timestamp)
+            else:
+                self.index_capture(writer.path, summary, timestamp)
+        return summary
+
+    def queries_writer(self, filename=None):
+        """Cria o gravador de um novo arquivo pg_queries_<timestamp>"""
         if filename is None:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"pg_queries_{timestamp}.log"
+            filename = f"pg_queries_{timestamp}{capture_extension()}"
+        return CaptureWriter(os.path.join(self.log_dir, filename), header=self.capture_header(),
+                             sink=get_writer())
 
+    def incident_writer(self, incident, delta=False):
+        """
+        Cria o gravador do arquivo de um incidente, pg_incident_<início>
+
+        Args:
+            incident: Incident do episódio atual
+            delta: Se True, grava só as sessões novas ou alteradas a cada captura
+        """
+        header = self.capture_header()
+        header.update(incident.header())
+        filename = incident_filename(incident.start, capture_extension())
+        return CaptureWriter(os.path.join(self.log_dir, filename), header=header, delta=delta,
+                             sink=get_writer())
+
+    def open_incident(self, writer, start):
+        """
+        Cria o arquivo de um incidente e o registra no índice
+
+        Args:
+            writer: Gravador de incident_writer()
+            start: Momento (datetime) em que o load alto foi detectado
+        """
+        writer.open()
+        self.index_capture(writer.path, CaptureSummary(), start)
+        return writer.path
+
+    def store_history(self, writer, samples):
+        """
+        Grava no arquivo do incidente as amostras do histórico anteriores ao load alto
+
+        As amostras são gravadas em modo delta: como são próximas no tempo,
+        quase todas as sessões se repetem de uma amostra para a outra. Cada
+        amostra leva o próprio momento e load average, e os horários das
+        sessões são datetimes com fuso, como os das capturas lidas pelo
+        psycopg2, para que uma execução do histórico continue na primeira
+        captura do incidente.
+
+        Args:
+            writer: Gravador do arquivo do incidente
+            samples: Lista de (timestamp, linhas, load average) de SessionHistory.snapshot()
+        """
+        for timestamp, rows, load_average in samples:
+            sessions = []
+            for pid, usename, datname, state, backend_start, query_start, \
+                    wait_event_type, wait_event, query in rows:
+                sessions.append({
+                    'pid': pid, 'usename': usename, 'datname': datname,
+                    'state': state,
+                    'backend_start': _aware(backend_start),
+                    'query_start': _aware(query_start),
+                    'wait_event_type': wait_event_type, 'wait_event': wait_event,
+                    'query': query,
+                })
+            writer.write_capture(sessions, datetime.fromtimestamp(timestamp), load_average,
+                                 delta=True)
+        return writer.path
+
+    def close_incident(self, writer, summary, end):
+        """
+        Grava o resumo que encerra o arquivo de um incidente e o fecha
+
+        Args:
+            writer: Gravador do arquivo do incidente
+            summary: Dicionário de Incident.summary()
+            end: Momento (datetime) do fim do episódio
+        """
         try:
-            full_path = os.path.join(self.log_dir, filename)
-
-            with open(full_path, 'w') as f:
-                f.write(
-                    f"--- Consultas PostgreSQL Ativas em {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ---\n\n")
-                f.write(
-                    f"Servidor: {self.connection_params['host']}:{self.connection_params['port']}\n")
-                f.write(
-                    f"Banco de dados: {self.connection_params['database']}\n")
-                f.write(
-                    f"Load Average atual: {os.getloadavg()[0]:.2f}, {os.getloadavg()[1]:.2f}, {os.getloadavg()[2]:.2f}\n\n")
-
-                for i, query_data in enumerate(queries, 1):
-                    f.write(f"[Query {i}]\n")
-                    f.write(f"PID: {query_data.get('pid')}\n")
-                    f.write(f"Usuário: {query_data.get('usename')}\n")
-                    f.write(f"Banco: {query_data.get('datname')}\n")
-                    f.write(f"Endereço: {query_data.get('client_addr')}\n")
-                    f.write(f"Estado: {query_data.get('state')}\n")
-                    f.write(f"Início: {query_data.get('query_start')}\n")
-                    f.write(f"Duração: {query_data.get('duration')}\n")
-                    f.write(
-                        f"Aguardando: {query_data.get('wait_event_type')} - {query_data.get('wait_event')}\n")
-                    f.write(f"SQL: {query_data.get('query')}\n")
-                    f.write("-" * 80 + "\n\n")
-
-            return full_path
+            writer.write_summary(summary)
+        finally:
+            writer.close()
+        top = summary["top"][0] if summary["top"] else {}
+        try:
+            get_index(self.log_root).close_incident(
+                writer.path, end, summary["peak_load"], summary["captures"],
+                summary["triggers"], top.get("fingerprint"), top.get("query"))
+        except Exception as e:
+            print(f"Erro ao atualizar o índice de logs: {e}")
+        return writer.path
+
+    def save_queries_to_file(self, queries, filename=None):
+        """Salva as consultas (lista ou iterável) em um arquivo de captura"""
+        queries = iter(queries)
+        first = next(queries, None)
+        if first is None:
+            return False
+
+        try:
+            writer = self.queries_writer(filename)
+            try:
+                self.store_capture(writer, chain((first,), queries))
+            finally:
+                writer.close()
+            return writer.path
         except Exception as e:
             print(f"Erro ao salvar consultas em arquivo: {e}")
             return False
@@ -117,10 +755,11 @@ class PostgresMonitor:
         """Testa a conexão com o PostgreSQL e retorna detalhes da versão ou erro"""
         try:
             if self.connect():
-                cursor = self.conn.cursor()
-                cursor.execute("SELECT version();")
-                version = cursor.fetchone()[0]
-                cursor.close()
+                with self.connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("SELECT version();")
+                    version = cursor.fetchone()[0]
+                    cursor.close()
                 self.disconnect()
                 return {
                     "success": True,
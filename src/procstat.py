@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+Consumo de recursos do sistema por backend do PostgreSQL
+
+Quando o monitor roda na mesma máquina do servidor, cada sessão capturada é
+associada ao processo do seu backend em /proc: CPU (pela diferença desde a
+captura anterior), memória residente e bytes lidos e gravados em disco. Os
+arquivos são lidos por lote de sessões, na thread da captura, enquanto as
+sessões passam pelo streaming.
+"""
+import os
+import time
+
+PROC_DIR = "/proc"
+
+# Campos acrescentados a cada sessão capturada
+RESOURCE_COLUMNS = ("cpu_percent", "rss_bytes", "read_bytes", "write_bytes")
+
+# Hosts que indicam um servidor na própria máquina (socket Unix também)
+LOCAL_HOSTS = frozenset(("", "localhost", "127.0.0.1", "::1"))
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def is_local(connection_params):
+    """Se os parâmetros de conexão apontam para um servidor na própria máquina"""
+    host = str(connection_params.get("host") or "")
+    return host in LOCAL_HOSTS or host.startswith("/")
+
+
+def read_process(pid, proc_dir=PROC_DIR):
+    """
+    Lê os contadores de um processo
+
+    Returns:
+        Tupla (início em ticks desde o boot, ticks de CPU, RSS em bytes,
+        bytes lidos, bytes gravados), ou None se o processo não existir.
+        Os bytes de I/O são None sem permissão para ler /proc/<pid>/io
+    """
+    base = f"{proc_dir}/{pid}"
+    try:
+        with open(f"{base}/stat", "rb") as f:
+            stat = f.read()
+        with open(f"{base}/status", "rb") as f:
+            status = f.read()
+    except OSError:
+        return None
+
+    # O nome do processo, entre parênteses, pode conter espaços
+    fields = stat[stat.rindex(b")") + 2:].split()
+    # utime e stime são os campos 14 e 15 e starttime o 22 (contando de 1)
+    ticks = int(fields[11]) + int(fields[12])
+    start = int(fields[19])
+
+    rss = None
+    position = status.find(b"VmRSS:")
+    if position >= 0:
+        rss = int(status[position + 6:status.index(b"kB", position)]) * 1024
+
+    read_bytes = write_bytes = None
+    try:
+        with open(f"{base}/io", "rb") as f:
+            for line in f:
+                if line.startswith(b"read_bytes:"):
+                    read_bytes = int(line[11:])
+                elif line.startswith(b"write_bytes:"):
+                    write_bytes = int(line[12:])
+    except OSError:
+        # /proc/<pid>/io exige o mesmo usuário do processo ou CAP_SYS_PTRACE
+        pass
+
+    return start, ticks, rss, read_bytes, write_bytes
+
+
+def _uptime(proc_dir=PROC_DIR):
+    with open(f"{proc_dir}/uptime") as f:
+        return float(f.read().split()[0])
+
+
+class BackendResources:
+    def __init__(self, batch_size=None, proc_dir=PROC_DIR):
+        """
+        Associa as sessões capturadas ao consumo dos seus backends
+
+        Guarda a leitura anterior de cada backend, identificado por (pid,
+        início do processo) para não confundir pids reutilizados. Na primeira
+        vez que um backend é visto, a CPU é a média desde o seu início e o
+        I/O é o total desde o início.
+
+        Args:
+            batch_size: Sessões por lote de leitura.
+                        Se None, lê do ambiente MONITOR_FETCH_SIZE
+            proc_dir: Diretório do procfs
+        """
+        if batch_size is None:
+            batch_size = int(os.getenv('MONITOR_FETCH_SIZE', '500'))
+        self.batch_size = max(1, batch_size)
+        self.proc_dir = proc_dir
+        # (pid, início) -> (ticks de CPU, bytes lidos, bytes gravados, instante)
+        self._previous = {}
+        # Tempo gasto lendo /proc na última captura (ms)
+        self.last_elapsed_ms = 0.0
+
+    def annotate(self, sessions):
+        """
+        Acrescenta o consumo de recursos a cada sessão, em streaming
+
+        Args:
+            sessions: Iterável de ActiveSession
+
+        Yields:
+            As mesmas sessões, com os campos de RESOURCE_COLUMNS preenchidos
+            (None para backends que não estão nesta máquina)
+        """
+        current = {}
+        elapsed = 0.0
+        batch = []
+        try:
+            for session in sessions:
+                batch.append(session)
+                if len(batch) >= self.batch_size:
+                    started = time.perf_counter()
+                    annotated = self._annotate_batch(batch, current)
+                    elapsed += time.perf_counter() - started
+                    batch = []
+                    yield from annotated
+            if batch:
+                started = time.perf_counter()
+                annotated = self._annotate_batch(batch, current)
+                elapsed += time.perf_counter() - started
+                yield from annotated
+        finally:
+            # Só os backends da captura atual servem de base para a próxima
+            self._previous = current
+            self.last_elapsed_ms = elapsed * 1000
+
+    def _annotate_batch(self, batch, current):
+        now = time.monotonic()
+        uptime = None
+        previous = self._previous
+        annotated = []
+
+        for session in batch:
+            counters = read_process(session.pid, self.proc_dir)
+            if counters is None:
+                annotated.append(session)
+                continue
+            start, ticks, rss, read_bytes, write_bytes = counters
+            key = (session.pid, start)
+            before = previous.get(key)
+
+            if before is not None and now > before[3]:
+                cpu = 100.0 * (ticks - before[0]) / _CLOCK_TICKS / (now - before[3])
+                read_delta = _delta(read_bytes, before[1])
+                write_delta = _delta(write_bytes, before[2])
+            else:
+                if uptime is None:
+                    uptime = _uptime(self.proc_dir)
+                lifetime = uptime - start / _CLOCK_TICKS
+                cpu = 100.0 * ticks / _CLOCK_TICKS / lifetime if lifetime > 0 else None
+                read_delta, write_delta = read_bytes, write_bytes
+
+            current[key] = (ticks, read_bytes, write_bytes, now)
+            annotated.append(session._replace(
+                cpu_percent=round(cpu, 1) if cpu is not None else None,
+                rss_bytes=rss, read_bytes=read_delta, write_bytes=write_delta))
+        return annotated
+
+
+def _delta(value, previous):
+    if value is None or previous is None:
+        return value
+    return value - previous
@@ -0,0 +1,420 @@
+#!/usr/bin/env python
+"""
+Retenção e compactação do diretório de logs
+
+Sem limites, o diretório de logs cresce para sempre e, em um incidente
+longo, pode encher o disco do próprio servidor de banco. A retenção remove
+os arquivos mais antigos (inclusive os diários) até respeitar os limites de
+idade, de tamanho total e de número de arquivos.
+
+A compactação reúne os arquivos de uma captura (pg_queries_) e de histórico
+(pg_history_) de dias anteriores em um arquivo diário comprimido por
+servidor, pg_archive_<dia>, que continua legível pelo visualizador: é a
+concatenação dos arquivos de origem, cada um com o seu header, recomprimida
+em blocos independentes. Cada rodada só acrescenta os novos arquivos de
+origem ao fim do arquivo diário, sem regravar o que ele já tinha. Os
+arquivos de incidente já reúnem um episódio inteiro e continuam separados
+(cada um é uma linha da lista de incidentes): os sem compressão de dias
+anteriores são recomprimidos no lugar.
+
+Tudo roda em uma thread própria, com prioridade de CPU e de I/O reduzidas,
+e a compactação fica para depois enquanto um incidente estiver aberto.
+"""
+import gzip
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from src.capture_format import BLOCK_BYTES, EXTENSIONS, open_capture, resolve_compression
+from src.log_index import LOG_EXTENSIONS, file_kind, file_timestamp, get_index
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependência opcional
+    zstandard = None
+
+ARCHIVE_PREFIX = "pg_archive_"
+# Tipos de arquivo compactados: os incidentes são só comprimidos, os demais
+# vão para os arquivos diários
+COMPACTED_KINDS = ("queries", "history", "incident")
+# Sufixo dos temporários da compactação: no arquivo diário, guarda o tamanho
+# anterior ao acréscimo em andamento; no incidente, é a cópia comprimida
+TEMPORARY_SUFFIX = ".tmp"
+# Arquivos modificados há menos que isso (segundos) podem estar em gravação
+RECENT_SECONDS = 60
+
+_CAPTURE_PREFIX = b'{"t":"capture"'
+# Erros de leitura de um arquivo comprimido truncado
+_TRUNCATED = (EOFError, gzip.BadGzipFile) + ((zstandard.ZstdError,) if zstandard else ())
+
+
+def lower_priority():
+    """
+    Reduz a prioridade de CPU e de I/O da thread atual
+
+    No Linux, nice e ionice valem por thread; em outros sistemas, ou sem
+    permissão, a thread segue com a prioridade normal.
+    """
+    thread_id = threading.get_native_id()
+    try:
+        os.setpriority(os.PRIO_PROCESS, thread_id, 19)
+    except (AttributeError, OSError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return
+    try:
+        psutil.Process(thread_id).ionice(psutil.IOPRIO_CLASS_IDLE)
+    except (AttributeError, OSError, psutil.Error):
+        pass
+
+
+class RetentionPolicy:
+    def __init__(self, max_bytes=None, max_days=None, max_files=None, compact_after=None,
+                 interval=None):
+        """
+        Limites do diretório de logs
+
+        Args:
+            max_bytes: Tamanho total máximo em bytes (0 = sem limite).
+                       Se None, lê do ambiente MONITOR_RETENTION_MAX_BYTES (padrão: 1 GB)
+            max_days: Idade máxima dos arquivos em dias (0 = sem limite).
+                      Se None, lê do ambiente MONITOR_RETENTION_DAYS (padrão: 30)
+            max_files: Número máximo de arquivos (0 = sem limite).
+                       Se None, lê do ambiente MONITOR_RETENTION_MAX_FILES (padrão: 0)
+            compact_after: Dias até um arquivo ir para o arquivo diário (0 = não compacta).
+                           Se None, lê do ambiente MONITOR_COMPACT_AFTER_DAYS (padrão: 1)
+            interval: Segundos entre as execuções (0 desativa a retenção).
+                      Se None, lê do ambiente MONITOR_RETENTION_INTERVAL (padrão: 3600)
+        """
+        def setting(value, name, default):
+            return float(os.environ.get(name, default)) if value is None else value
+
+        self.max_bytes = int(setting(max_bytes, 'MONITOR_RETENTION_MAX_BYTES', str(1024 ** 3)))
+        self.max_days = setting(max_days, 'MONITOR_RETENTION_DAYS', '30')
+        self.max_files = int(setting(max_files, 'MONITOR_RETENTION_MAX_FILES', '0'))
+        self.compact_after = int(setting(compact_after, 'MONITOR_COMPACT_AFTER_DAYS', '1'))
+        self.interval = setting(interval, 'MONITOR_RETENTION_INTERVAL', '3600')
+
+    @property
+    def enabled(self):
+        return self.interval > 0 and bool(
+            self.max_bytes > 0 or self.max_days > 0 or self.max_files > 0 or self.compact_after > 0)
+
+
+class LogJanitor:
+    def __init__(self, log_root, policy=None):
+        """
+        Aplica a retenção e a compactação a um diretório de logs
+
+        Args:
+            log_root: Diretório raiz dos logs (com os subdiretórios dos alvos)
+            policy: RetentionPolicy. Se None, lê os limites do ambiente
+        """
+        self.log_root = log_root
+        self.policy = policy or RetentionPolicy()
+        # Os arquivos diários são sempre comprimidos
+        compression = resolve_compression()
+        self.compression = "gzip" if compression == "none" else compression
+        self._stopping = threading.Event()
+
+    def stop(self):
+        """Interrompe a compactação em andamento, entre um arquivo e outro"""
+        self._stopping.set()
+
+    def files(self):
+        """
+        Arquivos de log do diretório, do mais antigo para o mais recente
+
+        Returns:
+            Lista de tuplas (momento, caminho, tipo, tamanho em bytes, modificação)
+        """
+        found = []
+        for dirpath, _, filenames in os.walk(self.log_root):
+            for filename in filenames:
+                if not filename.endswith(LOG_EXTENSIONS) or file_kind(filename) is None:
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                    timestamp = file_timestamp(path)
+                except OSError:
+                    continue
+                found.append((timestamp, path, file_kind(filename), stat.st_size, stat.st_mtime))
+        found.sort()
+        return found
+
+    def run(self, in_use=(), compact=True):
+        """
+        Executa uma rodada de compactação e retenção
+
+        Args:
+            in_use: Caminhos de arquivos abertos para gravação (incidentes em andamento)
+            compact: Se False, só aplica os limites
+
+        Returns:
+            Dicionário com os arquivos compactados e removidos, os arquivos
+            diários gravados, os incidentes comprimidos e o tamanho e o número
+            de arquivos restantes
+        """
+        self._stopping.clear()
+        in_use = {os.path.abspath(path) for path in in_use}
+        result = {"compacted": 0, "archives": 0, "compressed": 0, "removed": 0,
+                  "removed_bytes": 0}
+        if compact and self.policy.compact_after > 0:
+            result["compacted"], result["archives"], result["compressed"] = self.compact(in_use)
+        result["removed"], result["removed_bytes"], result["total_bytes"], result["files"] = \
+            self.enforce(in_use)
+        return result
+
+    def _age_limit(self):
+        if self.policy.max_days <= 0:
+            return None
+        return datetime.now() - timedelta(days=self.policy.max_days)
+
+    def _busy(self, path, kind, modified, in_use):
+        # Os arquivos diários só são gravados pela própria compactação
+        return os.path.abspath(path) in in_use or \
+            (kind != "archive" and time.time() - modified < RECENT_SECONDS)
+
+    def compact(self, in_use=()):
+        """
+        Reúne os arquivos de dias anteriores em arquivos diários, por alvo, e
+        comprime os incidentes de dias anteriores gravados sem compressão
+
+        Returns:
+            Tupla (arquivos reunidos nos diários, arquivos diários gravados,
+            incidentes comprimidos)
+        """
+        # Temporários de uma compactação interrompida: o arquivo diário volta
+        # ao tamanho anterior ao acréscimo (as origens ainda existem)
+        for dirpath, _, filenames in os.walk(self.log_root):
+            for filename in filenames:
+                if not filename.endswith(TEMPORARY_SUFFIX):
+                    continue
+                path = os.path.join(dirpath, filename)
+                if filename.startswith(ARCHIVE_PREFIX):
+                    self._rollback(path)
+                elif file_kind(filename) == "incident":
+                    os.remove(path)
+
+        cutoff = datetime.combine(
+            datetime.now().date() - timedelta(days=self.policy.compact_after - 1),
+            datetime.min.time())
+        age_limit = self._age_limit()
+        groups = {}
+        incidents = []
+        for timestamp, path, kind, _, modified in self.files():
+            # Arquivos já vencidos vão ser removidos, não compactados
+            if kind not in COMPACTED_KINDS or timestamp >= cutoff \
+                    or (age_limit is not None and timestamp < age_limit) \
+                    or not path.endswith(tuple(EXTENSIONS.values())) \
+                    or self._busy(path, kind, modified, in_use):
+                continue
+            if kind == "incident":
+                if path.endswith(EXTENSIONS["none"]):
+                    incidents.append(path)
+                continue
+            groups.setdefault((os.path.dirname(path), timestamp.date()), []).append(
+                (timestamp, path))
+
+        compressed = 0
+        for path in incidents:
+            if self._stopping.is_set():
+                return 0, 0, compressed
+            try:
+                self._compress_incident(path)
+            except OSError as e:
+                print(f"Erro ao comprimir o incidente {path}: {e}")
+                continue
+            compressed += 1
+
+        compacted = archives = 0
+        for (directory, day), sources in sorted(groups.items()):
+            if self._stopping.is_set():
+                break
+            archive = os.path.join(
+                directory, f"{ARCHIVE_PREFIX}{day.strftime('%Y%m%d')}{EXTENSIONS[self.compression]}")
+            try:
+                captures = self._write_archive(archive, [path for _, path in sources])
+            except OSError as e:
+                print(f"Erro ao compactar os logs de {day} em {directory}: {e}")
+                continue
+            if captures is None:
+                break
+
+            for _, path in sources:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            target = os.path.relpath(directory, self.log_root)
+            try:
+                get_index(self.log_root).archive(
+                    archive, datetime.combine(day, datetime.min.time()),
+                    [path for _, path in sources], captures, sources[-1][0],
+                    target=None if target == "." else target)
+            except Exception as e:
+                print(f"Erro ao atualizar o índice de logs: {e}")
+            compacted += len(sources)
+            archives += 1
+        return compacted, archives, compressed
+
+    def _compressor(self):
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor().compress
+
+        def compress(data):
+            return gzip.compress(data, mtime=0)
+        return compress
+
+    def _write_archive(self, archive, sources):
+        """
+        Acrescenta os arquivos de origem ao fim do arquivo diário
+
+        O tamanho anterior do arquivo diário fica em um temporário até o
+        acréscimo estar sincronizado com o disco; se a compactação parar no
+        meio, o arquivo volta a esse tamanho (ver _rollback) e nunca fica com
+        um bloco pela metade.
+
+        Returns:
+            Número de capturas acrescentadas, ou None se a compactação foi interrompida
+        """
+        compress = self._compressor()
+        marker = archive + TEMPORARY_SUFFIX
+        with open(marker, "w") as f:
+            f.write(str(os.path.getsize(archive) if os.path.exists(archive) else 0))
+            f.flush()
+            os.fsync(f.fileno())
+
+        captures = 0
+        completed = False
+        try:
+            with open(archive, "ab") as out:
+                for path in sources:
+                    if self._stopping.is_set():
+                        return None
+                    captures += self._append(out, path, compress)
+                out.flush()
+                os.fsync(out.fileno())
+            completed = True
+        finally:
+            if completed:
+                os.remove(marker)
+            else:
+                self._rollback(marker)
+        return captures
+
+    def _rollback(self, marker):
+        """Desfaz um acréscimo não concluído a um arquivo diário"""
+        archive = marker[:-len(TEMPORARY_SUFFIX)]
+        try:
+            with open(marker) as f:
+                size = int(f.read())
+        except (OSError, ValueError):
+            size = None
+        if size is not None and os.path.exists(archive):
+            if size:
+                os.truncate(archive, size)
+            else:
+                os.remove(archive)
+        os.remove(marker)
+
+    def _compress_incident(self, path):
+        """
+        Recomprime um arquivo de incidente sem compressão no mesmo diretório
+
+        A cópia comprimida é gravada em um temporário e só substitui o
+        original depois de sincronizada com o disco.
+        """
+        compressed = path[:-len(EXTENSIONS["none"])] + EXTENSIONS[self.compression]
+        temporary = compressed + TEMPORARY_SUFFIX
+        try:
+            with open(temporary, "wb") as out:
+                self._append(out, path, self._compressor())
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(temporary, compressed)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        os.remove(path)
+        try:
+            get_index(self.log_root).rename(path, compressed)
+        except Exception as e:
+            print(f"Erro ao atualizar o índice de logs: {e}")
+        return compressed
+
+    def _append(self, out, path, compress):
+        """Recomprime um arquivo de captura no fim do arquivo diário; retorna as capturas"""
+        captures = 0
+        block = []
+        size = 0
+        try:
+            with open_capture(path, binary=True) as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # Última linha incompleta de um arquivo interrompido
+                        break
+                    if line.startswith(_CAPTURE_PREFIX):
+                        captures += 1
+                    block.append(line)
+                    size += len(line)
+                    if size >= BLOCK_BYTES:
+                        out.write(compress(b"".join(block)))
+                        block = []
+                        size = 0
+        except _TRUNCATED as e:
+            print(f"Arquivo {path} truncado, compactado até o trecho legível: {e}")
+        if block:
+            out.write(compress(b"".join(block)))
+        return captures
+
+    def enforce(self, in_use=()):
+        """
+        Remove os arquivos mais antigos até respeitar os limites
+
+        Returns:
+            Tupla (arquivos removidos, bytes liberados, bytes restantes,
+            arquivos restantes)
+        """
+        policy = self.policy
+        files = self.files()
+        total = sum(entry[3] for entry in files)
+        count = len(files)
+        age_limit = self._age_limit()
+
+        removed = []
+        removed_bytes = 0
+        for timestamp, path, kind, size, modified in files:
+            if kind == "archive":
+                # O arquivo diário vale pelo fim do dia
+                timestamp += timedelta(days=1)
+            expired = age_limit is not None and timestamp < age_limit
+            too_big = 0 < policy.max_bytes < total
+            too_many = 0 < policy.max_files < count
+            if not (expired or too_big or too_many):
+                continue
+            if self._busy(path, kind, modified, in_use):
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Erro ao remover {path}: {e}")
+                continue
+            removed.append(path)
+            removed_bytes += size
+            total -= size
+            count -= 1
+
+        if removed:
+            try:
+                get_index(self.log_root).remove(*removed)
+            except Exception as e:
+                print(f"Erro ao atualizar o índice de logs: {e}")
+        return len(removed), removed_bytes, total, count
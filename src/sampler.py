@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+import math
+import os
+import sys
+from collections import deque
+
+# Ordem das colunas de cada linha amostrada (ver PostgresMonitor.sample_activity)
+HISTORY_COLUMNS = (
+    "pid", "usename", "datname", "state", "backend_start", "query_start",
+    "wait_event_type", "wait_event", "query",
+)
+
+
+class SessionHistory:
+    def __init__(self, window=None, interval=None, max_bytes=None):
+        """
+        Buffer circular com as últimas amostras de pg_stat_activity
+
+        As amostras são guardadas como tuplas e as strings repetidas entre
+        amostras (SQL, usuário, banco, estado) são internadas em uma tabela
+        com contagem de referências, de modo que uma consulta longa ocupa
+        memória uma única vez. O consumo é contabilizado a cada inserção e
+        remoção e limitado tanto pelo número de amostras quanto por bytes.
+
+        Args:
+            window: Janela de histórico em segundos.
+                    Se None, lê do ambiente MONITOR_HISTORY_WINDOW
+            interval: Intervalo entre amostras em segundos.
+                      Se None, lê do ambiente MONITOR_SAMPLE_INTERVAL
+            max_bytes: Limite de memória do buffer.
+                       Se None, lê do ambiente MONITOR_HISTORY_MAX_BYTES
+        """
+        if window is None:
+            window = float(os.environ.get('MONITOR_HISTORY_WINDOW', '300'))
+        if interval is None:
+            interval = float(os.environ.get('MONITOR_SAMPLE_INTERVAL', '1'))
+        if max_bytes is None:
+            max_bytes = int(os.environ.get('MONITOR_HISTORY_MAX_BYTES', str(32 * 1024 * 1024)))
+
+        self.window = window
+        self.interval = interval
+        self.max_samples = max(1, math.ceil(window / interval)) if interval > 0 else 1
+        self.max_bytes = max_bytes
+
+        # Cada item: (timestamp, linhas, load average, bytes ocupados pela amostra)
+        self._samples = deque()
+        # Tabela de strings internadas: valor -> [instância canônica, referências]
+        self._strings = {}
+        self.memory_bytes = 0
+
+    def __len__(self):
+        return len(self._samples)
+
+    def _intern(self, value):
+        """Retorna a instância canônica de uma string e conta a referência"""
+        entry = self._strings.get(value)
+        if entry is None:
+            entry = [value, 0]
+            self._strings[value] = entry
+            self.memory_bytes += sys.getsizeof(value)
+        entry[1] += 1
+        return entry[0]
+
+    def _release(self, value):
+        """Descarta uma referência a uma string internada"""
+        entry = self._strings[value]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._strings[value]
+            self.memory_bytes -= sys.getsizeof(value)
+
+    def add(self, timestamp, rows, load_average=None):
+        """
+        Adiciona uma amostra ao buffer, descartando as mais antigas se necessário
+
+        Args:
+            timestamp: Momento da amostra (segundos desde a época)
+            rows: Linhas de pg_stat_activity na ordem de HISTORY_COLUMNS
+            load_average: Load average (1, 5 e 15 minutos) no momento da amostra
+        """
+        compact = []
+        size = 0
+        for row in rows:
+            values = tuple(
+                self._intern(value) if isinstance(value, str) else value
+                for value in row
+            )
+            size += sys.getsizeof(values) + sum(
+                sys.getsizeof(value) for value in values
+                if value is not None and not isinstance(value, str))
+            compact.append(values)
+
+        compact = tuple(compact)
+        size += sys.getsizeof(compact)
+        self._samples.append((timestamp, compact, load_average, size))
+        self.memory_bytes += size
+
+        while len(self._samples) > self.max_samples or \
+                (self.memory_bytes > self.max_bytes and len(self._samples) > 1):
+            self._evict()
+
+    def _evict(self):
+        """Remove a amostra mais antiga e libera suas strings"""
+        _, rows, _, size = self._samples.popleft()
+        self.memory_bytes -= size
+        for row in rows:
+            for value in row:
+                if isinstance(value, str):
+                    self._release(value)
+
+    def snapshot(self, since=None):
+        """
+        Retorna uma cópia das amostras do buffer
+
+        Args:
+            since: Se informado, apenas amostras com timestamp >= since
+
+        Returns:
+            Lista de tuplas (timestamp, linhas, load average), da mais antiga
+            para a mais recente
+        """
+        return [(timestamp, rows, load_average)
+                for timestamp, rows, load_average, _ in self._samples
+                if since is None or timestamp >= since]
+
+    def stats(self):
+        """Retorna as medidas de ocupação do buffer"""
+        return {
+            "samples": len(self._samples),
+            "max_samples": self.max_samples,
+            "rows": sum(len(sample[1]) for sample in self._samples),
+            "strings": len(self._strings),
+            "memory_bytes": self.memory_bytes,
+            "max_bytes": self.max_bytes,
+        }
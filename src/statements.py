@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+Diferenças entre snapshots de pg_stat_statements ao longo de um incidente
+
+Cada snapshot é um dicionário (userid, dbid, queryid) -> tupla de contadores
+na ordem de STATEMENT_COUNTERS. A diferença entre dois snapshots é uma junção
+pela chave, feita em um único passe sobre o snapshot mais recente.
+"""
+
+# Contadores acumulados de cada comando, na ordem das tuplas dos snapshots
+STATEMENT_COUNTERS = ("calls", "total_exec_time", "rows", "shared_blks_read")
+
+
+def diff_snapshots(before, after):
+    """
+    Calcula o consumo de cada comando entre dois snapshots
+
+    Comandos que surgiram depois do primeiro snapshot contam integralmente.
+    Contadores que diminuíram indicam que a entrada foi descartada e recriada
+    (pg_stat_statements_reset ou limite pg_stat_statements.max), e também
+    contam integralmente.
+
+    Args:
+        before: Snapshot inicial
+        after: Snapshot final
+
+    Returns:
+        Dicionário chave -> tupla de diferenças, apenas para comandos executados
+        entre os dois snapshots
+    """
+    deltas = {}
+    for key, counters in after.items():
+        previous = before.get(key)
+        if previous is None or counters[0] < previous[0]:
+            if counters[0] > 0:
+                deltas[key] = counters
+        elif counters[0] > previous[0]:
+            # Comandos sem novas chamadas (a maioria) não chegam a gerar tupla
+            deltas[key] = tuple(value - old for value, old in zip(counters, previous))
+    return deltas
+
+
+class StatementTracker:
+    def __init__(self, baseline):
+        """
+        Acompanha o consumo por comando durante um incidente
+
+        Args:
+            baseline: Snapshot tirado no início do load alto
+        """
+        self.baseline = baseline
+        self.latest = baseline
+        self.snapshots = 1
+
+    def update(self, snapshot):
+        """Registra o snapshot tirado em uma captura"""
+        self.latest = snapshot
+        self.snapshots += 1
+
+    def top(self, n=10, key="total_exec_time"):
+        """
+        Comandos que mais consumiram durante o incidente
+
+        Args:
+            n: Quantidade de comandos
+            key: Contador usado na ordenação (um de STATEMENT_COUNTERS)
+
+        Returns:
+            Lista de dicionários com userid, dbid, queryid e as diferenças dos contadores
+        """
+        index = STATEMENT_COUNTERS.index(key)
+        deltas = diff_snapshots(self.baseline, self.latest)
+        ranked = sorted(deltas.items(), key=lambda item: item[1][index], reverse=True)[:n]
+        return [
+            dict(zip(("userid", "dbid", "queryid"), statement), **dict(zip(STATEMENT_COUNTERS, delta)))
+            for statement, delta in ranked
+        ]
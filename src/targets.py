@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+import configparser
+import os
+import re
+
+
+def load_targets(path):
+    """
+    Lê o arquivo de configuração com a lista de servidores a monitorar
+
+    O arquivo segue o formato INI, com uma seção por servidor. Chaves
+    ausentes usam as variáveis de ambiente PG* ou os valores padrão:
+
+        [producao]
+        host = db1.example.com
+        port = 5432
+        database = postgres
+        user = monitor
+        password = segredo
+
+    Args:
+        path: Caminho do arquivo de configuração
+
+    Returns:
+        Lista de tuplas (nome, parâmetros de conexão), na ordem do arquivo
+
+    Raises:
+        ValueError: Se o arquivo não existir, não tiver nenhum servidor ou se
+                    o nome de uma seção não servir de diretório de logs (só
+                    pontos, ou igual ao de outra seção depois de trocar os
+                    caracteres não permitidos)
+    """
+    parser = configparser.ConfigParser(interpolation=None)
+    if not parser.read(path, encoding="utf-8"):
+        raise ValueError(f"Arquivo de servidores não encontrado: {path}")
+
+    targets = []
+    sections = {}
+    for section in parser.sections():
+        # O nome vira diretório de logs, então só aceitamos caracteres seguros
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", section)
+        if not name.strip("."):
+            raise ValueError(f"Nome de servidor inválido em {path}: [{section}]")
+        # Sem distinguir maiúsculas, como em sistemas de arquivos que não distinguem
+        other = sections.setdefault(name.casefold(), section)
+        if other != section:
+            raise ValueError(f"Servidores [{other}] e [{section}] em {path} usariam o mesmo "
+                             f"diretório de logs ({name})")
+        options = parser[section]
+        targets.append((name, {
+            'host': options.get('host', os.getenv('PGHOST', 'localhost')),
+            'port': options.get('port', os.getenv('PGPORT', '5432')),
+            'database': options.get('database', os.getenv('PGDATABASE', 'postgres')),
+            'user': options.get('user', os.getenv('PGUSER', 'postgres')),
+            'password': options.get('password', os.getenv('PGPASSWORD', '')),
+        }))
+
+    if not targets:
+        raise ValueError(f"Nenhum servidor definido em {path}")
+
+    return targets
+
+
+def create_monitors():
+    """
+    Cria os monitores PostgreSQL a partir da configuração do ambiente
+
+    Se MONITOR_TARGETS_FILE estiver definido, cria um monitor por servidor do
+    arquivo; caso contrário, um único monitor com as variáveis PG*.
+    """
+    from src.postgresql import PostgresMonitor
+
+    targets_file = os.environ.get('MONITOR_TARGETS_FILE')
+    if not targets_file:
+        return [PostgresMonitor()]
+
+    return [PostgresMonitor(params, name=name) for name, params in load_targets(targets_file)]
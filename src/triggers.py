@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+"""
+Gatilhos de load alto com vários sinais e histerese
+
+Cada regra compara um sinal (load por núcleo, pressão de PSI, iowait,
+sessões no PostgreSQL...) com um limiar de entrada e outro de saída, e só
+muda de estado depois que a condição se mantém pelo tempo mínimo. O
+episódio de load alto dura enquanto alguma regra estiver disparada.
+
+As regras são lidas de MONITOR_TRIGGERS, separadas por ";":
+
+    psi_io_some>=20,exit=10,for=5,clear=30; pg_waiting>=50,for=3
+
+exit é o limiar de saída (padrão: o de entrada), for o tempo em segundos
+acima do limiar de entrada para disparar e clear o tempo abaixo do limiar
+de saída para encerrar.
+"""
+import os
+import re
+
+PRESSURE_DIR = "/proc/pressure"
+
+# Sinais disponíveis para as regras
+SIGNALS = {
+    "load1": "load average de 1 minuto",
+    "load5": "load average de 5 minutos",
+    "load_per_core": "load average de 1 minuto dividido pelo número de núcleos",
+    "cpu": "uso de CPU (%)",
+    "iowait": "CPU em iowait (%)",
+    "steal": "CPU em steal (%)",
+    "psi_cpu_some": "PSI: tempo com tarefas esperando CPU (%, média de 10s)",
+    "psi_cpu_full": "PSI: tempo com todas as tarefas esperando CPU (%, média de 10s; cgroups)",
+    "psi_io_some": "PSI: tempo com tarefas esperando I/O (%, média de 10s)",
+    "psi_io_full": "PSI: tempo com todas as tarefas esperando I/O (%, média de 10s)",
+    "psi_memory_some": "PSI: tempo com tarefas esperando memória (%, média de 10s)",
+    "psi_memory_full": "PSI: tempo com todas as tarefas esperando memória (%, média de 10s)",
+    "pg_active": "sessões ativas no PostgreSQL (maior entre os servidores)",
+    "pg_waiting": "sessões ativas esperando por lock, LWLock, I/O ou buffer",
+    "pg_lock_waiting": "sessões esperando por lock",
+    "db_tps": "transações por segundo (commits e rollbacks, todos os bancos)",
+    "db_rollbacks": "rollbacks por segundo",
+    "db_blks_read": "blocos lidos fora de shared_buffers por segundo",
+    "db_blks_hit": "blocos encontrados em shared_buffers por segundo",
+    "db_tup_returned": "linhas percorridas por segundo",
+    "db_tup_fetched": "linhas obtidas por índice por segundo",
+    "db_tup_modified": "linhas inseridas, alteradas ou removidas por segundo",
+    "db_temp_bytes": "bytes gravados em arquivos temporários por segundo",
+    "db_deadlocks": "deadlocks por segundo",
+    "db_checkpoints_req": "checkpoints solicitados (fora do agendamento) por segundo",
+    "db_buffers_written": "buffers gravados por checkpoints e pelo bgwriter por segundo",
+    "db_wal_bytes": "bytes de WAL gerados (ou aplicados, em réplicas) por segundo",
+}
+
+_RULE = re.compile(r"^\s*([a-z0-9_]+)\s*>=?\s*([0-9.]+)\s*((?:,\s*[a-z]+\s*=\s*[0-9.]+\s*)*)$")
+
+
+def read_pressure(path=PRESSURE_DIR):
+    """
+    Lê a média de 10s da pressão de CPU, I/O e memória (PSI, Linux 4.20+)
+
+    Returns:
+        Dicionário psi_<recurso>_<some|full> -> percentual; vazio sem PSI
+    """
+    signals = {}
+    for resource in ("cpu", "io", "memory"):
+        try:
+            with open(os.path.join(path, resource)) as f:
+                for line in f:
+                    kind, _, fields = line.partition(" ")
+                    # avg10 é o primeiro campo: "avg10=1.23 avg60=... total=..."
+                    signals[f"psi_{resource}_{kind}"] = float(fields.split(" ", 1)[0][6:])
+        except (OSError, ValueError):
+            continue
+    return signals
+
+
+class TriggerRule:
+    __slots__ = ("signal", "enter", "exit", "enter_for", "exit_for",
+                 "firing", "value", "_since")
+
+    def __init__(self, signal, enter, exit=None, enter_for=0.0, exit_for=0.0):
+        """
+        Regra de disparo sobre um sinal, com histerese
+
+        Args:
+            signal: Nome do sinal (uma chave de SIGNALS)
+            enter: Limiar de entrada (dispara com valor >= enter)
+            exit: Limiar de saída (encerra com valor < exit). Se None, igual a enter
+            enter_for: Segundos acima de enter antes de disparar
+            exit_for: Segundos abaixo de exit antes de encerrar
+        """
+        self.signal = signal
+        self.enter = enter
+        self.exit = enter if exit is None else exit
+        self.enter_for = enter_for
+        self.exit_for = exit_for
+        self.firing = False
+        self.value = None
+        # Desde quando a condição de mudança de estado se mantém
+        self._since = None
+
+    def update(self, value, now):
+        """
+        Avalia a regra com o valor atual do sinal
+
+        Args:
+            value: Valor do sinal, ou None se indisponível neste ciclo
+                   (a regra mantém o estado e o tempo acumulado é descartado)
+            now: Instante da avaliação em segundos (relógio monotônico)
+
+        Returns:
+            True se a regra mudou de estado
+        """
+        self.value = value
+        if value is None:
+            self._since = None
+            return False
+
+        changing = value < self.exit if self.firing else value >= self.enter
+        if not changing:
+            self._since = None
+            return False
+        if self._since is None:
+            self._since = now
+        if now - self._since < (self.exit_for if self.firing else self.enter_for):
+            return False
+        self.firing = not self.firing
+        self._since = None
+        return True
+
+    def describe(self):
+        """Descrição curta da regra, com o valor atual se conhecido"""
+        text = f"{self.signal}>={self.enter:g}"
+        if self.value is not None:
+            text += f" ({self.value:.1f})"
+        return text
+
+    def as_dict(self):
+        return {"signal": self.signal, "enter": self.enter, "exit": self.exit,
+                "for": self.enter_for, "clear": self.exit_for}
+
+
+def parse_rules(spec):
+    """
+    Lê as regras no formato de MONITOR_TRIGGERS
+
+    Raises:
+        ValueError: Se alguma regra estiver mal formada ou usar um sinal desconhecido
+    """
+    rules = []
+    for text in (spec or "").split(";"):
+        if not text.strip():
+            continue
+        match = _RULE.match(text.lower())
+        if match is None:
+            raise ValueError(f"Regra de gatilho inválida: '{text.strip()}' "
+                             f"(esperado: sinal>=limiar[,exit=N][,for=N][,clear=N])")
+        signal, enter, options = match.groups()
+        if signal not in SIGNALS:
+            raise ValueError(f"Sinal de gatilho desconhecido: '{signal}' "
+                             f"(disponíveis: {', '.join(SIGNALS)})")
+        params = {}
+        for option in filter(None, (part.strip() for part in options.split(","))):
+            key, value = (part.strip() for part in option.split("="))
+            if key not in ("exit", "for", "clear"):
+                raise ValueError(f"Opção de gatilho desconhecida: '{key}' em '{text.strip()}'")
+            params[key] = float(value)
+        exit = params.get("exit")
+        if exit is not None and exit > float(enter):
+            raise ValueError(f"Limiar de saída maior que o de entrada em '{text.strip()}'")
+        rules.append(TriggerRule(signal, float(enter), exit,
+                                 params.get("for", 0.0), params.get("clear", 0.0)))
+    return rules
+
+
+class TriggerEngine:
+    def __init__(self, rules):
+        """
+        Conjunto de regras avaliado a cada verificação
+
+        Args:
+            rules: Lista de TriggerRule
+        """
+        self.rules = list(rules)
+
+    @property
+    def active(self):
+        """Se alguma regra está disparada"""
+        return any(rule.firing for rule in self.rules)
+
+    def evaluate(self, signals, now):
+        """
+        Avalia todas as regras com os sinais do ciclo
+
+        Args:
+            signals: Dicionário sinal -> valor (sinais ausentes não são avaliados)
+            now: Instante da avaliação em segundos (relógio monotônico)
+
+        Returns:
+            Se alguma regra está disparada após a avaliação
+        """
+        for rule in self.rules:
+            rule.update(signals.get(rule.signal), now)
+        return self.active
+
+    def firing(self):
+        """Descrições das regras disparadas"""
+        return [rule.describe() for rule in self.rules if rule.firing]
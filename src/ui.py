@@ -3,10 +3,71 @@ from textual.app import App, ComposeResult
 from textual.containers import Container, Horizontal, Vertical
 from textual.widgets import Header, Footer, Static, Button, Input, Label, DataTable
 from textual.reactive import reactive
+from textual.message import Message
+from textual.binding import Binding
+from textual.geometry import Size
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+from rich.text import Text
 from textual import work
 import time
 import os
 from datetime import datetime
+from src.viewer import LogViewerScreen
+from src.instrumentation import instrumentation_enabled
+
+
+# Prefixos dos arquivos e o rótulo exibido para cada um
+LOG_PREFIXES = (
+    ("pg_queries_", ""),
+    ("pg_history_", "histórico "),
+    ("pg_delta_", "delta "),
+    ("pg_incident_", "incidente "),
+    ("pg_archive_", "arquivo diário "),
+)
+
+
+def log_label(log_file):
+    """Rótulo de um arquivo de log para a lista: [servidor · ]tipo data hora"""
+    target, basename = os.path.split(log_file)
+    name = basename.split(".", 1)[0]
+    label = name
+    for prefix, kind in LOG_PREFIXES:
+        if name.startswith(prefix):
+            label = kind + " ".join(name[len(prefix):].split("_"))
+            break
+    if target:
+        label = f"{target} · {label}"
+    return label
+
+
+def _elapsed(start, end):
+    """Duração entre dois horários do índice, como 45s, 12min ou 1h05"""
+    seconds = (datetime.strptime(end, "%Y-%m-%d %H:%M:%S")
+               - datetime.strptime(start, "%Y-%m-%d %H:%M:%S")).total_seconds()
+    if seconds < 60:
+        return f"{seconds:.0f}s"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f}min"
+    return f"{int(seconds // 3600)}h{int(seconds % 3600 // 60):02d}"
+
+
+def _bytes_rate(value):
+    """Taxa em bytes por segundo, em KB/s ou MB/s"""
+    if value is None:
+        return "-"
+    if value >= 1024 * 1024:
+        return f"{value / (1024 * 1024):.1f} MB/s"
+    return f"{value / 1024:.0f} KB/s"
+
+
+class EngineEvent(Message):
+    """Mensagem com um evento produzido pelo motor de captura"""
+
+    def __init__(self, event, data):
+        super().__init__()
+        self.event = event
+        self.data = data
 
 
 class SystemInfoWidget(Static):
@@ -18,6 +79,9 @@ class SystemInfoWidget(Static):
     status = reactive("Normal")
     status_color = reactive("green")
     last_update = reactive("Nunca")
+    history = reactive("Desativado")
+    collection_cost = reactive("-")
+    database = reactive("-")
 
     def on_mount(self):
         """Chamado quando o widget é montado na interface"""
@@ -27,12 +91,21 @@ class SystemInfoWidget(Static):
     def update_info(self, info):
         """Atualiza as informações de sistema exibidas"""
         self.cpu_load = f"{info['load_average'][0]:.2f}, {info['load_average'][1]:.2f}, {info['load_average'][2]:.2f}"
-        self.cpu_percent = f"{info['cpu_percent']:.1f}%"
+        cpu = info.get('cpu')
+        if cpu:
+            self.cpu_percent = (f"{cpu['percent']:.1f}% (us {cpu['user']:.0f} sy {cpu['system']:.0f} "
+                                f"io {cpu['iowait']:.0f} st {cpu['steal']:.0f})")
+            if len(cpu['per_core']) > 1:
+                hottest = max(core['percent'] for core in cpu['per_core'])
+                self.cpu_percent += f", núcleo máx {hottest:.0f}%"
+        else:
+            self.cpu_percent = f"{info['cpu_percent']:.1f}%"
         self.memory_percent = f"{info['memory_percent']:.1f}%"
         self.last_update = info['time']
 
         if info['is_high_load']:
-            self.status = "ALTO LOAD!"
+            triggers = info.get('triggers')
+            self.status = f"ALTO LOAD! {', '.join(triggers)}" if triggers else "ALTO LOAD!"
             self.status_color = "red"
         else:
             self.status = "Normal"
@@ -74,6 +147,21 @@ class SystemInfoWidget(Static):
                 Static(self.memory_percent, id="memory-percent"),
                 classes="info-row"
             ),
+            Horizontal(
+                Label("Histórico:", classes="info-label"),
+                Static(self.history, id="history"),
+                classes="info-row"
+            ),
+            Horizontal(
+                Label("Servidor PG:", classes="info-label"),
+                Static(self.database, id="database-rates"),
+                classes="info-row"
+            ),
+            Horizontal(
+                Label("Custo coleta:", classes="info-label"),
+                Static(self.collection_cost, id="collection-cost"),
+                classes="info-row"
+            ),
             Horizontal(
                 Label("Atualizado:", classes="info-label"),
                 Static(self.last_update, id="last-update"),
@@ -107,78 +195,552 @@ class SystemInfoWidget(Static):
         if self.is_mounted:
             self.query_one("#memory-percent").update(memory_percent)
 
+    def update_history(self, samples, memory_bytes):
+        """Atualiza a ocupação do histórico de sessões"""
+        self.history = f"{samples} amostras, {memory_bytes / 1024:.0f} KB"
+
+    def watch_history(self, history):
+        """Chamado quando a ocupação do histórico muda"""
+        if self.is_mounted:
+            self.query_one("#history").update(history)
+
+    def update_cost(self, costs):
+        """
+        Atualiza o custo das coletas, medido no monitor (servidor e rede)
+
+        Com vários servidores, mostra o maior custo médio entre eles.
+        """
+        parts = []
+        for kind, label in (("sample", "amostra"), ("capture", "captura")):
+            measured = [target[kind] for target in costs.values() if target[kind]["count"]]
+            if measured:
+                worst = max(measured, key=lambda cost: cost["average_ms"])
+                parts.append(f"{label} {worst['average_ms']:.1f} ms (máx {worst['max_ms']:.0f})")
+        self.collection_cost = ", ".join(parts) or "-"
+
+    def update_database(self, target, rates):
+        """
+        Atualiza as taxas de atividade do servidor
+
+        Com vários servidores, mostra o de maior TPS.
+        """
+        if not hasattr(self, "_database_rates"):
+            self._database_rates = {}
+        self._database_rates[target] = rates
+        label, busiest = max(self._database_rates.items(),
+                             key=lambda item: item[1]["tps"] or 0)
+
+        def per_second(name, unit=""):
+            value = busiest.get(name)
+            return "-" if value is None else f"{value:.0f}{unit}/s"
+
+        hit_ratio = busiest.get("hit_ratio")
+        text = (f"TPS {per_second('tps')}, rollback {per_second('rollbacks')}, "
+                f"hit {'-' if hit_ratio is None else f'{hit_ratio:.1f}%'}, "
+                f"temp {_bytes_rate(busiest.get('temp_bytes'))}, "
+                f"WAL {_bytes_rate(busiest.get('wal_bytes'))}")
+        self.database = f"{label}: {text}" if len(self._database_rates) > 1 else text
+
+    def watch_database(self, database):
+        """Chamado quando as taxas do servidor mudam"""
+        if self.is_mounted:
+            self.query_one("#database-rates").update(database)
+
+    def watch_collection_cost(self, collection_cost):
+        """Chamado quando o custo das coletas muda"""
+        if self.is_mounted:
+            self.query_one("#collection-cost").update(collection_cost)
+
     def watch_last_update(self, last_update):
         """Chamado quando o timestamp de última atualização muda"""
         if self.is_mounted:
             self.query_one("#last-update").update(last_update)
 
 
+class DiagnosticsWidget(Static):
+    """Painel com os tempos das etapas de coleta e os ciclos perdidos do monitor"""
+
+    # Rótulos das etapas, na ordem de exibição
+    STAGE_LABELS = (
+        ("system", "Sistema"),
+        ("sample", "Amostra"),
+        ("connect", "Conexão"),
+        ("query", "Consulta"),
+        ("convert", "Conversão"),
+        ("proc", "/proc"),
+        ("write", "Gravação"),
+        ("capture", "Captura"),
+        ("disk", "Disco"),
+    )
+    LOOP_LABELS = (("check", "verificação"), ("sample", "amostragem"))
+
+    def compose(self) -> ComposeResult:
+        """Compõe o painel de diagnóstico"""
+        yield Container(
+            Label("Diagnóstico do monitor", classes="section-title"),
+            Static("Aguardando medições", id="diagnostics-stages"),
+            Static("", id="diagnostics-cycles"),
+            Static("", id="diagnostics-writer"),
+            id="diagnostics-container",
+        )
+
+    def update_stats(self, stats):
+        """Atualiza o painel com um snapshot de PipelineStats"""
+        stages = stats["stages"]
+        lines = [f"{'Etapa':<10}{'n':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'máx':>9}"]
+        for stage, label in self.STAGE_LABELS:
+            histogram = stages.get(stage)
+            if histogram is None:
+                continue
+            lines.append(f"{label:<10}{histogram['count']:>7}"
+                         + "".join(f"{histogram[key]:>7.0f}ms"
+                                   for key in ("p50", "p95", "p99", "max_ms")))
+        if len(lines) > 1:
+            self.query_one("#diagnostics-stages").update("\n".join(lines))
+
+        loops = stats["loops"]
+        parts = []
+        for loop, label in self.LOOP_LABELS:
+            cycles = loops.get(loop)
+            if cycles is not None:
+                parts.append(f"{label}: {cycles['overruns']} estouros, "
+                             f"{cycles['missed']} ciclos perdidos em {cycles['cycles']}")
+        cycles_widget = self.query_one("#diagnostics-cycles")
+        cycles_widget.set_class(any(loops[loop]["missed"] for loop in loops), "status-red")
+        cycles_widget.update("; ".join(parts))
+
+    def update_writer(self, stats):
+        """Atualiza a linha da fila de gravação com um snapshot de BackgroundWriter"""
+        def megabytes(value):
+            return f"{value / (1024 * 1024):.1f} MB"
+
+        text = (f"Fila de gravação: {megabytes(stats['queued_bytes'])} de "
+                f"{megabytes(stats['max_bytes'])} (pico {megabytes(stats['peak_queued_bytes'])}), "
+                f"{megabytes(stats['written_bytes'])} gravados, "
+                f"{stats['dropped_captures']} capturas descartadas")
+        if stats["blocked_ms"]:
+            text += f", {stats['blocked_ms']:.0f} ms em espera"
+        if stats["fsyncs"]:
+            text += f", {stats['fsyncs']} fsync"
+        if stats["errors"]:
+            text += f", {stats['errors']} erros"
+        writer_widget = self.query_one("#diagnostics-writer")
+        writer_widget.set_class(bool(stats["dropped_captures"] or stats["errors"]), "status-red")
+        writer_widget.update(text)
+
+
+class LogListView(ScrollView, can_focus=True):
+    """
+    Lista virtualizada dos incidentes e arquivos de log, servida pelo índice
+
+    Não há um widget por arquivo: apenas as linhas visíveis são renderizadas e
+    os arquivos são buscados no índice em blocos, sob demanda, de modo que todo
+    o histórico pode ser percorrido sem limite de quantidade.
+    """
+
+    BINDINGS = [
+        Binding("up", "cursor_up", "Acima", show=False),
+        Binding("down", "cursor_down", "Abaixo", show=False),
+        Binding("pageup", "page_up", "Página acima", show=False),
+        Binding("pagedown", "page_down", "Página abaixo", show=False),
+        Binding("enter", "select", "Abrir", show=False),
+    ]
+
+    # Arquivos buscados no índice por consulta
+    BLOCK_SIZE = 100
+
+    class Selected(Message):
+        """Um arquivo de log foi escolhido"""
+
+        def __init__(self, path):
+            super().__init__()
+            self.path = path
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.index = None
+        self.search = ""
+        self.total = 0
+        self.cursor = 0
+        # Blocos de linhas do índice já carregados: número do bloco -> linhas
+        self._blocks = {}
+
+    def _row(self, number):
+        """Retorna a linha do índice na posição, carregando o bloco se preciso"""
+        block, position = divmod(number, self.BLOCK_SIZE)
+        rows = self._blocks.get(block)
+        if rows is None:
+            rows = self.index.recent(self.BLOCK_SIZE, block * self.BLOCK_SIZE, self.search)
+            self._blocks[block] = rows
+        return rows[position] if position < len(rows) else None
+
+    def _visible_paths(self):
+        top = self.scroll_offset.y
+        return [row["path"] if row else None for row in
+                (self._row(n) for n in range(top, min(self.total, top + self.size.height)))]
+
+    def reload(self):
+        """
+        Atualiza a lista a partir do índice
+
+        Compara as linhas visíveis antes e depois e redesenha apenas as que
+        mudaram. Quando novos arquivos entram no topo e a lista não está no
+        início, a posição é deslocada para manter os mesmos arquivos na tela.
+        """
+        if self.index is None:
+            return
+
+        before = self._visible_paths() if self.total else []
+        first = self._blocks.get(0, [None])[0] if self.total else None
+
+        total = self.index.count(self.search)
+        self._blocks = {}
+        inserted = total - self.total if first is not None else 0
+        self.total = total
+        self.virtual_size = Size(self.size.width, total)
+
+        # Arquivos novos entram no topo: mantém o cursor no mesmo arquivo
+        if inserted > 0 and self._row(inserted) and self._row(inserted)["path"] == first["path"]:
+            if self.scroll_offset.y > 0 or self.cursor > 0:
+                self.cursor += inserted
+                self.scroll_to(y=self.scroll_offset.y + inserted, animate=False)
+
+        self.cursor = min(self.cursor, max(0, total - 1))
+        after = self._visible_paths()
+        changed = [y for y in range(max(len(before), len(after)))
+                   if y >= len(before) or y >= len(after) or before[y] != after[y]]
+        for y in changed:
+            self.refresh_line(y)
+        return len(changed)
+
+    def reset(self, search=""):
+        """Recarrega a lista do início com uma nova busca"""
+        self.search = search
+        self.total = 0
+        self.cursor = 0
+        self._blocks = {}
+        self.scroll_to(y=0, animate=False)
+        self.reload()
+        self.refresh()
+
+    def render_line(self, y):
+        scroll_x, scroll_y = self.scroll_offset
+        number = scroll_y + y
+        width = self.size.width
+        row = self._row(number) if self.index is not None and number < self.total else None
+        if row is None:
+            return Strip.blank(width, self.rich_style)
+
+        line = Text(no_wrap=True, overflow="ellipsis", style=self.rich_style)
+        line.append(log_label(row["path"]).ljust(36))
+        if row["kind"] == "incident":
+            if row["end_timestamp"]:
+                line.append(f" {_elapsed(row['timestamp'], row['end_timestamp']):>6}")
+                line.append(f" {row['captures'] or 0:>4} capturas", style="#a0aec0")
+                line.append(f"  load {row['peak_load'] or 0:.1f}", style="#a0aec0")
+            else:
+                line.append("  em andamento", style="bold #f6ad55")
+        elif row["kind"] == "archive" and row["captures"]:
+            line.append(f" {row['captures']:>4} capturas", style="#a0aec0")
+        if row["sessions"] is not None:
+            line.append(f" {row['sessions']:>5} sessões", style="#a0aec0")
+        if row["peak_duration"]:
+            line.append(f"  pico {row['peak_duration']:.0f}s", style="#a0aec0")
+        if number == self.cursor:
+            line.stylize("reverse" if self.has_focus else "on #2d3748")
+        line.truncate(width + scroll_x, pad=True)
+
+        strip = Strip(line.render(self.app.console), line.cell_len)
+        return strip.crop_extend(scroll_x, scroll_x + width, self.rich_style)
+
+    def _move_cursor(self, number):
+        if not self.total:
+            return
+        previous = self.cursor
+        self.cursor = max(0, min(self.total - 1, number))
+        top = self.scroll_offset.y
+        if self.cursor < top:
+            self.scroll_to(y=self.cursor, animate=False)
+        elif self.cursor >= top + self.size.height:
+            self.scroll_to(y=self.cursor - self.size.height + 1, animate=False)
+        self.refresh_line(previous - self.scroll_offset.y)
+        self.refresh_line(self.cursor - self.scroll_offset.y)
+
+    def action_cursor_up(self):
+        self._move_cursor(self.cursor - 1)
+
+    def action_cursor_down(self):
+        self._move_cursor(self.cursor + 1)
+
+    def action_page_up(self):
+        self._move_cursor(self.cursor - self.size.height)
+
+    def action_page_down(self):
+        self._move_cursor(self.cursor + self.size.height)
+
+    def action_select(self):
+        row = self._row(self.cursor) if self.total else None
+        if row is not None:
+            self.post_message(self.Selected(row["path"]))
+
+    def on_click(self, event):
+        number = self.scroll_offset.y + event.y
+        if number < self.total:
+            self._move_cursor(number)
+            self.action_select()
+
+    def on_focus(self):
+        self.refresh()
+
+    def on_blur(self):
+        self.refresh()
+
+
 class QueryLogWidget(Static):
-    """Widget para exibir logs de consultas salvas"""
-    log_files = reactive([])
-    # Contador para garantir IDs de botão únicos
-    _button_counter = 0
+    """Widget para exibir os incidentes e os logs de consultas salvos"""
 
     def on_mount(self):
+        self._open_index()
+
+    @work(thread=True)
+    def _open_index(self):
+        """Abre o índice de logs fora do loop de eventos (a primeira vez indexa o diretório)"""
+        from src.log_index import get_index
+
+        index = get_index()
+        self.app.call_from_thread(self._index_ready, index)
+
+    def _index_ready(self, index):
+        self.query_one(LogListView).index = index
         self.update_logs()
 
     def update_logs(self):
-        """Atualiza a lista de arquivos de log"""
-        log_dir = os.path.join(os.getcwd(), "logs")
-        if not os.path.exists(log_dir):
-            self.log_files = []
-            return
-
-        files = [f for f in os.listdir(log_dir) if f.endswith('.log')]
-        files.sort(reverse=True)  # Ordena do mais recente para o mais antigo
-        self.log_files = files[:20]  # Limita para os 20 mais recentes
+        """Atualiza a lista de arquivos de log a partir do índice"""
+        log_list = self.query_one(LogListView)
+        log_list.reload()
+        self.query_one("#log-list-empty").display = log_list.index is not None and not log_list.total
+        self.query_one("#log-count").update(f"{log_list.total} registros")
 
     def add_log_file(self, filename):
-        """Adiciona um novo arquivo de log à lista"""
-        basename = os.path.basename(filename)
-        if basename not in self.log_files:
-            self.log_files = [basename] + self.log_files[:19]
+        """Adiciona um novo arquivo de log à lista (já registrado no índice)"""
+        self.update_logs()
+
+    def on_input_changed(self, event: Input.Changed):
+        """Filtra os logs pelo texto buscado"""
+        if event.input.id == "log-search":
+            self.query_one(LogListView).reset(event.value.strip())
+            self.update_logs()
 
     def compose(self) -> ComposeResult:
         """Compõe o widget de logs"""
         yield Container(
-            Label("Logs de Consultas PostgreSQL", classes="section-title"),
-            Static("Nenhum log de consulta encontrado",
+            Label("Incidentes de Load Alto", classes="section-title"),
+            Input(placeholder="Buscar por servidor, arquivo, gatilho ou SQL", id="log-search"),
+            Static("", id="log-count"),
+            Static("Nenhum incidente registrado",
                    id="log-list-empty", classes="log-empty"),
-            Container(id="log-list"),
+            LogListView(id="log-list"),
             id="log-container"
         )
 
-    def watch_log_files(self, log_files):
-        """Atualizado quando a lista de logs muda"""
-        log_list = self.query_one("#log-list")
 
-        # Limpa completamente a lista de logs existentes
-        log_list.remove_children()
+class TargetStatusWidget(Static):
+    """Widget com o status de cada servidor no modo multi-servidor"""
 
-        empty_msg = self.query_one("#log-list-empty")
-        if not log_files:
-            empty_msg.display = True
-            return
+    def __init__(self, targets):
+        super().__init__()
+        self.targets = targets
+        self._row_ids = {target.label: f"target-{index}"
+                         for index, target in enumerate(targets)}
 
-        empty_msg.display = False
+    def compose(self) -> ComposeResult:
+        """Compõe a lista de servidores monitorados"""
+        yield Container(
+            Label(f"Servidores ({len(self.targets)})", classes="section-title"),
+            *[
+                Horizontal(
+                    Label(target.label, classes="info-label"),
+                    Static("Aguardando coleta", id=self._row_ids[target.label]),
+                    classes="info-row"
+                )
+                for target in self.targets
+            ],
+            id="targets-container"
+        )
+
+    def update_target(self, label, ok, message):
+        """Atualiza a linha de status de um servidor"""
+        row = self.query_one(f"#{self._row_ids[label]}")
+        row.remove_class("status-green")
+        row.remove_class("status-red")
+        row.add_class("status-green" if ok else "status-red")
+        row.update(f"{datetime.now().strftime('%H:%M:%S')} {message}")
+
+
+class TopSessionsWidget(Static):
+    """
+    Sessões ativas em tempo real, no estilo do pg_top, alimentadas pelo amostrador
+
+    As amostras chegam na cadência do amostrador, mas a tabela é atualizada em
+    intervalo fixo apenas com a amostra mais recente de cada servidor. As
+    linhas são atualizadas no lugar pela chave (servidor, pid): só as células
+    que mudaram são reescritas, e só as sessões mais relevantes pela ordenação
+    atual ficam na tabela, de modo que o custo de cada quadro é limitado mesmo
+    com milhares de backends ativos.
+    """
+
+    BINDINGS = [
+        Binding("d", "sort_by('duration')", "Ordenar por duração"),
+        Binding("w", "sort_by('wait')", "Ordenar por espera"),
+    ]
 
-        # Adiciona os arquivos de log à lista com IDs realmente únicos usando timestamp
-        for index, log_file in enumerate(log_files):
-            timestamp = " ".join(log_file.replace(
-                "pg_queries_", "").replace(".log", "").split("_"))
+    # Intervalo entre atualizações da tabela, em segundos
+    REFRESH_INTERVAL = 1.0
+    # Largura máxima do SQL exibido
+    QUERY_WIDTH = 120
 
-            # Usa um contador global para garantir IDs únicos mesmo em atualizações simultâneas
-            self._button_counter += 1
-            unique_id = f"log-{index}-{self._button_counter}"
+    SORT_LABELS = {"duration": "duração", "wait": "espera"}
+
+    def __init__(self, targets):
+        super().__init__()
+        self.multi_target = len(targets) > 1
+        # Máximo de sessões na tabela (0 exibe todas)
+        self.max_rows = int(os.environ.get('MONITOR_TOP_SESSIONS', '200'))
+        self.sort_key = "duration"
+        # Amostra mais recente de cada servidor ainda não exibida
+        self._pending = {}
+        self._latest = {}
+        # Valores exibidos de cada linha, por chave
+        self._rows = {}
+        # Bloqueadores raiz da última captura de cada servidor
+        self._blockers = {}
+
+    def compose(self) -> ComposeResult:
+        """Compõe a tabela de sessões"""
+        yield Container(
+            Label("Sessões ativas", id="sessions-title", classes="section-title"),
+            Static("", id="lock-blockers"),
+            DataTable(id="sessions-table", cursor_type="row", zebra_stripes=True),
+            id="sessions-container"
+        )
+
+    def on_mount(self):
+        table = self.query_one(DataTable)
+        if self.multi_target:
+            table.add_column("Servidor", key="target")
+        table.add_column("PID", key="pid")
+        table.add_column("Usuário", key="user")
+        table.add_column("Banco", key="db")
+        table.add_column("Estado", key="state")
+        table.add_column("Duração (s)", key="duration")
+        table.add_column("Espera", key="wait")
+        table.add_column("SQL", key="query")
+        self.set_interval(self.REFRESH_INTERVAL, self._apply)
+
+    def update_sessions(self, target, timestamp, rows):
+        """Registra a amostra mais recente de um servidor (exibida no próximo quadro)"""
+        self._pending[target] = (timestamp, rows)
+
+    def update_blockers(self, target, blockers):
+        """
+        Exibe os bloqueadores raiz da última captura de um servidor
+
+        Args:
+            target: Servidor da captura
+            blockers: Lista de LockGraph.root_blockers() (vazia limpa o servidor)
+        """
+        self._blockers[target] = blockers
+        lines = []
+        for label, roots in self._blockers.items():
+            prefix = f"[{label}] " if self.multi_target else ""
+            for root in roots[:3]:
+                cycle = " (ciclo)" if root["cycle"] else ""
+                query = " ".join((root["query"] or "").split())[:60]
+                lines.append(f"{prefix}PID {root['pid']}{cycle} bloqueia {root['blocked']} "
+                             f"sessões, cadeia de {root['depth']} · {root['usename']}: {query}")
+        widget = self.query_one("#lock-blockers")
+        widget.update("Bloqueadores raiz:\n" + "\n".join(lines) if lines else "")
+        widget.display = bool(lines)
+
+    def action_sort_by(self, key):
+        """Muda a ordenação da tabela"""
+        self.sort_key = key
+        self._apply(force=True)
+
+    def _sort_value(self, timestamp, row):
+        """Chave de ordenação calculada direto da linha amostrada, sem formatá-la"""
+        duration = timestamp - row[5] if row[5] else 0.0
+        if self.sort_key == "wait":
+            # Sessões esperando primeiro, agrupadas pelo evento, as mais longas antes
+            return (row[6] is None, row[6] or "", row[7] or "", -duration)
+        return -duration
+
+    def _cells(self, target, timestamp, row):
+        """Valores exibidos de uma linha amostrada (ordem de sampler.HISTORY_COLUMNS)"""
+        pid, usename, datname, state, _, query_start, wait_type, wait_event, query = row
+        duration = round(max(0.0, timestamp - query_start), 1) if query_start else 0.0
+        cells = {
+            "pid": pid,
+            "user": usename or "",
+            "db": datname or "",
+            "state": state or "",
+            "duration": duration,
+            "wait": f"{wait_type}:{wait_event}" if wait_type else "",
+            "query": " ".join((query or "")[:self.QUERY_WIDTH * 2].split())[:self.QUERY_WIDTH],
+        }
+        if self.multi_target:
+            cells["target"] = target
+        return cells
+
+    def _apply(self, force=False):
+        """Aplica à tabela as amostras recebidas desde o último quadro"""
+        if not self._pending and not force:
+            return
+        self._latest.update(self._pending)
+        self._pending = {}
+
+        # Ordena as linhas cruas e formata apenas as que serão exibidas
+        sessions = [(target, timestamp, row)
+                    for target, (timestamp, rows) in self._latest.items() for row in rows]
+        total = len(sessions)
+        sessions.sort(key=lambda session: self._sort_value(session[1], session[2]))
+        if self.max_rows:
+            sessions = sessions[:self.max_rows]
+        visible = {f"{target}:{row[0]}": self._cells(target, timestamp, row)
+                   for target, timestamp, row in sessions}
+
+        table = self.query_one(DataTable)
+        cursor_key = None
+        if table.row_count:
+            cursor_key = table.coordinate_to_cell_key(table.cursor_coordinate).row_key.value
+
+        for key in [key for key in self._rows if key not in visible]:
+            table.remove_row(key)
+            del self._rows[key]
+
+        for key, cells in visible.items():
+            shown = self._rows.get(key)
+            if shown is None:
+                table.add_row(*(cells[column.key.value] for column in table.ordered_columns), key=key)
+            else:
+                for column, value in cells.items():
+                    if shown[column] != value:
+                        table.update_cell(key, column, value)
+            self._rows[key] = cells
+
+        # A tabela segue a mesma ordem usada para escolher as linhas exibidas
+        if self.sort_key == "wait":
+            table.sort("wait", "duration", key=lambda c: (c[0] == "", c[0], -c[1]))
+        else:
+            table.sort("duration", reverse=True)
 
-            # Monta o botão com o ID único
-            log_button = Button(f"{timestamp}", id=unique_id)
-            # Adiciona o índice como um atributo para identificação posterior
-            log_button.log_index = index
+        # Mantém o cursor na mesma sessão após a reordenação
+        if cursor_key in self._rows:
+            table.move_cursor(row=table.get_row_index(cursor_key), scroll=False)
 
-            # Monta o botão na interface
-            log_list.mount(log_button)
+        shown = f"{len(visible)} de {total}" if len(visible) < total else f"{total}"
+        self.query_one("#sessions-title").update(
+            f"Sessões ativas ({shown}) · ordem: {self.SORT_LABELS[self.sort_key]}")
 
 
 class MonitorConfigWidget(Static):
@@ -189,6 +751,12 @@ class MonitorConfigWidget(Static):
         # Lê o threshold atual da variável de ambiente
         current_threshold = os.environ.get('MONITOR_THRESHOLD', '2.0')
 
+        targets_file = os.environ.get('MONITOR_TARGETS_FILE')
+        if targets_file:
+            db_info = f"Multi-servidor: {os.path.basename(targets_file)}"
+        else:
+            db_info = f"{os.environ.get('PGHOST', 'localhost')}:{os.environ.get('PGPORT', '5432')}/{os.environ.get('PGDATABASE', 'postgres')}"
+
         yield Container(
             Label("Configurações de Monitoramento", classes="section-title"),
             Horizontal(
@@ -201,7 +769,7 @@ class MonitorConfigWidget(Static):
             # Linha de informações do banco de dados
             Horizontal(
                 Label("Banco de Dados:", classes="info-label"),
-                Static(f"{os.environ.get('PGHOST', 'localhost')}:{os.environ.get('PGPORT', '5432')}/{os.environ.get('PGDATABASE', 'postgres')}", id="db-info"),
+                Static(db_info, id="db-info"),
                 classes="info-row"
             ),
             # Botão de teste de conexão em uma linha separada
@@ -330,6 +898,38 @@ class MonitorApp(App):
         color: #48bb78;
     }
     
+    #targets-container {
+        background: #1a202c;
+        padding: 1;
+        margin-bottom: 1;
+        height: auto;
+    }
+
+    #sessions-container {
+        background: #1a202c;
+        padding: 1;
+        margin-bottom: 1;
+        height: 1fr;
+    }
+
+    #lock-blockers {
+        display: none;
+        height: auto;
+        color: #f56565;
+        margin-bottom: 1;
+    }
+
+    #sessions-table {
+        height: 1fr;
+    }
+
+    #diagnostics-container {
+        background: #1a202c;
+        padding: 1;
+        margin-bottom: 1;
+        height: auto;
+    }
+
     #config-container {
         background: #1a202c;
         padding: 1;
@@ -345,11 +945,15 @@ class MonitorApp(App):
     
     #log-list {
         margin-top: 1;
-        overflow-y: auto;
-        height: auto;
-        max-height: 35;
+        height: 1fr;
+        min-height: 10;
     }
-    
+
+    #log-count {
+        margin-top: 1;
+        color: #a0aec0;
+    }
+
     .log-empty {
         color: #a0aec0;
         text-align: center;
@@ -360,11 +964,6 @@ class MonitorApp(App):
         margin-right: 1;
     }
     
-    #log-list Button {
-        width: 100%;
-        margin-bottom: 1;
-    }
-
     .config-info {
         margin-top: 1;
         color: #a0aec0;
@@ -377,10 +976,16 @@ class MonitorApp(App):
 
     # Referência para os workers
     _monitor_worker = None
+    # Motor de captura criado pelo worker de monitoramento
+    _engine = None
 
     def __init__(self):
+        from src.targets import create_monitors
+
         super().__init__()
         self.monitoring = False
+        # Servidores monitorados (um só, a menos que MONITOR_TARGETS_FILE esteja definido)
+        self.targets = create_monitors()
         # Lê o threshold da variável de ambiente
         self.load_threshold = float(os.environ.get('MONITOR_THRESHOLD', '2.0'))
         # Lê os intervalos de verificação e captura
@@ -388,6 +993,8 @@ class MonitorApp(App):
             os.environ.get('MONITOR_CHECK_INTERVAL', '10'))
         self.capture_interval = int(
             os.environ.get('MONITOR_CAPTURE_INTERVAL', '60'))
+        # Painel de diagnóstico só com a instrumentação ativa
+        self.instrumentation = instrumentation_enabled()
 
     def compose(self) -> ComposeResult:
         yield Header()
@@ -395,10 +1002,13 @@ class MonitorApp(App):
             Horizontal(
                 Vertical(
                     SystemInfoWidget(),
+                    *([DiagnosticsWidget()] if self.instrumentation else []),
+                    *([TargetStatusWidget(self.targets)] if len(self.targets) > 1 else []),
                     MonitorConfigWidget(),
                     id="left-panel"
                 ),
                 Vertical(
+                    TopSessionsWidget(self.targets),
                     QueryLogWidget(),
                     id="right-panel"
                 ),
@@ -424,14 +1034,13 @@ class MonitorApp(App):
             self.update_threshold()
         elif button_id == "test-connection":
             self.test_database_connection()
-        elif button_id and button_id.startswith("log-"):
-            # Visualizar um arquivo de log
-            self.view_log_file(button_id.replace("log-", ""))
+
+    def on_log_list_view_selected(self, message: LogListView.Selected):
+        """Abre o arquivo de log escolhido na lista"""
+        self.view_log_file(message.path)
 
     def test_database_connection(self):
         """Testa a conexão com o banco de dados PostgreSQL"""
-        from src.postgresql import PostgresMonitor
-
         # Atualiza o status da conexão para "Testando..."
         conn_status = self.query_one("#connection-status")
         conn_status.remove_class("connection-success")
@@ -454,9 +1063,24 @@ class MonitorApp(App):
         # Dá tempo para a interface se atualizar
         await asyncio.sleep(0.5)
 
-        # Testa a conexão
-        pg_monitor = PostgresMonitor()
-        result = pg_monitor.test_connection()
+        # Testa a conexão de todos os servidores em paralelo, fora do loop de
+        # eventos, com monitores próprios para não fechar os pools em uso
+        loop = asyncio.get_running_loop()
+        monitors = [PostgresMonitor(target.connection_params, name=target.name)
+                    for target in self.targets]
+        results = await asyncio.gather(*(
+            loop.run_in_executor(None, monitor.test_connection) for monitor in monitors))
+
+        if len(monitors) == 1:
+            result = results[0]
+        else:
+            failed = [monitor.label for monitor, r in zip(monitors, results) if not r["success"]]
+            lines = [f"{monitor.label}: {'OK' if r['success'] else r['message']}"
+                     for monitor, r in zip(monitors, results)]
+            result = {
+                "success": len(failed) < len(monitors),
+                "message": "\n".join(lines)
+            }
 
         # Atualiza a interface com o resultado
         conn_status = self.query_one("#connection-status")
@@ -491,9 +1115,8 @@ class MonitorApp(App):
             self.notify(f"Limiar de carga atualizado para {value}")
 
             # Atualiza o limiar no monitor caso esteja em execução
-            if self.monitoring:
-                self.stop_monitoring()
-                self.start_monitoring()
+            if self._engine is not None:
+                self._engine.load_monitor.threshold = value
 
         except ValueError:
             self.notify("Por favor, insira um número válido", severity="error")
@@ -525,106 +1148,133 @@ class MonitorApp(App):
         self.query_one("#start-monitor").disabled = False
         self.query_one("#stop-monitor").disabled = True
 
-    def view_log_file(self, log_id):
-        """Visualiza o conteúdo de um arquivo de log"""
-        try:
-            # O log_id agora é algo como "0-123" (índice-contador)
-            log_id_parts = log_id.split("-")
-            if len(log_id_parts) >= 1:
-                index = int(log_id_parts[0])
-            else:
-                self.notify("Formato de ID de log inválido", severity="error")
-                return
-
-            # Obtém o nome do arquivo de log a partir do índice
-            log_files = self.query_one(QueryLogWidget).log_files
-            if index < 0 or index >= len(log_files):
-                self.notify("Índice de log inválido", severity="error")
-                return
-
-            filename = log_files[index]
+    def view_log_file(self, filename):
+        """
+        Visualiza o conteúdo de um arquivo de log
 
+        Args:
+            filename: Caminho do arquivo relativo ao diretório de logs
+        """
+        try:
             filepath = os.path.join(os.getcwd(), "logs", filename)
             if not os.path.exists(filepath):
                 self.notify(
                     f"Arquivo não encontrado: {filename}", severity="error")
                 return
 
-            # Abre o arquivo em um visualizador less/more dependendo do sistema
-            if os.name == 'posix':
-                os.system(f"less '{filepath}'")
-            else:
-                os.system(f"more \"{filepath}\"")
+            # Abre o arquivo no visualizador interno, que lê sob demanda
+            self.push_screen(LogViewerScreen(filepath))
 
-        except ValueError as e:
-            self.notify(f"Erro ao abrir log: {str(e)}", severity="error")
         except Exception as e:
             self.notify(f"Erro desconhecido: {str(e)}", severity="error")
 
+    def on_engine_event(self, message):
+        """Recebe os eventos do motor de captura e atualiza os widgets"""
+        data = message.data
+
+        if message.event == "system_info":
+            self.query_one(SystemInfoWidget).update_info(data["info"])
+        elif message.event == "high_load_start":
+            # Log inicial imediato quando detectamos load alto
+            if data.get("triggers"):
+                self.notify(f"Load alto detectado: {', '.join(data['triggers'])}")
+            else:
+                self.notify(
+                    f"Load alto detectado: {data['load']:.2f} (threshold: {data['threshold']})")
+        elif message.event == "capture_saved":
+            # O arquivo já está no índice; a lista é atualizada sem varrer o diretório
+            self.query_one(QueryLogWidget).update_logs()
+            self.notify(
+                f"Novas consultas PostgreSQL salvas em {os.path.basename(data['path'])}")
+        elif message.event == "history_stats":
+            self.query_one(SystemInfoWidget).update_history(
+                data["samples"], data["memory_bytes"])
+        elif message.event == "history_saved":
+            self.query_one(QueryLogWidget).update_logs()
+            self.notify(
+                f"Histórico de {data['samples']} amostras anterior ao load alto salvo em {os.path.basename(data['path'])}")
+        elif message.event == "collection_cost":
+            self.query_one(SystemInfoWidget).update_cost(data["costs"])
+        elif message.event == "pipeline_stats":
+            self.query_one(DiagnosticsWidget).update_stats(data["stats"])
+        elif message.event == "writer_stats":
+            if self.instrumentation:
+                self.query_one(DiagnosticsWidget).update_writer(data["stats"])
+        elif message.event == "capture_dropped":
+            self.notify(f"[{data['target']}] Captura de {data['count']} consultas descartada: "
+                        f"fila de gravação cheia", severity="warning")
+        elif message.event == "database_stats":
+            self.query_one(SystemInfoWidget).update_database(data["target"], data["rates"])
+        elif message.event == "lock_blockers":
+            self.query_one(TopSessionsWidget).update_blockers(data["target"], data["blockers"])
+        elif message.event == "sessions":
+            self.query_one(TopSessionsWidget).update_sessions(
+                data["target"], data["timestamp"], data["rows"])
+        elif message.event == "capture_empty":
+            if len(self.targets) == 1:
+                self.notify("Nenhuma consulta ativa encontrada no PostgreSQL")
+        elif message.event == "target_status":
+            if len(self.targets) > 1:
+                self.query_one(TargetStatusWidget).update_target(
+                    data["target"], data["ok"], data["message"])
+        elif message.event == "high_load_end":
+            self.notify(
+                f"Load normalizado após {data['duration']:.0f} segundos")
+            # Sem capturas, os bloqueadores exibidos deixariam de ser atuais
+            sessions = self.query_one(TopSessionsWidget)
+            for target in self.targets:
+                sessions.update_blockers(target.label, [])
+        elif message.event == "incident_summary":
+            # O incidente encerrado passa a mostrar duração, capturas e pico na lista
+            self.query_one(QueryLogWidget).update_logs()
+            sections = [f"Incidente encerrado: {data['duration']:.0f}s, "
+                        f"{data['captures']} capturas, pico de load {data['peak_load']:.2f}"]
+            if data["top"]:
+                lines = [f"{stats['total_duration']:.0f}s em {stats['executions']} execuções: "
+                         f"{stats['query'][:60]}" for stats in data["top"][:3]]
+                sections.append("Consultas que mais consumiram tempo no episódio:\n"
+                                + "\n".join(lines))
+            if data["statements"]:
+                lines = [f"{statement['total_exec_time'] / 1000:.1f}s em {statement['calls']} chamadas: "
+                         f"{(statement['query'] or str(statement['queryid']))[:60]}"
+                         for statement in data["statements"][:3]]
+                sections.append("Comandos com mais tempo de execução (pg_stat_statements):\n"
+                                + "\n".join(lines))
+            self.notify(f"[{data['target']}] " + "\n\n".join(sections), timeout=30)
+        elif message.event == "retention":
+            if data["removed"] or data["compacted"] or data["compressed"]:
+                # Arquivos removidos, reunidos ou comprimidos mudam na lista
+                self.query_one(QueryLogWidget).update_logs()
+                parts = []
+                if data["compacted"]:
+                    parts.append(f"{data['compacted']} arquivos compactados em "
+                                 f"{data['archives']} arquivos diários")
+                if data["compressed"]:
+                    parts.append(f"{data['compressed']} incidentes comprimidos")
+                if data["removed"]:
+                    parts.append(f"{data['removed']} arquivos antigos removidos "
+                                 f"({data['removed_bytes'] / (1024 * 1024):.1f} MB)")
+                self.notify("Logs: " + "; ".join(parts))
+        elif message.event == "notice":
+            self.notify(data["message"], severity=data.get("severity", "information"))
+
+    def on_unmount(self):
+        """Libera o executor de coleta ao encerrar a aplicação"""
+        if self._engine is not None:
+            self._engine.shutdown()
+
     @work(exclusive=True)
     async def _monitor_system(self):
         """Worker para monitorar o sistema em segundo plano"""
         from src.monitor import LoadMonitor
-        from src.postgresql import PostgresMonitor
-        import asyncio
-
-        # Configuração inicial
-        load_monitor = LoadMonitor(self.load_threshold)
-        pg_monitor = PostgresMonitor()
-        system_info_widget = self.query_one(SystemInfoWidget)
-        query_log_widget = self.query_one(QueryLogWidget)
-
-        # Loop de monitoramento
-        high_load_time = None
-        last_log_time = None
-
-        while True:
-            if not self.monitoring:
-                # Usamos asyncio.sleep ao invés de self.sleep
-                await asyncio.sleep(1)
-                continue
+        from src.engine import CaptureEngine
+
+        # As coletas bloqueantes rodam no executor do motor; aqui apenas
+        # repassamos os resultados para a interface como mensagens
+        self._engine = CaptureEngine(
+            LoadMonitor(self.load_threshold),
+            self.targets,
+            emit=lambda event, **data: self.post_message(EngineEvent(event, data)),
+        )
 
-            # Verifica o load average e atualiza o status
-            status_changed = load_monitor.check_load_status()
-            system_info = load_monitor.get_system_info()
-
-            # Atualiza a interface
-            system_info_widget.update_info(system_info)
-
-            # Verificamos is_high_load através do system_info que já tem o valor atualizado
-            if system_info['is_high_load']:
-                # Marca quando começou o load alto
-                if high_load_time is None:
-                    high_load_time = datetime.now()
-                    last_log_time = None
-                    # Log inicial imediato quando detectamos load alto
-                    self.notify(
-                        f"Load alto detectado: {system_info['load_average'][0]:.2f} (threshold: {self.load_threshold})")
-
-                # Se é a primeira vez ou se passou o intervalo de captura desde o último log
-                current_time = datetime.now()
-                if last_log_time is None or (current_time - last_log_time).total_seconds() >= self.capture_interval:
-                    # Obtém e salva as consultas ativas
-                    queries = pg_monitor.get_active_queries()
-                    if queries:
-                        log_path = pg_monitor.save_queries_to_file(queries)
-                        if log_path:
-                            query_log_widget.add_log_file(log_path)
-                            query_log_widget.update_logs()
-                            self.notify(
-                                f"Novas consultas PostgreSQL salvas em {os.path.basename(log_path)}")
-                    else:
-                        self.notify(
-                            "Nenhuma consulta ativa encontrada no PostgreSQL")
-
-                    last_log_time = current_time
-            else:
-                # Se o load estava alto e agora está normal
-                if high_load_time is not None:
-                    duration = datetime.now() - high_load_time
-                    self.notify(
-                        f"Load normalizado após {duration.total_seconds():.0f} segundos")
-                    high_load_time = None
-
-            # Espera o intervalo de verificação antes da próxima verificação
-            await asyncio.sleep(self.check_interval)
+        await self._engine.run(lambda: self.monitoring)
@@ -0,0 +1,473 @@
+#!/usr/bin/env python
+import mmap
+import os
+import re
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from contextlib import contextmanager
+
+from rich.text import Text
+from textual import work
+from textual.app import ComposeResult
+from textual.binding import Binding
+from textual.containers import Horizontal
+from textual.geometry import Size
+from textual.screen import Screen
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+from textual.widgets import Footer, Input, Label, Static
+from textual.worker import get_current_worker
+
+from src.capture_format import is_capture_file, to_text
+
+# Início de cada registro no layout de texto: cabeçalho da captura ou "[Query N]"
+_RECORD = re.compile(rb"^(?:--- |\[Query \d+\])", re.M)
+_NEWLINE = re.compile(rb"\n")
+
+# Quanto o indexador processa por vez, em bytes
+INDEX_CHUNK = 4 * 1024 * 1024
+# Quanto a busca varre por vez antes de verificar se foi cancelada
+SEARCH_CHUNK = 8 * 1024 * 1024
+
+
+class MappedText:
+    def __init__(self, path):
+        """
+        Arquivo de texto mapeado em memória com índice de linhas incremental
+
+        O arquivo não é lido por inteiro: as linhas são localizadas aos poucos
+        por uma thread de indexação e cada linha só é decodificada quando é
+        exibida. O arquivo pode continuar crescendo (conversão em andamento).
+
+        Args:
+            path: Caminho do arquivo de texto
+        """
+        self.path = path
+        self._file = open(path, "rb")
+        self.mm = None
+        self.size = 0
+        # Offset de início de cada linha
+        self.line_offsets = array("Q", [0])
+        # Número da linha de início de cada registro
+        self.record_lines = array("Q")
+        self.max_width = 0
+        self.indexed = 0
+        self.complete = False
+        # Threads lendo o arquivo; o fechamento espera a última delas
+        self._lock = threading.Lock()
+        self._readers = 0
+        self._closed = False
+
+    def remap(self):
+        """Mapeia novamente o arquivo se ele cresceu"""
+        size = os.fstat(self._file.fileno()).st_size
+        if size > self.size:
+            self.mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.size = size
+        return self.size
+
+    def index_more(self, final=False):
+        """
+        Indexa o próximo trecho do arquivo
+
+        Args:
+            final: Se True, o arquivo não vai mais crescer e a última linha
+                   pode terminar sem quebra de linha
+
+        Returns:
+            True se algo novo foi indexado
+        """
+        if self.mm is None or self.indexed >= self.size:
+            if final:
+                self.complete = True
+            return False
+
+        start = self.indexed
+        end = min(self.size, start + INDEX_CHUNK)
+        if end < self.size or not final:
+            # Processa só até a última quebra de linha do trecho
+            last = self.mm.rfind(b"\n", start, end)
+            if last < 0:
+                # Linha maior que o trecho: avança até a próxima quebra
+                last = self.mm.find(b"\n", end)
+            if last >= 0:
+                end = last + 1
+            elif final:
+                end = self.size
+            else:
+                return False
+
+        first_line = len(self.line_offsets) - 1
+        offsets = self.line_offsets
+        previous = offsets[-1]
+        max_width = self.max_width
+        for match in _NEWLINE.finditer(self.mm, start, end):
+            offset = match.end()
+            if offset - previous > max_width:
+                max_width = offset - previous
+            offsets.append(offset)
+            previous = offset
+        self.max_width = max_width
+
+        for match in _RECORD.finditer(self.mm, start, end):
+            line = bisect_right(offsets, match.start(), first_line) - 1
+            self.record_lines.append(line)
+
+        self.indexed = end
+        if final and self.indexed >= self.size:
+            self.complete = True
+        return True
+
+    @property
+    def line_count(self):
+        count = len(self.line_offsets) - 1
+        if self.complete and self.line_offsets[-1] < self.size:
+            count += 1
+        return count
+
+    def line(self, number):
+        """Decodifica uma linha pelo número"""
+        start = self.line_offsets[number]
+        if number + 1 < len(self.line_offsets):
+            end = self.line_offsets[number + 1] - 1
+        else:
+            end = self.size
+        return self.mm[start:end].decode("utf-8", errors="replace").expandtabs(4)
+
+    def line_at(self, offset):
+        """Número da linha que contém um offset já indexado"""
+        return bisect_right(self.line_offsets, offset) - 1
+
+    @contextmanager
+    def use(self):
+        """
+        Mantém o arquivo aberto enquanto uma thread o lê
+
+        Raises:
+            ValueError: Se o arquivo já foi fechado
+        """
+        with self._lock:
+            if self._closed:
+                raise ValueError("arquivo do visualizador fechado")
+            self._readers += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._readers -= 1
+                release = self._closed and self._readers == 0
+            if release:
+                self._release()
+
+    def close(self):
+        """Fecha o arquivo, ou deixa o fechamento para a última thread que o lê"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._readers:
+                return
+        self._release()
+
+    def _release(self):
+        if self.mm is not None:
+            self.mm.close()
+        self._file.close()
+
+
+class LogView(ScrollView, can_focus=True):
+    """Exibe um MappedText renderizando apenas as linhas visíveis"""
+
+    DEFAULT_CSS = """
+    LogView {
+        height: 1fr;
+        background: #0f1419;
+        color: #e4e7eb;
+    }
+    """
+
+    def __init__(self, text, **kwargs):
+        super().__init__(**kwargs)
+        self.text = text
+        self.pattern = None
+        self.highlight_line = None
+
+    def refresh_size(self):
+        """Atualiza a área rolável conforme o índice de linhas avança"""
+        self.virtual_size = Size(self.text.max_width, self.text.line_count)
+        self.refresh()
+
+    def render_line(self, y):
+        scroll_x, scroll_y = self.scroll_offset
+        number = scroll_y + y
+        width = self.size.width
+        if number >= self.text.line_count:
+            return Strip.blank(width, self.rich_style)
+
+        line = Text(self.text.line(number), no_wrap=True, style=self.rich_style)
+        if self.pattern is not None:
+            line.highlight_regex(self.pattern, style="black on yellow")
+        if number == self.highlight_line:
+            line.stylize("bold")
+
+        strip = Strip(line.render(self.app.console), line.cell_len)
+        return strip.crop_extend(scroll_x, scroll_x + width, self.rich_style)
+
+    def goto(self, number, highlight=False):
+        """Rola até uma linha, posicionando-a no topo"""
+        if highlight:
+            self.highlight_line = number
+        self.scroll_to(y=number, animate=False)
+        self.refresh()
+
+
+class LogViewerScreen(Screen):
+    """Visualizador de arquivos de captura dentro da aplicação"""
+
+    BINDINGS = [
+        Binding("escape", "close", "Fechar"),
+        Binding("slash", "search", "Buscar"),
+        Binding("n", "next_match", "Próximo"),
+        Binding("N", "previous_match", "Anterior"),
+        Binding("right_square_bracket", "next_record", "Próx. registro"),
+        Binding("left_square_bracket", "previous_record", "Registro ant."),
+        Binding("g", "top", "Início", show=False),
+        Binding("G", "bottom", "Fim", show=False),
+    ]
+
+    DEFAULT_CSS = """
+    LogViewerScreen #viewer-bar {
+        height: 1;
+        background: #1f2933;
+        color: #e4e7eb;
+    }
+
+    LogViewerScreen #viewer-title {
+        width: 1fr;
+    }
+
+    LogViewerScreen #viewer-status {
+        width: auto;
+        color: #a0aec0;
+    }
+
+    LogViewerScreen #viewer-search {
+        display: none;
+    }
+
+    LogViewerScreen #viewer-search.visible {
+        display: block;
+    }
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._spool = None
+        self._source_done = False
+        self._search = None
+        self._match_offset = -1
+
+    def compose(self) -> ComposeResult:
+        yield Horizontal(
+            Label(os.path.basename(self.path), id="viewer-title"),
+            Static("Carregando...", id="viewer-status"),
+            id="viewer-bar"
+        )
+        yield Input(placeholder="Buscar (Enter: próximo, Esc: fechar)", id="viewer-search")
+        yield Footer()
+
+    def on_mount(self):
+        # Capturas estruturadas são convertidas para o layout de texto em um
+        # arquivo temporário; o visualizador acompanha a conversão enquanto ela avança
+        if is_capture_file(self.path):
+            fd, self._spool = tempfile.mkstemp(suffix=".log", prefix="pg_viewer_")
+            os.close(fd)
+            source = self._spool
+            self._convert()
+        else:
+            source = self.path
+            self._source_done = True
+
+        self.text = MappedText(source)
+        self.view = LogView(self.text, id="viewer-text")
+        self.mount(self.view, after="#viewer-bar")
+        self.view.focus()
+        self._index()
+        self.set_interval(0.25, self._refresh_status)
+
+    @work(thread=True, exclusive=True, group="viewer-convert")
+    def _convert(self):
+        """Converte a captura estruturada para texto em segundo plano"""
+        worker = get_current_worker()
+        try:
+            with open(self._spool, "w", encoding="utf-8") as out:
+                # Para assim que o visualizador é fechado
+                to_text(self.path, out, cancelled=lambda: worker.is_cancelled)
+        except Exception as e:
+            self.app.call_from_thread(
+                self.notify, f"Erro ao converter captura: {e}", severity="error")
+        finally:
+            self._source_done = True
+
+    @work(thread=True, exclusive=True, group="viewer-index", exit_on_error=False)
+    def _index(self):
+        """Indexa as linhas do arquivo em segundo plano, em trechos"""
+        worker = get_current_worker()
+        try:
+            # O arquivo só é fechado quando o indexador sai daqui
+            with self.text.use():
+                while not worker.is_cancelled and not self.text.complete:
+                    done = self._source_done
+                    self.text.remap()
+                    if not self.text.index_more(final=done) and not done:
+                        time.sleep(0.1)
+        except ValueError:
+            # Visualizador fechado
+            pass
+
+    def _refresh_status(self):
+        """Atualiza a área rolável e a linha de status"""
+        self.view.refresh_size()
+        if not self._source_done:
+            # A busca só alcança o trecho já convertido
+            state = " (convertendo...)"
+        else:
+            state = "" if self.text.complete else " (indexando...)"
+        self.query_one("#viewer-status").update(
+            f"{self.text.line_count} linhas, {len(self.text.record_lines)} registros, "
+            f"{self.text.size / 1024 / 1024:.1f} MB{state}")
+
+    def action_close(self):
+        search = self.query_one("#viewer-search")
+        if search.has_class("visible"):
+            search.remove_class("visible")
+            self.view.focus()
+            return
+        self.dismiss()
+
+    def on_unmount(self):
+        self.workers.cancel_group(self, "viewer-convert")
+        self.workers.cancel_group(self, "viewer-index")
+        self.workers.cancel_group(self, "viewer-search")
+        self.text.close()
+        if self._spool:
+            try:
+                os.remove(self._spool)
+            except OSError:
+                pass
+
+    def action_search(self):
+        search = self.query_one("#viewer-search")
+        search.add_class("visible")
+        search.focus()
+
+    def on_input_changed(self, event: Input.Changed):
+        """Busca incremental: recomeça a cada tecla a partir da posição atual"""
+        text = event.value
+        if not text:
+            self._search = None
+            self.view.pattern = None
+            self.view.refresh()
+            return
+        self._search = re.compile(re.escape(text).encode("utf-8"), re.I)
+        self.view.pattern = re.compile(re.escape(text), re.I)
+        self._find(self._top_offset(), forward=True)
+
+    def on_input_submitted(self, event: Input.Submitted):
+        self.action_next_match()
+
+    def _top_offset(self):
+        top = min(self.view.scroll_offset.y, max(0, len(self.text.line_offsets) - 1))
+        return self.text.line_offsets[top]
+
+    def action_next_match(self):
+        if self._search is not None:
+            self._find(self._match_offset + 1, forward=True)
+
+    def action_previous_match(self):
+        if self._search is not None:
+            self._find(max(0, self._match_offset), forward=False)
+
+    @work(thread=True, exclusive=True, group="viewer-search", exit_on_error=False)
+    def _find(self, start, forward=True):
+        """Procura o padrão em segundo plano, em trechos, a partir de um offset"""
+        try:
+            with self.text.use():
+                self._search_from(get_current_worker(), start, forward)
+        except ValueError:
+            # Visualizador fechado
+            pass
+
+    def _search_from(self, worker, start, forward):
+        pattern = self._search
+        converted = self._source_done
+        mm = self.text.mm
+        size = self.text.size
+        if mm is None or pattern is None:
+            return
+
+        found = None
+        if forward:
+            # Do offset até o fim, depois do começo até o offset
+            ranges = [(start, size), (0, min(start, size))]
+            for begin, end in ranges:
+                position = begin
+                while position < end and found is None:
+                    if worker.is_cancelled:
+                        return
+                    chunk_end = min(end, position + SEARCH_CHUNK)
+                    # Sobreposição para não perder ocorrências na fronteira
+                    match = pattern.search(mm, position, min(end, chunk_end + 1024))
+                    if match is not None and match.start() < chunk_end:
+                        found = match.start()
+                    position = chunk_end
+                if found is not None:
+                    break
+        else:
+            position = start
+            while position > 0 and found is None:
+                if worker.is_cancelled:
+                    return
+                chunk_start = max(0, position - SEARCH_CHUNK)
+                for match in pattern.finditer(mm, chunk_start, position):
+                    found = match.start()
+                position = chunk_start
+
+        if found is None:
+            message = "Texto não encontrado" if converted else \
+                "Texto não encontrado no trecho já convertido (conversão em andamento)"
+            self.app.call_from_thread(self.notify, message, severity="warning")
+            return
+
+        # Aguarda o indexador alcançar a ocorrência para saber a linha
+        while self.text.indexed <= found and not self.text.complete:
+            if worker.is_cancelled:
+                return
+            time.sleep(0.05)
+
+        if worker.is_cancelled:
+            return
+        self._match_offset = found
+        self.app.call_from_thread(self.view.goto, self.text.line_at(found), True)
+
+    def action_next_record(self):
+        records = self.text.record_lines
+        position = bisect_right(records, self.view.scroll_offset.y)
+        if position < len(records):
+            self.view.goto(records[position])
+
+    def action_previous_record(self):
+        records = self.text.record_lines
+        position = bisect_right(records, self.view.scroll_offset.y - 1) - 1
+        if position >= 0:
+            self.view.goto(records[position])
+
+    def action_top(self):
+        self.view.goto(0)
+
+    def action_bottom(self):
+        self.view.goto(max(0, self.text.line_count - 1))
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+"""
+Gravação dos arquivos de captura em uma thread própria
+
+Os gravadores (CaptureWriter) serializam e comprimem as capturas na thread
+da coleta e entregam os blocos prontos a uma fila limitada em bytes. Uma
+thread de gravação esvazia a fila em lotes: abre os arquivos, faz uma
+escrita e um flush por arquivo a cada lote, aplica a política de fsync e,
+por último, executa as chamadas enfileiradas depois dos blocos (a
+atualização do índice de logs, que faz commit no SQLite). Assim a cadência
+das coletas não depende da latência do disco, que durante um incidente é
+muitas vezes o mesmo disco castigado pelo PostgreSQL.
+
+Quando a fila passa do limite, a política de estouro decide:
+
+    drop   a próxima captura é descartada por inteiro (contada), sem
+           deixar o arquivo inconsistente; a captura em andamento termina
+    block  a coleta espera a fila esvaziar (a cadência passa a depender do disco)
+"""
+import os
+import threading
+import time
+from collections import deque
+from functools import partial
+
+from src.instrumentation import LatencyHistogram
+
+# Quando sincronizar os arquivos com o disco (MONITOR_FSYNC)
+FSYNC_POLICIES = ("never", "close", "capture")
+# O que fazer com a fila cheia (MONITOR_WRITE_OVERFLOW)
+OVERFLOW_POLICIES = ("drop", "block")
+
+# Escritor compartilhado do processo (None se a gravação for síncrona)
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """
+    Retorna o escritor em segundo plano compartilhado, criando se necessário
+
+    Returns:
+        O BackgroundWriter, ou None com MONITOR_WRITE_QUEUE_BYTES=0
+        (gravação síncrona, na thread da coleta)
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            max_bytes = int(os.environ.get('MONITOR_WRITE_QUEUE_BYTES', str(32 * 1024 * 1024)))
+            if max_bytes <= 0:
+                return None
+            _writer = BackgroundWriter(max_bytes)
+        return _writer
+
+
+class BackgroundWriter:
+    def __init__(self, max_bytes, fsync=None, overflow=None):
+        """
+        Thread de gravação com fila limitada em bytes
+
+        Args:
+            max_bytes: Limite da fila em bytes
+            fsync: "never", "close" ou "capture".
+                   Se None, lê do ambiente MONITOR_FSYNC (padrão: close)
+            overflow: "drop" ou "block".
+                      Se None, lê do ambiente MONITOR_WRITE_OVERFLOW (padrão: drop)
+        """
+        fsync = (fsync or os.environ.get('MONITOR_FSYNC', 'close')).lower()
+        overflow = (overflow or os.environ.get('MONITOR_WRITE_OVERFLOW', 'drop')).lower()
+        if fsync not in FSYNC_POLICIES:
+            print(f"MONITOR_FSYNC desconhecido: {fsync}; usando close")
+            fsync = "close"
+        if overflow not in OVERFLOW_POLICIES:
+            print(f"MONITOR_WRITE_OVERFLOW desconhecido: {overflow}; usando drop")
+            overflow = "drop"
+
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.overflow = overflow
+
+        # Itens (caminho, dados, None para fechar ou função a chamar, sincronizar)
+        self._queue = deque()
+        # Arquivos abertos pela thread de gravação, por caminho
+        self._files = {}
+        self._condition = threading.Condition()
+        self._thread = None
+        # Itens retirados da fila e ainda não gravados
+        self._writing = 0
+
+        self.queued_bytes = 0
+        self.peak_queued_bytes = 0
+        self.written_bytes = 0
+        self.batches = 0
+        self.fsyncs = 0
+        self.errors = 0
+        self.dropped_captures = 0
+        self.blocked_ms = 0.0
+        # Duração de cada lote gravado (escrita, flush e fsync)
+        self.latency = LatencyHistogram()
+
+    def accepting(self):
+        """
+        Se uma nova captura pode ser gravada
+
+        Com a política drop e a fila acima do limite, a captura deve ser
+        descartada (e registrada com record_drop).
+        """
+        return self.overflow == "block" or self.queued_bytes < self.max_bytes
+
+    def record_drop(self):
+        """Conta uma captura descartada por fila cheia"""
+        with self._condition:
+            self.dropped_captures += 1
+
+    def write(self, path, data, sync=False):
+        """
+        Enfileira um bloco para gravação
+
+        Args:
+            path: Caminho do arquivo, aberto em modo append no primeiro bloco
+            data: Bytes do bloco
+            sync: Se True e a política for "capture", sincroniza o arquivo depois
+        """
+        self._put(path, data, sync and self.fsync == "capture")
+
+    def close(self, path):
+        """Enfileira o fechamento de um arquivo, depois dos blocos já enfileirados"""
+        self._put(path, None, self.fsync != "never")
+
+    def call(self, func, *args):
+        """
+        Enfileira uma chamada, executada na thread de gravação depois dos
+        blocos já enfileirados (e do flush dos seus arquivos)
+        """
+        self._put(None, partial(func, *args), False)
+
+    def _put(self, path, data, sync):
+        size = len(data) if isinstance(data, bytes) else 0
+        with self._condition:
+            if self.overflow == "block" and size:
+                started = None
+                # Um bloco sozinho maior que o limite passa com a fila vazia
+                while self.queued_bytes and self.queued_bytes + size > self.max_bytes:
+                    if started is None:
+                        started = time.perf_counter()
+                    self._condition.wait()
+                if started is not None:
+                    self.blocked_ms += (time.perf_counter() - started) * 1000
+
+            self._queue.append((path, data, sync))
+            self.queued_bytes += size
+            self.peak_queued_bytes = max(self.peak_queued_bytes, self.queued_bytes)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="monitor-gravacao", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                batch = list(self._queue)
+                self._queue.clear()
+                self._writing = len(batch)
+            self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        """
+        Grava um lote: os blocos de cada arquivo em ordem, com um flush por
+        arquivo, e depois as chamadas enfileiradas, na ordem
+        """
+        started = time.perf_counter()
+        written = 0
+        fsyncs = errors = 0
+        pending = {}
+        calls = []
+
+        for path, data, sync in batch:
+            if callable(data):
+                calls.append(data)
+                continue
+            try:
+                if data is not None:
+                    file = self._files.get(path)
+                    if file is None:
+                        file = self._files[path] = open(path, "ab")
+                    file.write(data)
+                    written += len(data)
+                    pending[path] = pending.get(path, False) or sync
+                    continue
+
+                # Fechamento: grava o que falta do arquivo antes
+                pending.pop(path, None)
+                file = self._files.pop(path, None)
+                if file is not None:
+                    try:
+                        file.flush()
+                        if sync:
+                            os.fsync(file.fileno())
+                            fsyncs += 1
+                    finally:
+                        file.close()
+            except (OSError, ValueError) as e:
+                errors += 1
+                print(f"Erro ao gravar {path}: {e}")
+                pending.pop(path, None)
+
+        for path, sync in pending.items():
+            try:
+                file = self._files[path]
+                file.flush()
+                if sync:
+                    os.fsync(file.fileno())
+                    fsyncs += 1
+            except (OSError, ValueError) as e:
+                errors += 1
+                print(f"Erro ao gravar {path}: {e}")
+
+        for call in calls:
+            try:
+                call()
+            except Exception as e:
+                errors += 1
+                print(f"Erro na gravação em segundo plano: {e}")
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._condition:
+            self.queued_bytes -= sum(len(data) for _, data, _ in batch if isinstance(data, bytes))
+            self.written_bytes += written
+            self.batches += 1
+            self.fsyncs += fsyncs
+            self.errors += errors
+            self.latency.observe(elapsed_ms)
+            self._writing = 0
+            self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        Espera a fila esvaziar
+
+        Args:
+            timeout: Prazo máximo em segundos. Se None, espera sem limite
+
+        Returns:
+            True se tudo foi gravado dentro do prazo
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._queue or self._writing:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def stats(self):
+        """Snapshot dos contadores da gravação"""
+        with self._condition:
+            return {
+                "queued_bytes": self.queued_bytes,
+                "peak_queued_bytes": self.peak_queued_bytes,
+                "max_bytes": self.max_bytes,
+                "written_bytes": self.written_bytes,
+                "batches": self.batches,
+                "fsyncs": self.fsyncs,
+                "errors": self.errors,
+                "dropped_captures": self.dropped_captures,
+                "blocked_ms": self.blocked_ms,
+                "fsync": self.fsync,
+                "overflow": self.overflow,
+                "latency": self.latency.as_dict(),
+            }
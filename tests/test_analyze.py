@@ -0,0 +1,104 @@
+import os
+from datetime import datetime, timedelta
+
+from src.analyze import analyze, analyze_file, capture_files
+from src.capture_format import CaptureWriter
+
+START = datetime(2025, 1, 1, 12, 0, 0)
+LONG = "SELECT * FROM pedidos WHERE cliente = 42"
+SHORT = "UPDATE estoque SET qtd = qtd - 1 WHERE id = 7"
+
+
+def session(pid, query, query_start, now):
+    return {"pid": pid, "usename": "app", "datname": "loja", "backend_start": START,
+            "state": "active", "query_start": query_start, "duration": now - query_start,
+            "query": query, "wait_event_type": None, "wait_event": None}
+
+
+def captures():
+    """Uma execução longa de 50s que atravessa os arquivos e execuções curtas"""
+    result = []
+    for index in range(1, 6):
+        now = START + timedelta(seconds=10 * index)
+        sessions = [session(1, LONG, START, now)]
+        # Uma execução curta nova a cada captura (pids diferentes)
+        sessions.append(session(100 + index, SHORT, now - timedelta(seconds=2), now))
+        result.append((now, sessions))
+    return result
+
+
+def write(directory, name, entries):
+    os.makedirs(directory, exist_ok=True)
+    writer = CaptureWriter(os.path.join(directory, name), header={"host": "db1", "port": 5432})
+    for now, sessions in entries:
+        writer.write_capture(sessions, now, (2.0, 1.0, 1.0))
+    writer.close()
+
+
+def by_query(analysis):
+    return {stats["query"]: stats for stats in analysis.as_dict()["fingerprints"]}
+
+
+def test_execution_spanning_two_files_is_counted_once(tmp_path):
+    entries = captures()
+    write(str(tmp_path / "split"), "pg_history_20250101_120000.pgcap", entries[:3])
+    write(str(tmp_path / "split"), "pg_history_20250101_120030.pgcap", entries[3:])
+    write(str(tmp_path / "single"), "pg_history_20250101_120000.pgcap", entries)
+
+    split = analyze(str(tmp_path / "split"), jobs=1)
+    single = analyze(str(tmp_path / "single"), jobs=1)
+    assert split.files == 2 and split.captures == 5
+
+    fingerprints = by_query(split)
+    assert len(fingerprints) == 2
+    long = next(stats for query, stats in fingerprints.items() if "pedidos" in query)
+    assert long["executions"] == 1
+    assert long["total_duration"] == 50
+    assert long["max_duration"] == 50
+    assert split.durations["<=60s"] == 1
+
+    expected = single.as_dict()
+    result = split.as_dict()
+    for field in ("fingerprints", "users", "databases", "durations", "waits", "sessions"):
+        assert result[field] == expected[field]
+
+
+def test_head_and_tail_keep_only_merge_fields(tmp_path):
+    write(str(tmp_path), "pg_history_20250101_120000.pgcap", captures())
+    analysis = analyze_file(str(tmp_path / "pg_history_20250101_120000.pgcap"))
+    assert {key[0] for key in analysis.head} == {1, 101}
+    assert {key[0] for key in analysis.tail} == {1, 105}
+    assert all(len(execution) == 4 for execution in analysis.tail.values())
+    # A execução longa leva a duração do fim do arquivo
+    assert analysis.tail[next(key for key in analysis.tail if key[0] == 1)][3] == 50
+
+
+def test_files_of_different_servers_are_not_merged(tmp_path):
+    entries = captures()
+    write(str(tmp_path / "db1"), "pg_history_20250101_120000.pgcap", entries[:3])
+    write(str(tmp_path / "db2"), "pg_history_20250101_120030.pgcap", entries[3:])
+    long = next(stats for query, stats in by_query(analyze(str(tmp_path), jobs=1)).items()
+                if "pedidos" in query)
+    # Mesmo pid em servidores diferentes: duas execuções
+    assert long["executions"] == 2
+
+
+def test_parallel_and_serial_results_match(tmp_path):
+    entries = captures()
+    for now, sessions in entries:
+        write(str(tmp_path), f"pg_queries_{now.strftime('%Y%m%d_%H%M%S')}.pgcap", [(now, sessions)])
+    assert len(capture_files(str(tmp_path))) == 5
+
+    serial = analyze(str(tmp_path), jobs=1).as_dict()
+    parallel = analyze(str(tmp_path), jobs=3).as_dict()
+    assert parallel == serial
+    long = next(stats for stats in serial["fingerprints"] if "pedidos" in stats["query"])
+    assert long["executions"] == 1 and long["total_duration"] == 50
+
+
+def test_period_filter(tmp_path):
+    write(str(tmp_path), "pg_history_20250101_120000.pgcap", captures())
+    analysis = analyze(str(tmp_path), since=START + timedelta(seconds=20),
+                       until=START + timedelta(seconds=40), jobs=1)
+    assert analysis.captures == 2
+    assert analysis.first == (START + timedelta(seconds=20)).isoformat()
@@ -0,0 +1,147 @@
+import io
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.capture_format import CaptureReader, CaptureWriter, read_summary, to_text
+
+START = datetime(2025, 1, 1, 12, 0, 0)
+
+
+def session(pid, query_start, now, query=None, **fields):
+    values = {
+        "pid": pid, "usename": "app", "datname": "loja", "client_addr": "10.0.0.1",
+        "backend_start": START, "state": "active", "query_start": query_start,
+        "duration": now - query_start, "wait_event_type": None, "wait_event": None,
+        "query": query or f"SELECT * FROM pedidos WHERE id = {pid}", "blocked_by": None,
+    }
+    values.update(fields)
+    return values
+
+
+def captures():
+    """Três capturas com sessões que continuam, mudam, terminam e começam"""
+    first = START + timedelta(seconds=10)
+    second = START + timedelta(seconds=20)
+    third = START + timedelta(seconds=30)
+    return [
+        (first, [session(1, START, first), session(2, START + timedelta(seconds=5), first)]),
+        (second, [session(1, START, second),
+                  session(2, START + timedelta(seconds=5), second,
+                          wait_event_type="Lock", wait_event="relation", blocked_by=[1]),
+                  session(3, START + timedelta(seconds=15), second)]),
+        (third, [session(3, START + timedelta(seconds=15), third),
+                 session(4, START + timedelta(seconds=25), third, query="x" * 500)]),
+    ]
+
+
+def write(path, delta, compression="none"):
+    writer = CaptureWriter(str(path), header={"host": "db1", "port": 5432}, delta=delta,
+                           compression=compression)
+    for timestamp, sessions in captures():
+        writer.write_capture(sessions, timestamp, (1.0, 2.0, 3.0))
+    writer.close()
+    return writer
+
+
+@pytest.mark.parametrize("delta", [False, True])
+@pytest.mark.parametrize("compression", ["none", "gzip"])
+def test_round_trip(tmp_path, delta, compression):
+    path = tmp_path / "pg_queries_20250101_120000.pgcap"
+    write(path, delta, compression)
+
+    reader = CaptureReader(str(path))
+    snapshots = list(reader.snapshots())
+    assert reader.header["host"] == "db1"
+    assert len(snapshots) == 3
+    for (timestamp, expected), (read_at, load, sessions, _) in zip(captures(), snapshots):
+        assert read_at == timestamp
+        assert load == (1.0, 2.0, 3.0)
+        by_pid = {s["pid"]: s for s in sessions}
+        assert set(by_pid) == {s["pid"] for s in expected}
+        for original in expected:
+            read = by_pid[original["pid"]]
+            for field in ("usename", "datname", "state", "wait_event_type", "wait_event",
+                          "query", "blocked_by"):
+                assert read[field] == original[field]
+            assert read["query_start"] == original["query_start"].isoformat()
+            assert read["duration"] == original["duration"]
+        # Mais longas primeiro
+        durations = [s["duration"] for s in sessions]
+        assert durations == sorted(durations, reverse=True)
+
+
+def test_delta_writes_unchanged_sessions_as_run_markers(tmp_path):
+    full = write(tmp_path / "full.pgcap", delta=False)
+    delta = write(tmp_path / "delta.pgcap", delta=True)
+    # Sessões 1 (inalterada) e 3 (inalterada) viram "run" em vez de registro completo
+    assert full.full_records == 7
+    assert delta.full_records == 5
+    assert delta.raw_bytes < delta.full_equivalent_bytes
+
+    records = list(CaptureReader(str(tmp_path / "delta.pgcap")).records())
+    assert [len(r["ids"]) for r in records if r["t"] == "run"] == [1, 1]
+    # As sessões 1 e 2 terminam juntas na terceira captura
+    assert [len(r["ids"]) for r in records if r["t"] == "end"] == [2]
+
+
+def test_lock_roots_are_recorded(tmp_path):
+    path = tmp_path / "locks.pgcap"
+    write(path, delta=False)
+    blockers = [snapshot[3] for snapshot in CaptureReader(str(path)).snapshots()]
+    assert blockers[0] == []
+    assert [(root["pid"], root["blocked"]) for root in blockers[1]] == [(1, 1)]
+
+
+def test_summary_and_text_conversion(tmp_path):
+    path = tmp_path / "pg_incident_20250101_120000.pgcap"
+    writer = CaptureWriter(str(path), header={"incident": "20250101_120000",
+                                              "start": START.isoformat(), "triggers": []})
+    for timestamp, sessions in captures():
+        writer.write_capture(sessions, timestamp, (1.0, 2.0, 3.0))
+    writer.write_summary({"incident": "20250101_120000", "start": START.isoformat(),
+                          "end": (START + timedelta(minutes=1)).isoformat(), "duration": 60,
+                          "peak_load": 4.0, "triggers": [], "captures": 3, "top": [],
+                          "longest": [], "statements": []})
+    writer.close()
+
+    assert read_summary(str(path))["captures"] == 3
+    out = io.StringIO()
+    assert to_text(str(path), out)
+    text = out.getvalue()
+    assert "Capturas: 3" in text
+    assert "SELECT * FROM pedidos WHERE id = 4" not in text
+    assert "x" * 500 in text
+
+
+def test_truncated_last_line_is_ignored(tmp_path):
+    path = tmp_path / "cut.pgcap"
+    write(path, delta=True)
+    data = path.read_bytes()
+    path.write_bytes(data[:-5])
+    # A última captura perde o registro final, as anteriores continuam legíveis
+    assert len(list(CaptureReader(str(path)).snapshots())) == 3
+
+
+@pytest.mark.parametrize("delta", [False, True])
+def test_snapshots_keep_only_sessions_of_the_current_capture(tmp_path, monkeypatch, delta):
+    path = tmp_path / "long.pgcap"
+    writer = CaptureWriter(str(path), delta=delta)
+    for index in range(50):
+        now = START + timedelta(seconds=index)
+        # Cada captura tem só sessões novas, como em um modo completo sem "end"
+        writer.write_capture([session(index * 10 + n, now, now) for n in range(3)], now,
+                             (1.0, 1.0, 1.0))
+    writer.close()
+
+    sizes = []
+    original = CaptureReader._snapshot
+
+    def spy(self, capture, sessions, present, order_by=None):
+        sizes.append(len(sessions))
+        return original(self, capture, sessions, present, order_by)
+
+    monkeypatch.setattr(CaptureReader, "_snapshot", spy)
+    assert sum(1 for _ in CaptureReader(str(path)).snapshots()) == 50
+    # No máximo as sessões da captura anterior e as da atual
+    assert max(sizes) <= 6
@@ -0,0 +1,61 @@
+import pytest
+
+from src.cpu import CpuSampler, breakdown, read_proc_stat
+
+
+def write_stat(path, total, cores):
+    lines = [f"cpu  {' '.join(map(str, total))} 0 0\n"]
+    lines += [f"cpu{index} {' '.join(map(str, core))} 0 0\n" for index, core in enumerate(cores)]
+    lines.append("intr 12345 0 0\n")
+    path.write_text("".join(lines))
+
+
+def test_read_proc_stat_keeps_cpu_lines_only(tmp_path):
+    path = tmp_path / "stat"
+    write_stat(path, (1, 2, 3, 4, 5, 6, 7, 8), [(1, 1, 1, 1, 1, 1, 1, 1)])
+
+    counters = read_proc_stat(str(path))
+
+    assert counters == {"cpu": (1, 2, 3, 4, 5, 6, 7, 8), "cpu0": (1,) * 8}
+
+
+def test_breakdown_splits_the_interval():
+    before = (100, 0, 50, 800, 0, 0, 0, 0)
+    after = (130, 10, 70, 850, 20, 5, 5, 10)
+
+    usage = breakdown(before, after)
+
+    # 150 ticks: 50 idle, 20 iowait
+    assert usage["percent"] == pytest.approx(80 / 150 * 100)
+    assert usage["user"] == pytest.approx(40 / 150 * 100)
+    assert usage["system"] == pytest.approx(30 / 150 * 100)
+    assert usage["iowait"] == pytest.approx(20 / 150 * 100)
+    assert usage["steal"] == pytest.approx(10 / 150 * 100)
+
+
+def test_breakdown_without_elapsed_ticks():
+    counters = (1, 2, 3, 4, 5, 6, 7, 8)
+
+    assert breakdown(counters, counters)["percent"] == 0.0
+
+
+def test_sampler_reports_usage_since_previous_sample(tmp_path):
+    path = tmp_path / "stat"
+    write_stat(path, (100, 0, 0, 100, 0, 0, 0, 0),
+               [(50, 0, 0, 50, 0, 0, 0, 0), (50, 0, 0, 50, 0, 0, 0, 0)])
+    sampler = CpuSampler(str(path))
+
+    # A primeira amostra cobre o intervalo desde o boot
+    assert sampler.sample()["percent"] == pytest.approx(50)
+
+    write_stat(path, (100, 0, 0, 200, 0, 0, 0, 0),
+               [(50, 0, 0, 100, 0, 0, 0, 0), (50, 0, 0, 100, 0, 0, 0, 0)])
+    usage = sampler.sample()
+    assert usage["percent"] == pytest.approx(0)
+    assert [core["percent"] for core in usage["per_core"]] == [0, 0]
+
+    write_stat(path, (200, 0, 0, 200, 0, 0, 0, 0),
+               [(150, 0, 0, 100, 0, 0, 0, 0), (50, 0, 0, 100, 0, 0, 0, 0)])
+    usage = sampler.sample()
+    assert usage["percent"] == pytest.approx(100)
+    assert [core["percent"] for core in usage["per_core"]] == [100, 0]
@@ -0,0 +1,65 @@
+import pytest
+
+from src.dbstats import DatabaseRates
+
+
+def counters(**values):
+    base = {"xact_commit": 0, "xact_rollback": 0, "blks_read": 0, "blks_hit": 0,
+            "tup_inserted": 0, "tup_updated": 0, "tup_deleted": 0, "wal_bytes": 0}
+    base.update(values)
+    return base
+
+
+def test_first_reading_has_no_rates():
+    assert DatabaseRates().update(counters(), 100.0) is None
+
+
+def test_rates_per_second_since_previous_reading():
+    rates = DatabaseRates()
+    rates.update(counters(xact_commit=1000, xact_rollback=10, blks_read=50, blks_hit=950), 100.0)
+
+    result = rates.update(counters(xact_commit=1180, xact_rollback=30, blks_read=70,
+                                   blks_hit=1130, tup_inserted=10, tup_updated=5,
+                                   tup_deleted=5, wal_bytes=4096), 110.0)
+
+    assert result["tps"] == pytest.approx(20.0)
+    assert result["rollbacks"] == pytest.approx(2.0)
+    assert result["tup_modified"] == pytest.approx(2.0)
+    assert result["wal_bytes"] == pytest.approx(409.6)
+    # 180 hits e 20 leituras no intervalo
+    assert result["hit_ratio"] == pytest.approx(90.0)
+
+
+def test_counter_reset_leaves_that_rate_empty_for_one_cycle():
+    rates = DatabaseRates()
+    rates.update(counters(xact_commit=1000, blks_read=500, blks_hit=500), 0.0)
+
+    # pg_stat_reset: os contadores do banco voltam a zero
+    result = rates.update(counters(xact_commit=10, blks_read=5, blks_hit=5, wal_bytes=100), 1.0)
+    assert result["tps"] is None
+    assert result["hit_ratio"] is None
+    assert result["wal_bytes"] == pytest.approx(100.0)
+
+    result = rates.update(counters(xact_commit=20, blks_read=5, blks_hit=15, wal_bytes=100), 2.0)
+    assert result["tps"] == pytest.approx(10.0)
+    assert result["hit_ratio"] == pytest.approx(100.0)
+
+
+def test_unavailable_counters_and_idle_interval():
+    rates = DatabaseRates()
+    rates.update(counters(wal_bytes=None), 0.0)
+
+    result = rates.update(counters(wal_bytes=None), 5.0)
+
+    assert result["wal_bytes"] is None
+    assert result["checkpoints_req"] is None
+    # Nenhum bloco lido no intervalo
+    assert result["hit_ratio"] is None
+    assert result["tps"] == 0.0
+
+
+def test_reading_at_the_same_instant_is_ignored():
+    rates = DatabaseRates()
+    rates.update(counters(), 5.0)
+
+    assert rates.update(counters(xact_commit=10), 5.0) is None
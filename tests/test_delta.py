@@ -0,0 +1,65 @@
+from datetime import datetime, timedelta, timezone
+
+from src.delta import DeltaState, _value, session_key
+
+START = datetime(2024, 5, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+
+def session(pid, state="active", query_start=START):
+    return {"pid": pid, "backend_start": START, "query_start": query_start, "state": state}
+
+
+def test_session_key_is_the_same_instant_in_any_timezone():
+    local = START.astimezone(timezone(timedelta(hours=-3)))
+
+    assert session_key(session(1)) == session_key(session(1, query_start=local))
+    assert _value(local) == "2024-05-01T12:00:00+00:00"
+
+
+def test_unchanged_sessions_run_and_missing_ones_end():
+    state = DeltaState()
+
+    assert state.match(session(1)) == (1, None)
+    state.record(100)
+    assert state.match(session(2)) == (2, None)
+    state.record(80)
+    assert state.finish() == []
+
+    # Sessão 1 igual, sessão 2 terminou
+    assert state.match(session(1)) == (1, 100)
+    assert state.finish() == [2]
+
+
+def test_changed_session_keeps_its_id():
+    state = DeltaState()
+    state.match(session(1))
+    state.record(100)
+    state.finish()
+
+    assert state.match(session(1, state="idle in transaction")) == (1, None)
+    state.record(120)
+    assert state.finish() == []
+    assert state.match(session(1, state="idle in transaction")) == (1, 120)
+
+
+def test_new_execution_on_same_pid_is_a_new_session():
+    state = DeltaState()
+    state.match(session(1))
+    state.record(100)
+    state.finish()
+
+    assert state.match(session(1, query_start=START + timedelta(seconds=5))) == (2, None)
+    state.record(100)
+    assert state.finish() == [1]
+
+
+def test_reset_forgets_live_sessions_but_not_ids():
+    state = DeltaState()
+    state.match(session(1))
+    state.record(100)
+    state.finish()
+    state.reset()
+
+    assert state.match(session(1)) == (2, None)
+    state.record(100)
+    assert state.finish() == []
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.engine import CaptureEngine, CollectionBusy, CollectionTimeout
+from src.monitor import LoadMonitor
+
+
+class FakeTarget:
+    label = "db1"
+
+    def __init__(self, log_root):
+        self.log_root = log_root
+
+
+@pytest.fixture
+def engine(monkeypatch, tmp_path):
+    for name, value in (("MONITOR_SAMPLE_INTERVAL", "0"), ("MONITOR_RETENTION_INTERVAL", "0"),
+                        ("MONITOR_WRITE_QUEUE_BYTES", "0"), ("MONITOR_METRICS_PORT", "0")):
+        monkeypatch.setenv(name, value)
+    engine = CaptureEngine(LoadMonitor(), [FakeTarget(str(tmp_path))],
+                           lambda event, **data: None, collect_timeout=0.2)
+    yield engine
+    engine.executor.shutdown(wait=True)
+
+
+def test_collect_runs_off_the_event_loop(engine):
+    loop_thread = threading.get_ident()
+
+    async def collect():
+        return await engine.collect("system", lambda value: (value, threading.get_ident()), 42)
+
+    value, thread = asyncio.run(collect())
+    assert value == 42
+    assert thread != loop_thread
+
+
+def test_collect_deadline_cancels_the_stuck_call(engine):
+    release = threading.Event()
+    cancelled = []
+
+    def stuck():
+        release.wait(5)
+        return "tarde"
+
+    def cancel():
+        cancelled.append(True)
+        release.set()
+
+    async def collect():
+        with pytest.raises(CollectionTimeout, match="prazo de 0.05s"):
+            await engine.collect("queries:db1", stuck, cancel=cancel, timeout=0.05)
+
+    asyncio.run(collect())
+    assert cancelled == [True]
+
+
+def test_stuck_collection_is_not_stacked(engine):
+    release = threading.Event()
+
+    async def collect():
+        with pytest.raises(CollectionTimeout):
+            await engine.collect("queries:db1", release.wait, 5)
+        # A chamada anterior ainda ocupa a thread: outra do mesmo nome é recusada
+        with pytest.raises(CollectionBusy):
+            await engine.collect("queries:db1", lambda: None)
+        # Outros nomes seguem normalmente
+        assert await engine.collect("system", lambda: "ok") == "ok"
+
+        release.set()
+        await engine._pending["queries:db1"]
+        assert await engine.collect("queries:db1", lambda: "ok") == "ok"
+
+    asyncio.run(collect())
@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from src.fingerprint import FingerprintAggregator, fingerprint, normalize_query
+
+
+def test_literals_and_parameters_become_placeholders():
+    assert normalize_query("SELECT * FROM t WHERE id = 42 AND name = 'ana' AND x = $1") == \
+        "SELECT * FROM t WHERE id = ? AND name = ? AND x = ?"
+    assert normalize_query("SELECT 1.5e3, E'a\\'b', $$corpo$$, $tag$x$tag$") == \
+        "SELECT ?, ?, ?, ?"
+
+
+def test_comments_whitespace_and_trailing_semicolon_are_removed():
+    sql = "SELECT  a -- comentário\n FROM /* bloco\n */ t ;"
+    assert normalize_query(sql) == "SELECT a FROM t"
+
+
+def test_identifiers_are_kept():
+    # Números dentro de identificadores e nomes entre aspas não são literais
+    assert normalize_query('SELECT col1 FROM "Tabela 2" WHERE t2.c = 3') == \
+        'SELECT col1 FROM "Tabela 2" WHERE t2.c = ?'
+
+
+def test_literal_lists_collapse():
+    assert normalize_query("SELECT 1 FROM t WHERE id IN (1, 2, 3)") == \
+        "SELECT ? FROM t WHERE id IN (...)"
+    assert normalize_query("SELECT ARRAY[1,2,3]") == "SELECT ARRAY[...]"
+    assert normalize_query("INSERT INTO t VALUES (1, 'a'), (2, 'b'), (3, 'c')") == \
+        "INSERT INTO t VALUES (?, ?), ..."
+
+
+def test_same_command_with_different_literals_shares_a_fingerprint():
+    first, normalized = fingerprint("SELECT * FROM t WHERE id IN (1, 2)")
+    second, _ = fingerprint("SELECT *  FROM t WHERE id IN (7,8,9);")
+    other, _ = fingerprint("SELECT * FROM u WHERE id IN (1, 2)")
+    assert first == second
+    assert first != other
+    assert normalized == "SELECT * FROM t WHERE id IN (...)"
+
+
+def test_aggregator_counts_each_execution_once():
+    aggregator = FingerprintAggregator()
+    session = {"pid": 1, "backend_start": 0, "query_start": 10, "query": "SELECT 1",
+               "duration": timedelta(seconds=2)}
+    aggregator.add([session])
+    aggregator.add([dict(session, duration=timedelta(seconds=5))])
+    aggregator.add([dict(session, query_start=20, duration=timedelta(seconds=1))])
+
+    stats, = aggregator.top()
+    assert stats.samples == 3
+    assert stats.executions == 2
+    # Só a maior duração de cada execução: 5 + 1
+    assert stats.total_duration == 6.0
+    assert stats.max_duration == 5.0
+    assert aggregator.samples == 3
+
+
+def test_aggregator_keeps_only_executions_of_the_last_capture():
+    aggregator = FingerprintAggregator()
+    for index in range(100):
+        # Uma execução nova por captura e uma que continua o incidente inteiro
+        aggregator.add([
+            {"pid": 1, "backend_start": 0, "query_start": 0, "query": "SELECT * FROM a",
+             "duration": timedelta(seconds=index)},
+            {"pid": 2, "backend_start": 0, "query_start": index, "query": "SELECT * FROM b",
+             "duration": timedelta(seconds=1)},
+        ])
+        assert len(aggregator._executions) == 2
+
+    by_query = {stats.query: stats for stats in aggregator.top()}
+    assert (by_query["SELECT * FROM a"].executions, by_query["SELECT * FROM a"].total_duration) \
+        == (1, 99.0)
+    assert (by_query["SELECT * FROM b"].executions, by_query["SELECT * FROM b"].total_duration) \
+        == (100, 100.0)
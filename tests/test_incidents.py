@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta, timezone
+
+from src.capture_format import CaptureWriter, read_summary
+from src.fingerprint import FingerprintAggregator
+from src.incidents import Incident, LongestSessions, incident_filename
+from src.log_index import LogIndex
+
+START = datetime(2024, 5, 1, 12, 0, 0)
+BACKEND_START = datetime(2024, 5, 1, 11, 0, 0, tzinfo=timezone.utc)
+
+
+def session(pid, seconds, query="SELECT * FROM contas WHERE id = 1"):
+    return {"pid": pid, "usename": "app", "datname": "db", "state": "active",
+            "backend_start": BACKEND_START, "query_start": BACKEND_START,
+            "duration": timedelta(seconds=seconds), "query": query}
+
+
+def test_longest_sessions_count_each_execution_once():
+    longest = LongestSessions(n=2)
+    for seconds in (1, 5, 9):
+        longest.add_session(session(1, seconds))
+    longest.add_session(session(2, 3))
+    longest.add_session(session(3, 4))
+
+    assert [(item["pid"], item["duration"]) for item in longest.top()] == [(1, 9), (3, 4)]
+
+
+def test_longest_sessions_memory_is_bounded():
+    longest = LongestSessions(n=2)
+    for pid in range(100):
+        longest.add_session(session(pid, pid))
+
+    assert len(longest._executions) <= 8
+    assert [item["pid"] for item in longest.top()] == [99, 98]
+
+
+def test_summary_of_a_closed_incident():
+    incident = Incident(START, load=8.0, triggers=["load1 >= 8"])
+    incident.update(12.345)
+    incident.update(10.0)
+    aggregator = FingerprintAggregator()
+    longest = incident.longest["db1"] = LongestSessions()
+    for seconds in (10, 20):
+        aggregator.add(longest.observe([session(1, seconds)]))
+    incident.close(START + timedelta(minutes=5))
+
+    summary = incident.summary("db1", aggregator, dropped=1)
+
+    assert incident_filename(START, ".pgcap") == "pg_incident_20240501_120000.pgcap"
+    assert summary["incident"] == incident.id == "20240501_120000"
+    assert (summary["duration"], summary["peak_load"], summary["captures"]) == (300.0, 12.35, 2)
+    assert summary["top"][0]["total_duration"] == 20
+    assert summary["longest"][0]["duration"] == 20
+    assert (summary["dropped"], summary["interrupted"]) == (1, False)
+
+
+def test_rebuilt_index_has_the_incident_summary(tmp_path):
+    incident = Incident(START, load=9.0, triggers=["load1 >= 8"])
+    aggregator = FingerprintAggregator()
+    longest = incident.longest["db1"] = LongestSessions()
+    path = tmp_path / "db1" / incident_filename(START, ".pgcap.gz")
+    path.parent.mkdir()
+    writer = CaptureWriter(str(path), header=dict(incident.header(), host="db1", port=5432),
+                           delta=True, compression="gzip")
+    writer.write_capture(aggregator.observe(longest.observe([session(1, 30)])), START,
+                         (9.0, 5.0, 2.0))
+    incident.close(START + timedelta(minutes=2))
+    writer.write_summary(incident.summary("db1", aggregator))
+    writer.close()
+
+    assert read_summary(str(path))["end"] == "2024-05-01T12:02:00"
+    index = LogIndex(str(tmp_path))
+    [row] = index.recent()
+    index.close()
+
+    assert (row["kind"], row["target"], row["host"]) == ("incident", "db1", "db1:5432")
+    assert (row["end_timestamp"], row["peak_load"], row["captures"]) == \
+        ("2024-05-01 12:02:00", 9.0, 1)
+    assert row["triggers"] == "load1 >= 8"
+    assert row["top_query"] == "SELECT * FROM contas WHERE id = ?"
+    assert row["peak_duration"] == 30
@@ -0,0 +1,72 @@
+import pytest
+
+from src.instrumentation import BUCKETS_MS, LatencyHistogram, PipelineStats
+
+
+def test_empty_histogram_quantile_is_zero():
+    assert LatencyHistogram().quantile(0.99) == 0.0
+
+
+def test_quantiles_interpolate_within_the_bucket():
+    histogram = LatencyHistogram()
+    # 100 observações na faixa (10, 25]
+    for _ in range(100):
+        histogram.observe(20)
+    histogram.observe(25)
+
+    assert histogram.counts[BUCKETS_MS.index(25)] == 101
+    assert histogram.max_ms == 25
+    assert histogram.quantile(0.5) == pytest.approx(10 + 15 * 0.5)
+    assert histogram.quantile(1.0) == pytest.approx(25)
+
+
+def test_quantile_is_capped_by_the_largest_observation():
+    histogram = LatencyHistogram()
+    for elapsed_ms in (1, 2, 3, 700):
+        histogram.observe(elapsed_ms)
+
+    assert histogram.quantile(0.25) == pytest.approx(1)
+    # A faixa (500, 1000] termina no maior valor observado
+    assert histogram.quantile(1.0) == pytest.approx(700)
+    assert histogram.quantile(0.99) < 700
+
+
+def test_observations_above_all_buckets():
+    histogram = LatencyHistogram()
+    histogram.observe(60000)
+
+    assert histogram.counts[-1] == 1
+    assert histogram.quantile(0.5) == pytest.approx(30000 + 30000 * 0.5)
+    assert histogram.as_dict()["max_ms"] == 60000
+
+
+def test_cycles_count_overruns_and_missed_cycles():
+    stats = PipelineStats(enabled=True)
+    stats.cycle("check", 0.5, 10)
+    stats.cycle("check", 25, 10)
+    stats.cycle("sample", 0.3, 0)
+
+    loops = stats.snapshot()["loops"]
+    assert loops["check"] == {"cycles": 2, "overruns": 1, "missed": 2}
+    assert loops["sample"] == {"cycles": 1, "overruns": 0, "missed": 0}
+
+
+def test_stages_are_recorded_per_name():
+    stats = PipelineStats(enabled=True)
+    stats.record_stages({"query": 12.0, "write": 3.0})
+    stats.record("query", 40.0)
+
+    stages = stats.snapshot()["stages"]
+    assert stages["query"]["count"] == 2
+    assert stages["query"]["sum_ms"] == pytest.approx(52.0)
+    assert stages["write"]["count"] == 1
+
+
+def test_disabled_stats_record_nothing(monkeypatch):
+    monkeypatch.setenv("MONITOR_INSTRUMENTATION", "0")
+    stats = PipelineStats()
+    stats.record("query", 1.0)
+    stats.record_stages({"write": 1.0})
+    stats.cycle("check", 30, 10)
+
+    assert stats.snapshot() == {"stages": {}, "loops": {}}
@@ -0,0 +1,70 @@
+from src.locks import QUERY_PREVIEW, BlockingCollector, LockGraph
+
+
+def test_chain_depth_and_root():
+    graph = LockGraph({3: [2], 2: [1], 1: None})
+    assert graph.depth == {1: 0, 2: 1, 3: 2}
+    assert graph.roots[3] == {1}
+    assert graph.root_blockers() == [{"pid": 1, "blocked": 2, "depth": 2, "cycle": False}]
+
+
+def test_several_roots_ordered_by_blocked_sessions():
+    graph = LockGraph({3: [1, 2], 4: [1], 5: [4]})
+    assert graph.roots[3] == {1, 2}
+    assert graph.depth[5] == 2
+    assert graph.root_blockers() == [
+        {"pid": 1, "blocked": 3, "depth": 2, "cycle": False},
+        {"pid": 2, "blocked": 1, "depth": 1, "cycle": False},
+    ]
+
+
+def test_pure_cycle_gets_a_single_root():
+    graph = LockGraph({1: [2], 2: [1]})
+    assert graph.cycles == {1, 2}
+    assert set(graph.depth) == {1, 2}
+    result = graph.root_blockers()
+    assert len(result) == 1
+    assert result[0]["cycle"] and result[0]["blocked"] == 1
+    assert result[0]["pid"] == 1
+
+
+def test_cycle_with_waiting_tail():
+    graph = LockGraph({3: [1], 1: [2], 2: [1], 4: [3]})
+    assert graph.cycles == {1, 2}
+    assert 3 not in graph.cycles
+    (root,) = graph.root_blockers()
+    assert root["cycle"]
+    # Toda a cauda espera pelo mesmo ciclo
+    assert root["blocked"] == 3
+    assert graph.roots[4] == graph.roots[3] == {root["pid"]}
+
+
+def test_cycle_next_to_a_real_root_does_not_depend_on_order():
+    for blocked_by in ({1: [2, 9], 2: [1]}, {2: [1], 1: [2, 9]}):
+        graph = LockGraph(blocked_by)
+        assert graph.cycles == {1, 2}
+        assert graph.root_blockers() == [{"pid": 9, "blocked": 2, "depth": 1, "cycle": False}]
+
+
+def test_long_chain_does_not_recurse():
+    size = 20000
+    graph = LockGraph({pid: [pid - 1] for pid in range(1, size)})
+    assert graph.depth[size - 1] == size - 1
+    assert graph.root_blockers() == [{"pid": 0, "blocked": size - 1, "depth": size - 1,
+                                      "cycle": False}]
+
+
+def test_collector_describes_roots():
+    collector = BlockingCollector()
+    assert collector.root_blockers() == []
+    collector.add_session({"pid": 1, "usename": "app", "state": "idle in transaction",
+                           "query": "UPDATE t SET x = 1" + " " * 500, "blocked_by": None})
+    collector.add_session({"pid": 2, "usename": "app", "state": "active",
+                           "query": "UPDATE t SET x = 2", "blocked_by": [1]})
+    collector.add_session({"pid": 3, "usename": "app", "state": "active",
+                           "query": "DELETE FROM u", "blocked_by": [7]})
+    result = {root["pid"]: root for root in collector.root_blockers()}
+    assert result[1]["state"] == "idle in transaction"
+    assert len(result[1]["query"]) == QUERY_PREVIEW
+    # Bloqueador fora da captura
+    assert result[7]["usename"] is None and result[7]["blocked"] == 1
@@ -0,0 +1,102 @@
+import os
+from datetime import datetime
+
+from src.log_index import LogIndex, file_kind, file_timestamp
+
+T0 = datetime(2024, 5, 1, 12, 0, 0)
+
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, "w").close()
+    return path
+
+
+def test_file_kind_and_timestamp():
+    assert file_kind("db1/pg_incident_20240501_120000.pgcap.gz") == "incident"
+    assert file_kind("index.sqlite3") is None
+    assert file_timestamp("pg_archive_20240501.pgcap") == datetime(2024, 5, 1)
+    assert file_timestamp("pg_queries_20240501_120304.log") == datetime(2024, 5, 1, 12, 3, 4)
+
+
+def test_add_accumulates_the_largest_capture(tmp_path):
+    index = LogIndex(str(tmp_path))
+    path = str(tmp_path / "db1" / "pg_delta_20240501_120000.pgcap")
+
+    index.add(path, T0, target="db1", host="db1:5432", sessions=10, peak_duration=5.0,
+              top_fingerprint="a", top_query="SELECT a")
+    index.add(path, T0, sessions=4, peak_duration=30.0, top_fingerprint="b", top_query="SELECT b")
+    index.add(path, T0, sessions=7, peak_duration=1.0, top_fingerprint="c", top_query="SELECT c")
+
+    [row] = index.recent()
+    assert row["path"] == os.path.join("db1", "pg_delta_20240501_120000.pgcap")
+    assert (row["target"], row["host"], row["kind"]) == ("db1", "db1:5432", "delta")
+    assert (row["sessions"], row["peak_duration"]) == (10, 30.0)
+    assert (row["top_fingerprint"], row["top_query"]) == ("b", "SELECT b")
+    index.close()
+
+
+def test_recent_pages_and_search(tmp_path):
+    index = LogIndex(str(tmp_path))
+    for minute in range(5):
+        path = str(tmp_path / "db1" / f"pg_queries_20240501_12{minute:02d}00.pgcap")
+        index.add(path, T0.replace(minute=minute), target="db1",
+                  top_query="UPDATE contas" if minute == 3 else "SELECT 1")
+
+    assert index.count() == 5
+    page = index.recent(limit=2, offset=1)
+    assert [row["timestamp"] for row in page] == ["2024-05-01 12:03:00", "2024-05-01 12:02:00"]
+    assert index.count("contas") == 1
+    assert [row["timestamp"] for row in index.recent(search="contas")] == ["2024-05-01 12:03:00"]
+    index.close()
+
+
+def test_rename_and_remove(tmp_path):
+    index = LogIndex(str(tmp_path))
+    path = str(tmp_path / "db1" / "pg_incident_20240501_120000.pgcap")
+    index.add(path, T0, target="db1")
+
+    index.rename(path, path + ".gz")
+    assert [row["path"] for row in index.recent()] == \
+        [os.path.join("db1", "pg_incident_20240501_120000.pgcap.gz")]
+
+    index.remove(path + ".gz")
+    assert index.count() == 0
+    index.close()
+
+
+def test_archive_replaces_sources_with_the_daily_file(tmp_path):
+    index = LogIndex(str(tmp_path))
+    sources = [str(tmp_path / "db1" / f"pg_queries_20240501_1{hour}0000.pgcap") for hour in (0, 1)]
+    index.add(sources[0], T0.replace(hour=10), host="db1:5432", sessions=3, peak_duration=9.0,
+              top_fingerprint="a", top_query="SELECT a")
+    index.add(sources[1], T0.replace(hour=11), sessions=8, peak_duration=2.0,
+              top_fingerprint="b", top_query="SELECT b")
+    daily = str(tmp_path / "db1" / "pg_archive_20240501.pgcap.gz")
+
+    index.archive(daily, datetime(2024, 5, 1), sources, 2, T0.replace(hour=11), target="db1")
+    # Uma segunda compactação no mesmo dia acumula as capturas
+    index.archive(daily, datetime(2024, 5, 1), [], 3, T0.replace(hour=13), target="db1")
+
+    [row] = index.recent()
+    assert row["kind"] == "archive"
+    assert (row["host"], row["sessions"], row["peak_duration"]) == ("db1:5432", 8, 9.0)
+    assert row["top_query"] == "SELECT a"
+    assert (row["captures"], row["end_timestamp"]) == (5, "2024-05-01 13:00:00")
+    index.close()
+
+
+def test_existing_logs_are_indexed_once(tmp_path):
+    touch(str(tmp_path / "db1" / "pg_queries_20240501_120000.log"))
+    touch(str(tmp_path / "db2" / "pg_archive_20240430.pgcap.gz"))
+    touch(str(tmp_path / "db2" / "notas.log"))
+
+    index = LogIndex(str(tmp_path))
+    rows = index.recent()
+    index.close()
+
+    assert [(row["target"], row["kind"]) for row in rows] == [("db1", "queries"), ("db2", "archive")]
+    # Reabrir não indexa de novo
+    index = LogIndex(str(tmp_path))
+    assert index.count() == 2
+    index.close()
@@ -0,0 +1,85 @@
+import urllib.request
+
+from src.instrumentation import BUCKETS_MS
+from src.metrics import CONTENT_TYPE, Histogram, Metric, MetricsRecorder, MetricsServer
+from src.sampler import HISTORY_COLUMNS
+
+
+def row(state, wait=None):
+    values = dict.fromkeys(HISTORY_COLUMNS)
+    values.update(state=state, wait_event_type=wait)
+    return tuple(values[column] for column in HISTORY_COLUMNS)
+
+
+def test_metric_render_escapes_labels_and_formats_numbers():
+    metric = Metric("pgmonitor_x", "counter", "Ajuda", ("target",))
+    metric.inc(2, 'db "1"\\a')
+    metric.set(True, "b")
+    metric.set(float("nan"), "c")
+    metric.set(float("inf"), "d")
+    metric.set(float("-inf"), "e")
+    metric.set(0.25, "f")
+    assert metric.render() == [
+        "# HELP pgmonitor_x Ajuda",
+        "# TYPE pgmonitor_x counter",
+        "pgmonitor_x_total{target=\"b\"} 1",
+        "pgmonitor_x_total{target=\"c\"} NaN",
+        "pgmonitor_x_total{target=\"d\"} +Inf",
+        'pgmonitor_x_total{target="db \\"1\\"\\\\a"} 2',
+        "pgmonitor_x_total{target=\"e\"} -Inf",
+        "pgmonitor_x_total{target=\"f\"} 0.25",
+    ]
+
+
+def test_histogram_buckets_are_cumulative_in_seconds():
+    histogram = Histogram("pgmonitor_h", "Ajuda", ("stage",))
+    counts = [0] * (len(BUCKETS_MS) + 1)
+    counts[0], counts[-1] = 2, 1
+    histogram.set((counts, 3, 1.5), "query")
+    lines = histogram.render()
+    assert lines[2] == f'pgmonitor_h_bucket{{stage="query",le="{BUCKETS_MS[0] / 1000!r}"}} 2'
+    assert lines[-3] == 'pgmonitor_h_bucket{stage="query",le="+Inf"} 3'
+    assert lines[-2:] == ['pgmonitor_h_count{stage="query"} 3',
+                          'pgmonitor_h_sum{stage="query"} 1.5']
+
+
+def test_recorder_follows_events():
+    recorder = MetricsRecorder()
+    seen = []
+    emit = recorder.observe(lambda event, **data: seen.append(event))
+    emit("sessions", target="db1", timestamp=0,
+         rows=[row("active", "Lock"), row("active", "IO"), row("idle in transaction")])
+    emit("sessions", target="db1", timestamp=1, rows=[row("active")])
+    emit("high_load_start", load=9.0, threshold=4.0)
+    emit("capture_saved", target="db1", path="x", count=5, elapsed=0.5)
+    emit("target_status", target="db1", ok=False, message="erro")
+    emit("unknown_event", anything=1)
+    # Um evento com campos inesperados não interrompe o repasse
+    emit("capture_saved", target="db1")
+    assert seen == ["sessions", "sessions", "high_load_start", "capture_saved",
+                    "target_status", "unknown_event", "capture_saved"]
+
+    assert recorder.sessions.values == {("db1", "active"): 1, ("db1", "idle in transaction"): 0}
+    assert recorder.waiting.values == {("db1", "Lock"): 0, ("db1", "IO"): 0}
+    assert recorder.incidents.values == {(): 1}
+    assert recorder.high_load.values == {(): 1}
+    assert recorder.captured_sessions.values == {("db1",): 5}
+    assert recorder.target_up.values == {("db1",): 0}
+
+    text = recorder.render()
+    assert text.endswith("# EOF\n")
+    assert 'pgmonitor_captured_sessions_total{target="db1"} 5' in text.splitlines()
+
+
+def test_server_serves_metrics():
+    recorder = MetricsRecorder()
+    recorder.high_load.set(1)
+    server = MetricsServer(recorder, 0)
+    assert server.start()
+    port = server._server.server_address[1]
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+            assert response.headers["Content-Type"] == CONTENT_TYPE
+            assert "pgmonitor_high_load 1" in response.read().decode().splitlines()
+    finally:
+        server.stop()
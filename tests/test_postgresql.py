@@ -0,0 +1,131 @@
+from src.postgresql import PostgresMonitor
+
+
+def monitor(monkeypatch, tmp_path, **env):
+    monkeypatch.chdir(tmp_path)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    return PostgresMonitor({"host": "db1", "port": "5432", "database": "postgres",
+                            "user": "postgres", "password": ""}, name="db1")
+
+
+def test_capture_query_gates_wait_columns_on_version(monkeypatch, tmp_path):
+    target = monitor(monkeypatch, tmp_path)
+    current = target.capture_query(160000)
+    assert "pg_blocking_pids(pid)" in current
+    assert "waiting" not in current
+
+    legacy = target.capture_query(90500)
+    assert "pg_blocking_pids" not in legacy
+    assert "wait_event_type = 'Lock'" not in legacy
+    assert "CASE WHEN waiting THEN 'Lock' END AS wait_event_type" in legacy
+    assert "NULL::int[] AS blocked_by" in legacy
+
+
+def test_capture_query_profile(monkeypatch, tmp_path):
+    target = monitor(monkeypatch, tmp_path, MONITOR_QUERY_CHARS="200",
+                     MONITOR_CAPTURE_COLUMNS="query, nada")
+    sql = target.capture_query(160000)
+    assert "left(query, 200) AS query" in sql
+    assert "NULL AS usename" in sql and "NULL AS blocked_by" in sql
+    assert "ORDER BY" not in sql
+
+
+def test_database_query_by_version(monkeypatch, tmp_path):
+    target = monitor(monkeypatch, tmp_path)
+    assert "pg_stat_checkpointer" in target.database_query(170000)
+    assert "pg_current_wal_lsn" in target.database_query(150000)
+    assert "pg_current_xlog_location" in target.database_query(90600)
+    assert "NULL::float8" in target.database_query(90300)
+    assert "NULL::float8" in target.database_query(150000, wal=False)
+
+
+class FakeCursor:
+    def __init__(self, conn, rows):
+        self.conn = conn
+        self.rows = list(rows)
+        self.fetches = 0
+
+    def execute(self, sql):
+        self.conn.executed.append(sql)
+        if self.conn.fail:
+            raise RuntimeError("canceling statement due to statement timeout")
+
+    def fetchmany(self, size):
+        self.fetches += 1
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    server_version = 160000
+    closed = 0
+
+    def __init__(self, rows, fail=False):
+        self.rows = rows
+        self.fail = fail
+        self.executed = []
+        self.rollbacks = 0
+        self.cursors = []
+
+    def cursor(self, name=None):
+        assert name, "a captura usa um cursor no servidor"
+        self.cursors.append(FakeCursor(self, self.rows))
+        return self.cursors[-1]
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakePool:
+    closed = False
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.returned = 0
+
+    def getconn(self):
+        return self.conn
+
+    def putconn(self, conn, close=False):
+        self.returned += 1
+
+
+def streaming_target(monkeypatch, tmp_path, conn):
+    target = monitor(monkeypatch, tmp_path)
+    target.pool = FakePool(conn)
+    monkeypatch.setattr(target, "connect", lambda: True)
+    return target
+
+
+def row(pid):
+    return (pid, "app", "db", None, None, "active", None, None, None, None, f"SELECT {pid}", None)
+
+
+def test_active_queries_are_streamed_in_batches(monkeypatch, tmp_path):
+    conn = FakeConnection([row(pid) for pid in range(5)])
+    target = streaming_target(monkeypatch, tmp_path, conn)
+
+    sessions = target.iter_active_queries(batch_size=2)
+    first = next(sessions)
+    # Só o primeiro lote foi buscado antes de a primeira sessão chegar ao consumidor
+    assert conn.cursors[0].fetches == 1
+    assert (first.pid, first.get("query"), first.cpu_percent) == (0, "SELECT 0", None)
+
+    assert [session.pid for session in sessions] == [1, 2, 3, 4]
+    assert conn.cursors[0].fetches == 4
+    assert conn.rollbacks == 1 and target.pool.returned == 1
+    assert set(target.last_timings) == {"connect", "query", "convert"}
+    assert target.last_error is None
+
+
+def test_streaming_errors_end_the_iteration(monkeypatch, tmp_path):
+    conn = FakeConnection([row(1)], fail=True)
+    target = streaming_target(monkeypatch, tmp_path, conn)
+
+    assert target.get_active_queries() == []
+    assert "statement timeout" in target.last_error
+    assert conn.rollbacks == 1 and target.pool.returned == 1
@@ -0,0 +1,113 @@
+import pytest
+
+import src.procstat
+from src.postgresql import ACTIVE_COLUMNS, ActiveSession
+from src.procstat import RESOURCE_COLUMNS, BackendResources, is_local, read_process
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+
+@pytest.fixture
+def proc(tmp_path, monkeypatch):
+    monkeypatch.setattr(src.procstat, "_CLOCK_TICKS", 100)
+    clock = FakeClock()
+    monkeypatch.setattr(src.procstat, "time", clock)
+    (tmp_path / "uptime").write_text("1000.00 5000.00\n")
+    return tmp_path, clock
+
+
+def write_process(proc_dir, pid, start, ticks, rss_kb=2048, io=(0, 0)):
+    base = proc_dir / str(pid)
+    base.mkdir(exist_ok=True)
+    # Campos a partir do estado (3): utime é o 14, stime o 15 e starttime o 22
+    fields = ["S"] + ["0"] * 19
+    fields[11], fields[12], fields[19] = str(ticks), "0", str(start)
+    (base / "stat").write_text(f"{pid} (postgres: app db) {' '.join(fields)}\n")
+    (base / "status").write_text(f"Name:\tpostgres\nVmRSS:\t  {rss_kb} kB\n")
+    if io is not None:
+        (base / "io").write_text(f"rchar: 1\nread_bytes: {io[0]}\nwrite_bytes: {io[1]}\n")
+
+
+def session(pid):
+    return ActiveSession._make((None,) * len(ACTIVE_COLUMNS) + (None,) * len(RESOURCE_COLUMNS)) \
+        ._replace(pid=pid)
+
+
+def test_is_local():
+    assert is_local({"host": "localhost"})
+    assert is_local({"host": "/var/run/postgresql"})
+    assert is_local({})
+    assert not is_local({"host": "db1.example.com"})
+
+
+def test_read_process_handles_spaces_in_the_name(proc):
+    proc_dir, _ = proc
+    write_process(proc_dir, 42, start=500, ticks=300, io=None)
+
+    assert read_process(42, str(proc_dir)) == (500, 300, 2048 * 1024, None, None)
+    assert read_process(43, str(proc_dir)) is None
+
+
+def test_first_sight_uses_the_lifetime_average(proc):
+    proc_dir, _ = proc
+    # Iniciado 900 s após o boot (uptime 1000 s): 100 s de vida, 50 s de CPU
+    write_process(proc_dir, 42, start=90000, ticks=5000, io=(4096, 1024))
+
+    [annotated] = BackendResources(proc_dir=str(proc_dir)).annotate([session(42)])
+
+    assert annotated.cpu_percent == 50.0
+    assert annotated.rss_bytes == 2048 * 1024
+    assert (annotated.read_bytes, annotated.write_bytes) == (4096, 1024)
+
+
+def test_next_captures_use_the_difference(proc):
+    proc_dir, clock = proc
+    resources = BackendResources(batch_size=1, proc_dir=str(proc_dir))
+    write_process(proc_dir, 42, start=90000, ticks=5000, io=(4096, 1024))
+    write_process(proc_dir, 43, start=95000, ticks=100)
+    list(resources.annotate([session(42), session(43)]))
+
+    clock.now += 2.0
+    write_process(proc_dir, 42, start=90000, ticks=5100, io=(8192, 1024))
+    write_process(proc_dir, 43, start=95000, ticks=100)
+    first, second, missing = resources.annotate([session(42), session(43), session(44)])
+
+    assert first.cpu_percent == 50.0
+    assert (first.read_bytes, first.write_bytes) == (4096, 0)
+    assert second.cpu_percent == 0.0
+    assert missing.cpu_percent is None and missing.rss_bytes is None
+
+
+def test_reused_pid_is_a_new_backend(proc):
+    proc_dir, clock = proc
+    resources = BackendResources(proc_dir=str(proc_dir))
+    write_process(proc_dir, 42, start=90000, ticks=5000)
+    list(resources.annotate([session(42)]))
+
+    # Mesmo pid, outro processo: iniciado 990 s após o boot
+    clock.now += 1.0
+    write_process(proc_dir, 42, start=99000, ticks=200)
+    [annotated] = resources.annotate([session(42)])
+
+    assert annotated.cpu_percent == 20.0
+
+
+def test_only_backends_of_the_last_capture_are_kept(proc):
+    proc_dir, _ = proc
+    resources = BackendResources(proc_dir=str(proc_dir))
+    write_process(proc_dir, 42, start=90000, ticks=5000)
+    write_process(proc_dir, 43, start=90000, ticks=5000)
+    list(resources.annotate([session(42), session(43)]))
+
+    list(resources.annotate([session(43)]))
+
+    assert [key[0] for key in resources._previous] == [43]
@@ -0,0 +1,181 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import src.log_index
+from src.capture_format import CaptureReader, CaptureWriter
+from src.log_index import get_index
+from src.retention import TEMPORARY_SUFFIX, LogJanitor, RetentionPolicy
+
+TODAY = datetime.combine(datetime.now().date(), datetime.min.time())
+
+
+@pytest.fixture
+def log_root(tmp_path, monkeypatch):
+    monkeypatch.setenv("MONITOR_CAPTURE_COMPRESSION", "none")
+    root = str(tmp_path / "logs")
+    os.makedirs(os.path.join(root, "db1"))
+    yield root
+    index = src.log_index._indexes.pop(os.path.abspath(root), None)
+    if index is not None:
+        index.close()
+
+
+def make(root, prefix, timestamp, captures=2, recent=False):
+    """Arquivo de captura com o momento no nome e, salvo recent, modificado há muito"""
+    path = os.path.join(root, "db1", f"{prefix}{timestamp.strftime('%Y%m%d_%H%M%S')}.pgcap")
+    writer = CaptureWriter(path, header={"host": "db1", "port": 5432})
+    for index in range(captures):
+        moment = timestamp + timedelta(seconds=index)
+        writer.write_capture([{"pid": 1, "query_start": timestamp, "duration": moment - timestamp,
+                               "query": "SELECT 1", "state": "active"}], moment, (1.0, 1.0, 1.0))
+    writer.close()
+    if not recent:
+        old = time.time() - 3600
+        os.utime(path, (old, old))
+    return path
+
+
+def janitor(root, **limits):
+    values = {"max_bytes": 0, "max_days": 30, "max_files": 0, "compact_after": 1,
+              "interval": 3600}
+    values.update(limits)
+    return LogJanitor(root, RetentionPolicy(**values))
+
+
+def names(root):
+    return sorted(os.listdir(os.path.join(root, "db1")))
+
+
+def test_previous_days_go_to_daily_archives(log_root):
+    two_days = TODAY - timedelta(days=2)
+    make(log_root, "pg_queries_", two_days + timedelta(hours=10))
+    make(log_root, "pg_history_", two_days + timedelta(hours=11), captures=3)
+    make(log_root, "pg_queries_", TODAY - timedelta(days=3))
+    today = make(log_root, "pg_queries_", TODAY)
+
+    result = janitor(log_root).run()
+    assert (result["compacted"], result["archives"], result["removed"]) == (3, 2, 0)
+    day = two_days.strftime("%Y%m%d")
+    assert names(log_root) == sorted([
+        f"pg_archive_{day}.pgcap.gz",
+        f"pg_archive_{(TODAY - timedelta(days=3)).strftime('%Y%m%d')}.pgcap.gz",
+        os.path.basename(today)])
+    archive = os.path.join(log_root, "db1", f"pg_archive_{day}.pgcap.gz")
+    assert len(list(CaptureReader(archive).snapshots())) == 5
+
+    rows = {row["path"]: row for row in get_index(log_root).recent()}
+    assert rows[os.path.join("db1", f"pg_archive_{day}.pgcap.gz")]["captures"] == 5
+
+
+def test_later_rounds_append_to_the_archive(log_root):
+    day = TODAY - timedelta(days=2)
+    make(log_root, "pg_queries_", day + timedelta(hours=1))
+    janitor(log_root).run()
+    archive = os.path.join(log_root, "db1", f"pg_archive_{day.strftime('%Y%m%d')}.pgcap.gz")
+    size = os.path.getsize(archive)
+    with open(archive, "rb") as f:
+        start = f.read()
+
+    make(log_root, "pg_queries_", day + timedelta(hours=2), captures=4)
+    assert janitor(log_root).run()["compacted"] == 1
+    with open(archive, "rb") as f:
+        # O conteúdo anterior fica intacto
+        assert f.read(size) == start
+    assert len(list(CaptureReader(archive).snapshots())) == 6
+    assert not any(name.endswith(TEMPORARY_SUFFIX) for name in names(log_root))
+
+
+def test_expired_files_are_removed_not_compacted(log_root):
+    make(log_root, "pg_queries_", TODAY - timedelta(days=40))
+    kept = make(log_root, "pg_queries_", TODAY)
+    result = janitor(log_root).run()
+    assert (result["compacted"], result["removed"], result["files"]) == (0, 1, 1)
+    assert names(log_root) == [os.path.basename(kept)]
+
+
+def test_busy_files_are_kept(log_root):
+    in_use = make(log_root, "pg_incident_", TODAY - timedelta(days=40))
+    recent = make(log_root, "pg_queries_", TODAY - timedelta(days=40), recent=True)
+    result = janitor(log_root).run(in_use=[in_use])
+    assert (result["compacted"], result["compressed"], result["removed"]) == (0, 0, 0)
+    assert names(log_root) == sorted(os.path.basename(path) for path in (in_use, recent))
+
+
+def test_size_and_count_limits_remove_oldest_first(log_root):
+    paths = [make(log_root, "pg_queries_", TODAY + timedelta(minutes=minute))
+             for minute in range(4)]
+    result = janitor(log_root, max_files=2).run(compact=False)
+    assert result["removed"] == 2 and result["files"] == 2
+    assert names(log_root) == [os.path.basename(path) for path in paths[2:]]
+
+    size = os.path.getsize(paths[3])
+    result = janitor(log_root, max_bytes=size).run(compact=False)
+    assert result["removed"] == 1 and result["total_bytes"] == size
+    assert names(log_root) == [os.path.basename(paths[3])]
+
+
+def test_uncompressed_incidents_are_compressed_in_place(log_root):
+    timestamp = TODAY - timedelta(days=2)
+    path = make(log_root, "pg_incident_", timestamp, captures=3)
+    get_index(log_root).add(path, timestamp, target="db1")
+    today = make(log_root, "pg_incident_", TODAY)
+
+    result = janitor(log_root).run()
+    assert (result["compressed"], result["compacted"]) == (1, 0)
+    compressed = path + ".gz"
+    assert names(log_root) == sorted([os.path.basename(compressed), os.path.basename(today)])
+    assert len(list(CaptureReader(compressed).snapshots())) == 3
+    assert [row["path"] for row in get_index(log_root).recent()] == \
+        [os.path.join("db1", os.path.basename(compressed))]
+
+
+def test_interrupted_append_is_rolled_back(log_root):
+    day = TODAY - timedelta(days=2)
+    make(log_root, "pg_queries_", day + timedelta(hours=1))
+    janitor(log_root).run()
+    archive = os.path.join(log_root, "db1", f"pg_archive_{day.strftime('%Y%m%d')}.pgcap.gz")
+    size = os.path.getsize(archive)
+
+    sources = [make(log_root, "pg_queries_", day + timedelta(hours=hour)) for hour in (2, 3)]
+    stopping = janitor(log_root)
+    append = stopping._append
+
+    def append_then_stop(out, path, compress):
+        stopping.stop()
+        return append(out, path, compress)
+
+    stopping._append = append_then_stop
+    assert stopping.run()["compacted"] == 0
+    assert os.path.getsize(archive) == size
+    assert all(os.path.exists(path) for path in sources)
+    assert not os.path.exists(archive + TEMPORARY_SUFFIX)
+
+
+def test_leftover_temporaries_are_undone(log_root):
+    day = TODAY - timedelta(days=2)
+    make(log_root, "pg_queries_", day)
+    janitor(log_root).run()
+    archive = os.path.join(log_root, "db1", f"pg_archive_{day.strftime('%Y%m%d')}.pgcap.gz")
+    size = os.path.getsize(archive)
+
+    # Acréscimo interrompido por uma queda: bloco pela metade e marcador
+    with open(archive, "ab") as f:
+        f.write(b"\x1f\x8b\x08")
+    with open(archive + TEMPORARY_SUFFIX, "w") as f:
+        f.write(str(size))
+    # Arquivo diário criado na rodada interrompida e cópia de incidente pela metade
+    new_archive = os.path.join(log_root, "db1", "pg_archive_20200101.pgcap.gz")
+    with open(new_archive, "wb") as f:
+        f.write(b"\x1f\x8b")
+    with open(new_archive + TEMPORARY_SUFFIX, "w") as f:
+        f.write("0")
+    incident = os.path.join(log_root, "db1", "pg_incident_20200101_000000.pgcap.gz")
+    with open(incident + TEMPORARY_SUFFIX, "wb") as f:
+        f.write(b"\x1f\x8b")
+
+    janitor(log_root).compact()
+    assert names(log_root) == [os.path.basename(archive)]
+    assert os.path.getsize(archive) == size
@@ -0,0 +1,76 @@
+from datetime import datetime, timedelta, timezone
+
+from src.capture_format import CaptureReader, CaptureWriter
+from src.postgresql import PostgresMonitor
+from src.sampler import SessionHistory
+
+QUERY = "SELECT * FROM pedidos WHERE cliente = 42"
+
+
+def row(pid, query_start, query=QUERY, backend_start=1700000000.0):
+    return (pid, "app", "loja", "active", backend_start, query_start, None, None, query)
+
+
+def test_window_and_load_per_sample():
+    history = SessionHistory(window=3, interval=1, max_bytes=1024 ** 2)
+    for second in range(5):
+        history.add(100.0 + second, [row(1, 90.0)], (float(second), 1.0, 1.0))
+    samples = history.snapshot()
+    assert [timestamp for timestamp, _, _ in samples] == [102.0, 103.0, 104.0]
+    assert [load[0] for _, _, load in samples] == [2.0, 3.0, 4.0]
+    assert [timestamp for timestamp, _, _ in history.snapshot(since=103.5)] == [104.0]
+
+
+def test_repeated_strings_are_stored_once_and_released():
+    history = SessionHistory(window=2, interval=1, max_bytes=1024 ** 2)
+    long_query = "SELECT " + "x" * 10000
+    history.add(1.0, [row(1, 1.0, query=long_query)])
+    single = history.memory_bytes
+    history.add(2.0, [row(1, 1.0, query="".join(["SELECT ", "x" * 10000]))])
+    # A segunda cópia do SQL não ocupa memória de novo
+    assert history.memory_bytes - single < 1000
+    first, second = (rows[0][8] for _, rows, _ in history.snapshot())
+    assert first is second
+
+    history.add(3.0, [row(2, 3.0, query="SELECT 1")])
+    history.add(4.0, [row(2, 3.0, query="SELECT 1")])
+    assert history.stats()["strings"] == 4
+    assert history.memory_bytes < single
+
+
+def test_byte_limit_keeps_at_least_one_sample():
+    history = SessionHistory(window=100, interval=1, max_bytes=1)
+    history.add(1.0, [row(1, 1.0)])
+    history.add(2.0, [row(2, 2.0)])
+    assert len(history) == 1
+    assert history.stats()["rows"] == 1
+
+
+def test_history_continues_into_the_live_capture(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    target = PostgresMonitor({"host": "db1", "port": "5432", "database": "postgres",
+                              "user": "postgres", "password": ""}, name="db1")
+    query_start = 1700000100.25
+    samples = [(1700000101.0, (row(1, query_start),), (3.0, 2.0, 1.0)),
+               (1700000102.0, (row(1, query_start),), (5.0, 2.5, 1.0))]
+    path = str(tmp_path / "pg_incident_20231114_221500.pgcap")
+    writer = CaptureWriter(path, delta=True)
+    target.store_history(writer, samples)
+
+    # A captura do incidente traz os horários no fuso da sessão do servidor
+    session_zone = timezone(timedelta(hours=-3))
+    start = datetime.fromtimestamp(query_start, session_zone)
+    writer.write_capture([{
+        "pid": 1, "usename": "app", "datname": "loja", "state": "active",
+        "backend_start": datetime.fromtimestamp(1700000000.0, session_zone),
+        "query_start": start, "duration": timedelta(seconds=3), "query": QUERY,
+        "wait_event_type": None, "wait_event": None, "blocked_by": None,
+    }], datetime.fromtimestamp(1700000103.0), (7.0, 3.0, 1.0))
+    writer.close()
+
+    records = list(CaptureReader(path).records())
+    # A mesma execução: um registro completo e depois só marcadores
+    assert [record["t"] for record in records if record["t"] in ("full", "run")] == \
+        ["full", "run", "run"]
+    loads = [snapshot[1] for snapshot in CaptureReader(path).snapshots()]
+    assert [load[0] for load in loads] == [3.0, 5.0, 7.0]
@@ -0,0 +1,46 @@
+from src.statements import StatementTracker, diff_snapshots
+
+A = (10, 1, 100)
+B = (10, 1, 200)
+C = (10, 1, 300)
+
+
+def test_diff_keeps_only_statements_with_new_calls():
+    before = {A: (5, 10.0, 50, 1), B: (3, 6.0, 3, 0)}
+    after = {A: (8, 25.0, 80, 4), B: (3, 6.0, 3, 0)}
+
+    assert diff_snapshots(before, after) == {A: (3, 15.0, 30, 3)}
+
+
+def test_new_statements_count_in_full():
+    after = {C: (2, 4.0, 2, 0)}
+
+    assert diff_snapshots({}, after) == {C: (2, 4.0, 2, 0)}
+    # Entrada criada sem chamadas concluídas não entra
+    assert diff_snapshots({}, {C: (0, 0.0, 0, 0)}) == {}
+
+
+def test_counter_reset_counts_in_full():
+    before = {A: (1000, 500.0, 1000, 10)}
+    # pg_stat_statements_reset (ou entrada descartada e recriada)
+    after = {A: (4, 2.0, 4, 0)}
+
+    assert diff_snapshots(before, after) == {A: (4, 2.0, 4, 0)}
+
+
+def test_statements_missing_from_the_latest_snapshot_are_ignored():
+    assert diff_snapshots({A: (5, 1.0, 5, 0)}, {}) == {}
+
+
+def test_tracker_ranks_by_counter_since_baseline():
+    tracker = StatementTracker({A: (5, 10.0, 50, 1), B: (1, 1.0, 1, 0)})
+    tracker.update({A: (6, 11.0, 51, 1), B: (2, 2.0, 2, 0)})
+    tracker.update({A: (9, 12.0, 52, 1), B: (3, 500.0, 3, 900), C: (1, 50.0, 1, 0)})
+
+    top = tracker.top(2)
+
+    assert tracker.snapshots == 3
+    assert [statement["queryid"] for statement in top] == [200, 300]
+    assert top[0] == {"userid": 10, "dbid": 1, "queryid": 200, "calls": 2,
+                      "total_exec_time": 499.0, "rows": 2, "shared_blks_read": 900}
+    assert [statement["queryid"] for statement in tracker.top(key="calls")] == [100, 200, 300]
@@ -0,0 +1,167 @@
+import asyncio
+
+import pytest
+
+import src.monitor
+from src.engine import CaptureEngine
+from src.monitor import LoadMonitor
+from src.sampler import HISTORY_COLUMNS
+from src.triggers import TriggerEngine, TriggerRule, parse_rules, read_pressure
+
+
+def test_rule_waits_for_enter_and_clear_times():
+    rule = TriggerRule("load1", 10, exit=5, enter_for=3, exit_for=2)
+    assert not rule.update(12, 0)
+    assert not rule.update(12, 2)
+    assert rule.update(12, 3) and rule.firing
+    # Entre os limiares a regra continua disparada
+    assert not rule.update(7, 4) and rule.firing
+    assert not rule.update(4, 5)
+    assert not rule.update(4, 6.5)
+    assert rule.update(4, 7) and not rule.firing
+
+
+def test_rule_restarts_timer_when_condition_breaks():
+    rule = TriggerRule("load1", 10, enter_for=3)
+    rule.update(12, 0)
+    rule.update(9, 2)
+    assert not rule.update(12, 3)
+    assert not rule.update(12, 5.5)
+    assert rule.update(12, 6)
+
+
+def test_missing_value_keeps_state_and_discards_timer():
+    rule = TriggerRule("psi_io_some", 20, exit_for=5)
+    assert rule.update(25, 0) and rule.firing
+    rule.update(1, 1)
+    assert not rule.update(None, 10) and rule.firing
+    # O tempo abaixo do limiar recomeça depois do ciclo sem valor
+    assert not rule.update(1, 11)
+    assert rule.update(1, 16) and not rule.firing
+
+
+def test_exit_defaults_to_enter():
+    rule = TriggerRule("cpu", 90)
+    assert rule.update(90, 0)
+    assert not rule.update(90, 1)
+    assert rule.update(89.9, 2)
+
+
+def test_parse_rules():
+    rules = parse_rules(" PSI_IO_SOME>=20,exit=10,for=5,clear=30 ; pg_waiting>50 ;")
+    assert [rule.as_dict() for rule in rules] == [
+        {"signal": "psi_io_some", "enter": 20.0, "exit": 10.0, "for": 5.0, "clear": 30.0},
+        {"signal": "pg_waiting", "enter": 50.0, "exit": 50.0, "for": 0.0, "clear": 0.0},
+    ]
+    assert parse_rules("") == []
+    assert parse_rules(None) == []
+
+
+@pytest.mark.parametrize("spec, message", [
+    ("load1<5", "inválida"),
+    ("nada>=5", "desconhecido"),
+    ("load1>=5,wait=3", "Opção"),
+    ("load1>=5,exit=6", "saída maior"),
+])
+def test_parse_rules_errors(spec, message):
+    with pytest.raises(ValueError, match=message):
+        parse_rules(spec)
+
+
+def test_engine_is_active_while_any_rule_fires():
+    engine = TriggerEngine(parse_rules("load1>=10,exit=5; pg_active>=100"))
+    assert engine.evaluate({"load1": 12}, 0)
+    assert engine.evaluate({"load1": 6, "pg_active": 150}, 1)
+    assert engine.firing() == ["load1>=10 (6.0)", "pg_active>=100 (150.0)"]
+    assert engine.evaluate({"load1": 4, "pg_active": 150}, 2)
+    assert not engine.evaluate({"load1": 4, "pg_active": 10}, 3)
+    assert engine.firing() == []
+
+
+def test_read_pressure(tmp_path):
+    (tmp_path / "io").write_text("some avg10=12.50 avg60=3.00 avg300=1.00 total=100\n"
+                                 "full avg10=4.25 avg60=1.00 avg300=0.50 total=50\n")
+    (tmp_path / "cpu").write_text("lixo\n")
+    assert read_pressure(str(tmp_path)) == {"psi_io_some": 12.5, "psi_io_full": 4.25}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeTarget:
+    label = "db1"
+
+    def __init__(self, log_root, waiting):
+        self.log_root = log_root
+        self.costs = {}
+        self.waiting = waiting
+
+    def sample_activity(self):
+        values = dict.fromkeys(HISTORY_COLUMNS)
+        values.update(pid=1, state="active", wait_event_type="Lock", wait_event="relation")
+        return [tuple(values[column] for column in HISTORY_COLUMNS)] * self.waiting
+
+
+def engine_for(monkeypatch, tmp_path, rules, waiting):
+    for name, value in (("MONITOR_TRIGGERS", rules), ("MONITOR_THRESHOLD", "1000"),
+                        ("MONITOR_CHECK_INTERVAL", "10"), ("MONITOR_SAMPLE_INTERVAL", "1"),
+                        ("MONITOR_RETENTION_INTERVAL", "0"), ("MONITOR_WRITE_QUEUE_BYTES", "0"),
+                        ("MONITOR_METRICS_PORT", "0")):
+        monkeypatch.setenv(name, value)
+    clock = FakeClock()
+    monkeypatch.setattr(src.monitor, "time", clock)
+    target = FakeTarget(str(tmp_path), waiting)
+    engine = CaptureEngine(LoadMonitor(), [target], lambda event, **data: None)
+    return engine, target, clock
+
+
+def test_sampler_ticks_fire_rules_without_waiting_for_a_check(monkeypatch, tmp_path):
+    engine, target, clock = engine_for(monkeypatch, tmp_path,
+                                       "pg_waiting>=50,exit=10,for=2,clear=1", 60)
+
+    async def ticks():
+        changes = []
+        for second in range(6):
+            clock.now = float(second)
+            if second == 4:
+                target.waiting = 0
+            changes.append(await engine.sample_tick())
+        return changes
+
+    try:
+        # Dispara na amostra em que completa 2s acima do limiar e encerra 1s
+        # depois de a espera sumir, sem nenhuma verificação no meio
+        assert asyncio.run(ticks()) == [False, False, True, False, False, True]
+        assert not engine.load_monitor.is_load_high
+    finally:
+        engine.executor.shutdown()
+
+
+def test_state_change_wakes_the_check_loop(monkeypatch, tmp_path):
+    engine, _, _ = engine_for(monkeypatch, tmp_path, "pg_waiting>=50", 60)
+    ticks = []
+
+    async def tick():
+        ticks.append(engine.load_monitor.is_load_high)
+
+    engine.tick = tick
+
+    async def scenario():
+        engine._wake = asyncio.Event()
+        checks = asyncio.ensure_future(engine._run_checks(lambda: True))
+        await asyncio.sleep(0.05)
+        assert await engine.sample_tick()
+        await asyncio.sleep(0.05)
+        checks.cancel()
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        engine.executor.shutdown()
+    # A segunda verificação vem logo após o disparo, não 10s depois
+    assert ticks == [False, True]
@@ -0,0 +1,86 @@
+import asyncio
+
+from textual.app import App
+from textual.widgets import DataTable
+
+from src.ui import TopSessionsWidget
+
+NOW = 1000.0
+
+
+def row(pid, seconds, wait=None, query="SELECT 1"):
+    # Ordem de sampler.HISTORY_COLUMNS
+    return (pid, "app", "db", "active", NOW - 3600, NOW - seconds,
+            "Lock" if wait else None, wait, query)
+
+
+def run_table(monkeypatch, targets, scenario):
+    monkeypatch.setenv("MONITOR_TOP_SESSIONS", "2")
+
+    class Sessions(App):
+        def compose(self):
+            yield TopSessionsWidget(targets)
+
+    async def run():
+        app = Sessions()
+        async with app.run_test() as pilot:
+            widget = app.query_one(TopSessionsWidget)
+            await scenario(widget, widget.query_one(DataTable), pilot)
+
+    asyncio.run(run())
+
+
+def shown(table):
+    return [table.get_row_at(index) for index in range(table.row_count)]
+
+
+def test_table_keeps_the_longest_sessions(monkeypatch):
+    async def scenario(widget, table, pilot):
+        widget.update_sessions("db1", NOW, [row(1, 5), row(2, 30), row(3, 12)])
+        widget._apply()
+        await pilot.pause()
+
+        assert [cells[0] for cells in shown(table)] == [2, 3]
+        assert "2 de 3" in str(widget.query_one("#sessions-title").render())
+
+        # Amostra seguinte: a sessão 1 passa a ser a mais longa e a 3 terminou
+        widget.update_sessions("db1", NOW + 1, [row(1, 60), row(2, 31)])
+        widget._apply()
+        await pilot.pause()
+
+        assert [(cells[0], cells[4]) for cells in shown(table)] == [(1, 61.0), (2, 32.0)]
+        assert set(widget._rows) == {"db1:1", "db1:2"}
+
+    run_table(monkeypatch, ["db1"], scenario)
+
+
+def test_only_the_latest_sample_is_applied(monkeypatch):
+    async def scenario(widget, table, pilot):
+        widget.update_sessions("db1", NOW, [row(1, 5)])
+        widget.update_sessions("db1", NOW + 1, [row(2, 5)])
+        widget._apply()
+        await pilot.pause()
+
+        assert [cells[0] for cells in shown(table)] == [2]
+        # Sem amostra nova, o quadro não muda nada
+        widget._apply()
+        assert [cells[0] for cells in shown(table)] == [2]
+
+    run_table(monkeypatch, ["db1"], scenario)
+
+
+def test_sort_by_wait_and_multiple_servers(monkeypatch):
+    async def scenario(widget, table, pilot):
+        widget.update_sessions("db1", NOW, [row(1, 50), row(2, 5, wait="relation")])
+        widget.update_sessions("db2", NOW, [row(1, 10, wait="tuple")])
+        await pilot.press("w")
+        await pilot.pause()
+
+        assert [(cells[0], cells[1]) for cells in shown(table)] == [("db1", 2), ("db2", 1)]
+        assert [cells[6] for cells in shown(table)] == ["Lock:relation", "Lock:tuple"]
+
+        await pilot.press("d")
+        await pilot.pause()
+        assert [(cells[0], cells[1]) for cells in shown(table)] == [("db1", 1), ("db2", 1)]
+
+    run_table(monkeypatch, ["db1", "db2"], scenario)
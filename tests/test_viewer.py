@@ -0,0 +1,91 @@
+import asyncio
+import re
+import time
+
+from textual.app import App
+
+import src.viewer
+from src.viewer import LogViewerScreen, MappedText
+
+
+def big_log(path, lines=200000):
+    with open(path, "w") as f:
+        for number in range(lines):
+            f.write(f"[Query {number}] SELECT * FROM pedidos WHERE id = {number}\n")
+    return str(path)
+
+
+def test_index_and_lines(tmp_path):
+    path = tmp_path / "a.log"
+    path.write_text("--- captura\n[Query 1] SELECT 1\n\tfim")
+    text = MappedText(str(path))
+    text.remap()
+    while text.index_more(final=True):
+        pass
+    assert text.complete
+    assert text.line_count == 3
+    assert list(text.record_lines) == [0, 1]
+    assert text.line(2) == "    fim"
+    text.close()
+
+
+def test_close_waits_for_readers(tmp_path):
+    text = MappedText(big_log(tmp_path / "a.log", 10))
+    text.remap()
+    with text.use():
+        text.close()
+        # Ainda em uso: o mapeamento continua válido
+        assert text.line(0).startswith("[Query 0]")
+    assert text.mm.closed
+    try:
+        with text.use():
+            pass
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("use() depois de close() deveria falhar")
+
+
+def test_dismiss_while_indexing(tmp_path, monkeypatch):
+    # Trechos pequenos e disco lento: a indexação ainda está em andamento ao fechar
+    monkeypatch.setattr(src.viewer, "INDEX_CHUNK", 16 * 1024)
+    newline = src.viewer._NEWLINE
+
+    class SlowNewline:
+        def finditer(self, *args):
+            # O trecho mapeado fica exportado enquanto o indexador o percorre
+            matches = newline.finditer(*args)
+            time.sleep(0.005)
+            yield from matches
+
+    monkeypatch.setattr(src.viewer, "_NEWLINE", SlowNewline())
+    path = big_log(tmp_path / "grande.log")
+    errors = []
+
+    class Viewer(App):
+        def on_mount(self):
+            self.push_screen(LogViewerScreen(path))
+
+        def _handle_exception(self, error):
+            errors.append(error)
+            super()._handle_exception(error)
+
+    async def scenario():
+        app = Viewer()
+        async with app.run_test() as pilot:
+            screen = app.screen
+            await pilot.pause(0.05)
+            # Busca por um registro ainda não indexado: espera pelo indexador
+            screen._search = re.compile(rb"\[Query 199999\]")
+            screen._find(0)
+            await pilot.pause(0.05)
+            assert not screen.text.complete
+            text = screen.text
+            screen.dismiss()
+            await pilot.pause(0.3)
+            assert app.is_running
+            # O último leitor fechou o arquivo
+            assert text._file.closed
+
+    asyncio.run(scenario())
+    assert errors == []
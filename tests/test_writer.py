@@ -0,0 +1,123 @@
+import threading
+
+import pytest
+
+from src.capture_format import CaptureReader, CaptureWriter
+from src.writer import BackgroundWriter
+
+
+def stall(writer):
+    """Prende a thread de gravação em uma chamada até o evento retornado"""
+    started = threading.Event()
+    release = threading.Event()
+
+    def wait():
+        started.set()
+        release.wait(5)
+
+    writer.call(wait)
+    assert started.wait(5)
+    return release
+
+
+def test_blocks_are_written_in_order_before_calls(tmp_path):
+    writer = BackgroundWriter(1024, fsync="never")
+    path = tmp_path / "a.log"
+    seen = []
+
+    writer.write(str(path), b"um ")
+    writer.write(str(path), b"dois")
+    writer.call(lambda: seen.append(path.read_bytes()))
+    writer.close(str(path))
+
+    assert writer.flush(5)
+    assert path.read_bytes() == b"um dois"
+    assert seen == [b"um dois"]
+    assert writer.stats()["written_bytes"] == 7
+    assert writer.stats()["queued_bytes"] == 0
+
+
+@pytest.mark.parametrize("policy, expected", [("never", 0), ("close", 1), ("capture", 3)])
+def test_fsync_policies(tmp_path, policy, expected):
+    writer = BackgroundWriter(1024, fsync=policy)
+    path = str(tmp_path / "a.log")
+
+    for _ in range(2):
+        writer.write(path, b"captura\n", sync=True)
+        # Um lote por captura, para contar os fsyncs de cada uma
+        assert writer.flush(5)
+    writer.write(path, b"parcial\n")
+    writer.close(path)
+
+    assert writer.flush(5)
+    assert writer.fsyncs == expected
+
+
+def test_unknown_policies_fall_back_to_defaults():
+    writer = BackgroundWriter(1024, fsync="sempre", overflow="espera")
+
+    assert (writer.fsync, writer.overflow) == ("close", "drop")
+
+
+def test_drop_policy_discards_whole_captures(tmp_path):
+    writer = BackgroundWriter(10, fsync="never", overflow="drop")
+    path = tmp_path / "a.pgcap"
+    capture = CaptureWriter(str(path), header={"host": "db1"}, compression="none", sink=writer)
+    sessions = [{"pid": 1, "query": "SELECT 1", "state": "active"}]
+
+    release = stall(writer)
+    assert capture.write_capture(sessions, load_average=(1.0, 1.0, 1.0)) == str(path)
+    assert not writer.accepting()
+    assert capture.write_capture(sessions, load_average=(2.0, 2.0, 2.0)) is None
+    release.set()
+
+    assert writer.flush(5)
+    assert writer.accepting()
+    assert capture.write_capture(sessions, load_average=(3.0, 3.0, 3.0)) == str(path)
+    capture.close()
+    assert writer.flush(5)
+
+    assert capture.dropped == 1
+    assert writer.stats()["dropped_captures"] == 1
+    loads = [snapshot[1][0] for snapshot in CaptureReader(str(path)).snapshots()]
+    assert loads == [1.0, 3.0]
+
+
+def test_block_policy_waits_for_the_queue(tmp_path):
+    writer = BackgroundWriter(10, fsync="never", overflow="block")
+    path = tmp_path / "a.log"
+
+    release = stall(writer)
+    writer.write(str(path), b"0123456789")
+    done = threading.Event()
+    thread = threading.Thread(target=lambda: (writer.write(str(path), b"abc"), done.set()))
+    thread.start()
+
+    assert not done.wait(0.2)
+    release.set()
+    assert done.wait(5)
+    thread.join()
+
+    assert writer.flush(5)
+    assert path.read_bytes() == b"0123456789abc"
+    assert writer.blocked_ms > 0
+    assert writer.peak_queued_bytes <= 13
+
+
+def test_write_errors_are_counted(tmp_path):
+    writer = BackgroundWriter(1024, fsync="never")
+
+    writer.write(str(tmp_path), b"diretorio")
+    writer.call(lambda: 1 / 0)
+
+    assert writer.flush(5)
+    assert writer.errors == 2
+
+
+def test_flush_times_out_while_writing(tmp_path):
+    writer = BackgroundWriter(1024, fsync="never")
+
+    release = stall(writer)
+    assert not writer.flush(0.05)
+    release.set()
+    assert writer.flush(5)